@@ -2,6 +2,9 @@
 ASGI config for agro_ecommerce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the notification stream (/api/notifications/stream/) through it, e.g.
+with uvicorn or gunicorn's uvicorn worker; under WSGI each open stream would
+hold a worker thread.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -0,0 +1,32 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from jobs.queue import enqueue
+
+logger = logging.getLogger(__name__)
+
+
+def run_in_background(func, *args, priority=0):
+    """
+    Run ``func(*args)`` off the request thread, after the current
+    transaction commits, so the task sees the rows the request wrote.
+
+    The call is queued as a ``jobs.Job`` in the same transaction and run by
+    ``manage.py run_worker``, with retries. ``func`` must be a module-level
+    function and ``args`` plain JSON values (ids, names). With
+    ``BACKGROUND_TASKS_EAGER`` the task instead runs inline once the
+    transaction commits, which tests and management commands use.
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        transaction.on_commit(lambda: _run(func, args))
+    else:
+        enqueue(func, *args, priority=priority)
+
+
+def _run(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Background task %s.%s%s failed.", func.__module__, func.__qualname__, args)
@@ -0,0 +1,135 @@
+import hashlib
+import io
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Name -> maximum width in pixels. Images are never upscaled.
+DEFAULT_IMAGE_VARIANT_SIZES = {'thumb': 160, 'medium': 480, 'large': 1080}
+
+# Extension -> (Pillow format, save options). WebP first: browsers pick the
+# first <source> they support.
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# EXIF orientations that rotate the image by 90 degrees
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def get_variant_sizes():
+    sizes = getattr(settings, 'IMAGE_VARIANT_SIZES', DEFAULT_IMAGE_VARIANT_SIZES)
+    return sorted(sizes.items(), key=lambda item: item[1])
+
+
+def generate_variants(source_name, storage=None):
+    """
+    Render the resized variants of the image stored at ``source_name`` and
+    return their description::
+
+        {'source': 'product_images/a.jpg',
+         'sizes': {'thumb': {'width': 160, 'height': 120,
+                             'webp': '.../thumb-160.webp', 'jpeg': '.../thumb-160.jpeg'},
+                   ...}}
+
+    Variant names are derived from the content hash of the source and the
+    configured width, so running this again for the same image reuses the
+    files already written instead of rendering them twice.
+
+    Only plain values go in and out, so this can run in a worker process.
+    """
+    storage = storage or default_storage
+    with storage.open(source_name, 'rb') as source:
+        data = source.read()
+
+    directory, filename = posixpath.split(source_name)
+    stem = posixpath.splitext(filename)[0]
+    prefix = posixpath.join(directory, 'variants', f"{stem}-{hashlib.sha1(data).hexdigest()[:12]}")
+
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    if image.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+
+    oriented = None
+    sizes = {}
+    for size_name, max_width in get_variant_sizes():
+        target = _fit_width(width, height, max_width)
+        entry = {'width': target[0], 'height': target[1]}
+        for extension, (image_format, options) in VARIANT_FORMATS.items():
+            name = f"{prefix}/{size_name}-{max_width}.{extension}"
+            if not storage.exists(name):
+                if oriented is None:
+                    oriented = ImageOps.exif_transpose(image)
+                name = storage.save(name, ContentFile(
+                    _render(oriented, target, image_format, options)))
+            entry[extension] = name
+        sizes[size_name] = entry
+    return {'source': source_name, 'sizes': sizes}
+
+
+def _fit_width(width, height, max_width):
+    if width <= max_width:
+        return width, height
+    return max_width, max(1, round(height * max_width / width))
+
+
+def _render(image, size, image_format, options):
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info)
+    if image_format == 'JPEG':
+        if has_alpha:
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        else:
+            image = image.convert('RGB')
+    else:
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def variant_srcset(variants, build_url):
+    """
+    Turn stored variants into what the API returns: per-size URLs plus a
+    ``srcset`` string per format, e.g. ``{'webp': 'a-160.webp 160w, ...'}``.
+    ``build_url`` maps a storage name to the URL to expose.
+    """
+    sizes = (variants or {}).get('sizes')
+    if not sizes:
+        return None
+    result = {'sizes': {}, 'srcset': {}}
+    seen_widths = set()
+    for size_name, entry in sorted(sizes.items(), key=lambda item: item[1]['width']):
+        urls = {extension: build_url(entry[extension])
+                for extension in VARIANT_FORMATS if extension in entry}
+        result['sizes'][size_name] = {'width': entry['width'], 'height': entry['height'], **urls}
+        # Small sources give several sizes the same width; list each width once
+        if entry['width'] in seen_widths:
+            continue
+        seen_widths.add(entry['width'])
+        for extension, url in urls.items():
+            result['srcset'].setdefault(extension, []).append(f"{url} {entry['width']}w")
+    result['srcset'] = {extension: ', '.join(parts) for extension, parts in result['srcset'].items()}
+    return result
+
+
+def variant_file_names(variants):
+    """ The storage names of the files ``variants`` describes """
+    return [entry[extension] for entry in (variants or {}).get('sizes', {}).values()
+            for extension in VARIANT_FORMATS if extension in entry]
+
+
+def delete_stored_files(names):
+    """ Background task: delete files from default storage; missing ones are skipped """
+    for name in names:
+        default_storage.delete(name)
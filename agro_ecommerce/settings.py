@@ -41,6 +41,8 @@ INSTALLED_APPS = [
     "reviews",
     "logistics",
     "notifications",
+    "idempotency",
+    "jobs",
 ]
 
 MIDDLEWARE = [
@@ -56,9 +58,11 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",  # Optional backup
     ],
+    "DEFAULT_PAGINATION_CLASS": "agro_ecommerce.pagination.KeysetCursorPagination",
+    "PAGE_SIZE": 20,
 }
 
 SIMPLE_JWT = {
@@ -71,6 +75,14 @@ SIMPLE_JWT = {
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
 }
 
+# Per-process LRU of authenticated users (users.cache). Set SHARED_CACHE to a
+# CACHES alias (e.g. Redis or Memcached) to share entries and invalidations
+# between workers.
+USER_AUTH_CACHE = {
+    "MAX_SIZE": 1024,
+    "TIMEOUT": 60,  # seconds
+    "SHARED_CACHE": None,
+}
 
 CORS_ORIGIN_ALLOW_ALL = True
 
@@ -133,6 +145,12 @@ CORS_ALLOW_HEADERS = [
     "user-agent",
     "x-csrftoken",
     "x-requested-with",
+    "idempotency-key",
+]
+
+# Response headers browser clients may read
+CORS_EXPOSE_HEADERS = [
+    "idempotent-replayed",
 ]
 
 # Optional: If you need credentials (cookies, auth headers)
@@ -176,6 +194,54 @@ STATICFILES_DIRS = [
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Cache
+# The local-memory cache is per process. With several workers use a shared
+# backend (Redis, Memcached) so catalogue invalidations reach every worker.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "agro-ecommerce",
+    }
+}
+
+# Seconds a cached product/category response may be served; writes retire
+# entries immediately through the catalogue version
+CATALOGUE_CACHE_TIMEOUT = 300
+
+# Background tasks (agro_ecommerce.background) are queued as jobs.Job rows
+# and run by `manage.py run_worker`; when eager they run inline after commit
+BACKGROUND_TASKS_EAGER = False
+# Job queue (jobs.queue): jobs a worker runs at once, attempts per job,
+# seconds a claimed job stays reserved, and the first retry delay (doubling)
+JOB_WORKER_CONCURRENCY = 4
+JOB_MAX_ATTEMPTS = 5
+JOB_LEASE = 300
+JOB_RETRY_BACKOFF = 10
+
+# Resized copies made of uploaded product images and profile pictures:
+# name -> maximum width in pixels
+IMAGE_VARIANT_SIZES = {"thumb": 160, "medium": 480, "large": 1080}
+
+# Notifications inserted per bulk INSERT when fanning out an event
+NOTIFICATION_BATCH_SIZE = 1000
+# Unread events of these kinds for one user are merged into a single digest
+# notification for this many seconds after the first of them (0 disables)
+NOTIFICATION_DIGEST_KINDS = ["product_sold"]
+NOTIFICATION_DIGEST_WINDOW = 600
+# Read notifications older than this are removed by prune_notifications
+NOTIFICATION_RETENTION_DAYS = 90
+# Relays new notifications to open /api/notifications/stream/ connections.
+# They are created by run_worker, so the broker must reach other processes:
+# DatabaseBroker polls a table every NOTIFICATION_BROKER_POLL_INTERVAL
+# seconds; "notifications.broker.RedisBroker" with NOTIFICATION_BROKER_URL
+# pushes instead. None keeps events within the process, which only works
+# with BACKGROUND_TASKS_EAGER (checked at startup).
+NOTIFICATION_BROKER = "notifications.broker.DatabaseBroker"
+NOTIFICATION_BROKER_URL = None
+NOTIFICATION_BROKER_POLL_INTERVAL = 1
+# Seconds between keepalive comments on an idle stream
+NOTIFICATION_STREAM_HEARTBEAT = 15
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -194,5 +260,25 @@ PAYPAL_CLIENT_SECRET = os.environ.get(
     "EDRFOia1IUgkPO6G0uptEjszRE8mXZmtMbQr4srKJd893iszd5USTOZimvqSq60NnQuzQFfEVUYzujxB",
 )  # Replace with your actual Sandbox Secret
 
+# Overrides the API host derived from PAYPAL_MODE (e.g. for a local fake server)
+PAYPAL_API_BASE = None
+PAYPAL_TIMEOUT = (3.05, 20)  # (connect, read) seconds
+PAYPAL_MAX_RETRIES = 2
+PAYPAL_POOL_SIZE = 10
 
 # --- End PayPal Configuration ---
+
+# How long a stored Idempotency-Key response can be replayed
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# --- Product Search ---
+# Dotted path to a products.search backend class. When unset the backend is
+# chosen from the database vendor (SQLite FTS5, PostgreSQL full-text, LIKE).
+PRODUCT_SEARCH_BACKEND = None
+# Upper bounds of the price ranges counted by the catalogue facets
+PRODUCT_PRICE_FACET_BOUNDARIES = [5, 10, 25, 50, 100]
+# Co-purchased products kept per product (orders.recommendations)
+RECOMMENDATIONS_TOP_K = 10
+# Seconds an order must be old before the recommendations count it; longer
+# than any checkout transaction, so orders that commit late are not skipped
+RECOMMENDATIONS_ORDER_LAG = 300
@@ -0,0 +1,77 @@
+import io
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin for catching N+1 queries on list endpoints.
+
+    ``assertQueryCountConstant`` calls an endpoint at several table sizes and
+    fails when the number of queries grows with the number of rows.
+    """
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return context
+
+    def assertQueryCountConstant(self, add_rows, request, sizes=(1, 10)):
+        """
+        ``add_rows(n)`` must create ``n`` more rows seen by the endpoint and
+        ``request()`` must perform the call under test (and may assert on it).
+        """
+        created = 0
+        counts = []
+        for size in sizes:
+            add_rows(size - created)
+            created = size
+            context = self.count_queries(request)
+            counts.append((size, len(context.captured_queries), context))
+
+        (first_size, first_count, _), (last_size, last_count, last_context) = counts[0], counts[-1]
+        if first_count != last_count:
+            queries = '\n'.join(
+                f'{i}. {query["sql"]}' for i, query in enumerate(last_context.captured_queries, start=1))
+            self.fail(
+                f'Query count grew with the number of rows: {first_count} queries for '
+                f'{first_size} rows, {last_count} for {last_size} rows.\n'
+                f'Queries at {last_size} rows:\n{queries}'
+            )
+        return last_count
+
+
+def image_bytes(size, image_format='JPEG', orientation=None):
+    buffer = io.BytesIO()
+    image = Image.new('RGB', size, (200, 80, 20))
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(buffer, image_format, exif=exif)
+    return buffer.getvalue()
+
+
+class ImageVariantTestMixin:
+    """
+    TestCase mixin for the image variant pipeline: stores uploads in a
+    temporary MEDIA_ROOT and renders two small sizes.
+    """
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, IMAGE_VARIANT_SIZES={'thumb': 160, 'large': 480})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, name, size=(320, 200), **kwargs):
+        return SimpleUploadedFile(name, image_bytes(size, **kwargs), content_type='image/jpeg')
+
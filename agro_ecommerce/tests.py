@@ -0,0 +1,87 @@
+import json
+from base64 import b64encode
+from datetime import timedelta
+from urllib import parse
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from notifications.models import Notification
+from orders.models import Order
+from products.models import Product
+from users.models import User
+
+
+class KeysetCursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='buyer', email='buyer@example.com', is_buyer=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.now = timezone.now()
+
+    def walk(self, url, **params):
+        """ Follow ``next`` to the last page, then ``previous`` back to the first """
+        pages, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            pages.append([row['id'] for row in body['results']])
+            if not body['next']:
+                break
+            response = self.client.get(body['next'])
+        backwards = [pages[-1]]
+        while body['previous']:
+            body = self.client.get(body['previous']).json()
+            backwards.append([row['id'] for row in body['results']])
+        self.assertEqual(backwards, pages[::-1])
+        return [pk for page in pages for pk in page]
+
+    def backdate(self, model, rows, ages):
+        # Equal ages share a created_at, so the id has to break the tie
+        for row, age in zip(rows, ages):
+            model.objects.filter(pk=row.pk).update(created_at=self.now - timedelta(minutes=age))
+
+    def test_orders_page_by_created_at_then_id(self):
+        orders = [Order.objects.create(buyer=self.user, total_price=1) for _ in range(7)]
+        self.backdate(Order, orders, [5, 1, 5, 3, 1, 5, 3])
+        expected = [order.pk for order in sorted(
+            Order.objects.all(), key=lambda order: (order.created_at, order.pk), reverse=True)]
+        self.assertEqual(self.walk('/api/orders/orders/', page_size=3), expected)
+
+    def test_notifications_page_by_created_at_then_id(self):
+        notifications = Notification.objects.bulk_create(
+            Notification(user=self.user, message=f'Message {n}') for n in range(7))
+        self.backdate(Notification, notifications, [2, 2, 9, 2, 4, 9, 4])
+        expected = [notification.pk for notification in sorted(
+            Notification.objects.all(), key=lambda row: (row.created_at, row.pk), reverse=True)]
+        self.assertEqual(self.walk('/api/notifications/notifications/', page_size=2), expected)
+
+    def test_search_results_page_by_rank(self):
+        farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            by_name = [Product.objects.create(name=f'Tomato {n}', price=2, quantity=1, farmer=farmer)
+                       for n in range(3)]
+            by_description = [Product.objects.create(name=f'Salad {n}', description='With tomato',
+                                                     price=2, quantity=1, farmer=farmer)
+                              for n in range(3)]
+        self.assertEqual(self.walk('/api/products/products/', q='tomato', page_size=2),
+                         [product.pk for product in by_name + by_description])
+
+    def test_page_size_is_clamped_to_the_maximum(self):
+        Notification.objects.bulk_create(
+            Notification(user=self.user, message=f'Message {n}') for n in range(105))
+        response = self.client.get('/api/notifications/notifications/', {'page_size': 500})
+        self.assertEqual(len(response.json()['results']), 100)
+        self.assertIsNotNone(response.json()['next'])
+
+    def test_malformed_cursors_are_not_found(self):
+        def cursor(position):
+            return b64encode(parse.urlencode({'p': json.dumps(position)}).encode('ascii')).decode('ascii')
+
+        for value in ('garbage', cursor([]), cursor(['not a date', '1'])):
+            with self.subTest(cursor=value):
+                response = self.client.get('/api/notifications/notifications/', {'cursor': value})
+                self.assertEqual(response.status_code, 404)
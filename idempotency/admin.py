@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import IdempotencyKey
+
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'method', 'path', 'response_status', 'created_at')
+    list_filter = ('method', 'response_status')
+    search_fields = ('key', 'user__username', 'path')
+
+admin.site.register(IdempotencyKey, IdempotencyKeyAdmin)
@@ -0,0 +1,114 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):  # QueryDict from form or multipart bodies
+        data = dict(data.lists())
+    payload = json.dumps(
+        [request.method, request.path, data], sort_keys=True, default=str)
+    return fingerprint(payload.encode('utf-8'))
+
+
+def idempotent(view_method):
+    """
+    Make a view method safe to retry when the client sends an Idempotency-Key
+    header.
+
+    The first request with a key runs normally and its response is stored.
+    A retry with the same key and the same body gets the stored response
+    back (marked with ``Idempotent-Replayed: true``) and the work is not
+    done again. Reusing a key for a different request returns 422, and a
+    retry that arrives while the first request is still running gets 409.
+    Server errors are not stored, so the client can retry them.
+
+    Keys are scoped to the authenticated user and expire after
+    ``IDEMPOTENCY_KEY_TTL``. Requests without the header are unaffected.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response({"error": f"{HEADER} is too long."}, status=status.HTTP_400_BAD_REQUEST)
+
+        record, replay = _claim_key(request, key)
+        if replay is not None:
+            return replay
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        if response.status_code >= 500 or not hasattr(response, 'data'):
+            record.delete()
+            return response
+
+        body = JSONRenderer().render(response.data)
+        record.response_status = response.status_code
+        record.response_body = json.loads(body) if body else None
+        record.response_fingerprint = fingerprint(body)
+        record.save(update_fields=['response_status', 'response_body', 'response_fingerprint'])
+        return response
+
+    return wrapper
+
+
+def _claim_key(request, key):
+    """ Store `key` as in progress, or return the response a retry should get """
+    request_hash = request_fingerprint(request)
+    expires_before = timezone.now() - getattr(settings, 'IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    key=key, user=request.user, method=request.method,
+                    path=request.path[:255], request_fingerprint=request_hash)
+            return record, None
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            if record is None:
+                continue  # the other request failed and released the key
+            if record.created_at < expires_before:
+                record.delete()
+                continue
+            break
+
+    if record is None:
+        return None, Response(
+            {"error": "A request with this Idempotency-Key is still in progress."},
+            status=status.HTTP_409_CONFLICT)
+    if record.request_fingerprint != request_hash:
+        return None, Response(
+            {"error": "This Idempotency-Key was already used for a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    if record.response_status is None:
+        return None, Response(
+            {"error": "A request with this Idempotency-Key is still in progress."},
+            status=status.HTTP_409_CONFLICT)
+
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return None, response
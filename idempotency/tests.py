@@ -0,0 +1,135 @@
+from django.test import TestCase
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from orders.models import Order
+from products.models import Product
+from users.models import User
+from .decorators import idempotent
+from .models import IdempotencyKey
+
+
+class RecordingView(APIView):
+    """ Records each run; ``behaviour`` decides what a run returns """
+
+    runs = None
+    behaviour = None
+
+    @idempotent
+    def post(self, request):
+        self.runs.append(request.data)
+        return self.behaviour(request, len(self.runs))
+
+
+class IdempotentDecoratorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='buyer', email='buyer@example.com')
+        self.factory = APIRequestFactory()
+        self.runs = []
+        self.behaviour = lambda request, run: Response({'run': run}, status=201)
+
+    def post(self, data, key='key-1', user=None):
+        request = self.factory.post('/api/things/', data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        force_authenticate(request, user=user or self.user)
+        view = RecordingView.as_view(runs=self.runs, behaviour=lambda *args: self.behaviour(*args))
+        return view(request).render()
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.post({'item': 1})
+        second = self.post({'item': 1})
+        self.assertEqual(len(self.runs), 1)
+        self.assertEqual((second.status_code, second.data), (201, {'run': 1}))
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+
+    def test_keys_are_scoped_to_the_user(self):
+        other = User.objects.create(username='other', email='other@example.com')
+        self.post({'item': 1})
+        response = self.post({'item': 1}, user=other)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.runs), 2)
+
+    def test_same_key_with_a_different_body_is_rejected(self):
+        self.post({'item': 1})
+        response = self.post({'item': 2})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(len(self.runs), 1)
+
+    def test_retry_while_the_first_request_runs_conflicts(self):
+        nested = []
+
+        def retry_during_first_run(request, run):
+            if run == 1:
+                nested.append(self.post({'item': 1}))
+            return Response({'run': run}, status=201)
+        self.behaviour = retry_during_first_run
+
+        response = self.post({'item': 1})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(nested[0].status_code, 409)
+        self.assertEqual(len(self.runs), 1)
+
+    def test_server_error_releases_the_key(self):
+        self.behaviour = lambda request, run: Response({'run': run}, status=500 if run == 1 else 201)
+        self.assertEqual(self.post({'item': 1}).status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        response = self.post({'item': 1})
+        self.assertEqual((response.status_code, response.data), (201, {'run': 2}))
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+    def test_exception_releases_the_key(self):
+        def fail_once(request, run):
+            if run == 1:
+                raise RuntimeError("boom")
+            return Response({'run': run}, status=201)
+        self.behaviour = fail_once
+        with self.assertRaises(RuntimeError):
+            self.post({'item': 1})
+        self.assertEqual(self.post({'item': 1}).status_code, 201)
+
+    def test_requests_without_a_key_always_run(self):
+        for _ in range(2):
+            request = self.factory.post('/api/things/', {'item': 1}, format='json')
+            force_authenticate(request, user=self.user)
+            RecordingView.as_view(runs=self.runs, behaviour=self.behaviour)(request)
+        self.assertEqual(len(self.runs), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class OrderCreateIdempotencyTests(TestCase):
+    url = '/api/orders/orders/'
+
+    def setUp(self):
+        self.buyer = User.objects.create(username='buyer', email='buyer@example.com', is_buyer=True)
+        farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        self.carrots = Product.objects.create(name='Carrots', price=2, quantity=5, farmer=farmer)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def place_order(self, quantity, key):
+        return self.client.post(self.url, {
+            'order_items': [{'product_id': self.carrots.pk, 'quantity': quantity}],
+            'delivery_address': 'Farm road',
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_order_is_placed_once(self):
+        first = self.place_order(2, 'order-1')
+        second = self.place_order(2, 'order-1')
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+        self.assertEqual(Order.objects.count(), 1)
+        self.carrots.refresh_from_db()
+        self.assertEqual(self.carrots.quantity, 3)
+
+    def test_rejected_order_is_not_replayed(self):
+        self.assertEqual(self.place_order(8, 'order-1').status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        # Once restocked, the same request with the same key goes through
+        Product.objects.filter(pk=self.carrots.pk).update(quantity=10)
+        response = self.place_order(8, 'order-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Order.objects.count(), 1)
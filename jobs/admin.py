@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import Job
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'priority', 'run_at', 'attempts', 'locked_by', 'created_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,94 @@
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.models import Job
+from jobs.queue import claim_jobs, run_job
+
+
+def _setup_process():
+    # Needed when workers are spawned rather than forked
+    django.setup()
+    connections.close_all()  # a forked child must not share the parent's connection
+
+
+def _run_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        # Each thread has its own connections; don't leave them open
+        connections.close_all()
+
+
+def _run_in_process(job_id, locked_by):
+    job = Job.objects.filter(pk=job_id, locked_by=locked_by).first()
+    return run_job(job) if job is not None else False
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued jobs (jobs.Job) until stopped with SIGINT/SIGTERM, which "
+        "lets running jobs finish. Start as many workers as needed; they "
+        "share the queue through the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            help="Jobs run at once (default JOB_WORKER_CONCURRENCY).")
+        parser.add_argument(
+            '--pool', choices=('thread', 'process'), default='thread',
+            help="Run jobs in threads (I/O-bound work) or processes (CPU-bound work).")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between checks when idle.")
+        parser.add_argument('--once', action='store_true', help="Exit when no job is due.")
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency'] or getattr(settings, 'JOB_WORKER_CONCURRENCY', 4)
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        stopping = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stopping.set())
+
+        if options['pool'] == 'process':
+            pool = ProcessPoolExecutor(max_workers=concurrency, initializer=_setup_process)
+            submit = lambda job: pool.submit(_run_in_process, job.pk, job.locked_by)
+        else:
+            pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job')
+            submit = lambda job: pool.submit(_run_in_thread, job)
+
+        self.stdout.write(f"Worker {worker_id} running up to {concurrency} jobs in {options['pool']} pool.")
+        running = set()
+        outcomes = {True: 0, False: 0}  # succeeded?
+
+        def collect(done):
+            for future in done:
+                try:
+                    outcomes[bool(future.result())] += 1
+                except Exception as e:
+                    # run_job records job errors itself; this is e.g. a lost database connection
+                    self.stderr.write(f"Worker {worker_id} could not record a job's outcome: {e!r}")
+                    outcomes[False] += 1
+
+        with pool:
+            while not stopping.is_set():
+                free = concurrency - len(running)
+                jobs = claim_jobs(worker_id, free) if free else []
+                running.update(submit(job) for job in jobs)
+                if not running:
+                    if options['once']:
+                        break
+                    stopping.wait(options['poll_interval'])
+                    continue
+                # Until a slot frees up, or it is time to look for newly due jobs
+                done, running = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                collect(done)
+            collect(wait(running).done)
+        self.stdout.write(self.style.SUCCESS(
+            f"Worker stopped: {outcomes[True]} jobs succeeded, {outcomes[False]} failed."))
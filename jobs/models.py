@@ -0,0 +1,46 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    A call of the module-level function ``name`` with the JSON list ``args``,
+    run by ``manage.py run_worker``.
+
+    Higher ``priority`` runs first, and nothing runs before ``run_at``. A
+    worker claims a job by leasing it (``locked_by``/``locked_until``); if
+    the lease runs out, e.g. because the worker died, the job can be claimed
+    again, so a job may run more than once. Jobs that succeed are deleted;
+    ones out of attempts stay with status ``failed`` and their last error.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list, blank=True)
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Claiming: due queued jobs, highest priority then oldest first
+            models.Index(fields=['status', '-priority', 'run_at', 'id'], name='job_claim_idx'),
+            # Reclaiming jobs whose lease ran out
+            models.Index(fields=['status', 'locked_until'], name='job_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name}{tuple(self.args)} [{self.status}]"
@@ -0,0 +1,112 @@
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+DEFAULT_JOB_MAX_ATTEMPTS = 5
+# Seconds a claimed job is reserved for its worker
+DEFAULT_JOB_LEASE = 300
+# Retry n waits base * 2**(n-1) seconds, up to the cap, give or take 20%
+DEFAULT_JOB_RETRY_BACKOFF = 10
+MAX_RETRY_DELAY = 3600
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(func, *args, priority=0, run_at=None, delay=None, max_attempts=None):
+    """
+    Queue ``func(*args)`` to run in a worker. ``func`` is a module-level
+    function or its dotted path; ``args`` must be JSON values (ids rather
+    than model instances). ``run_at`` or ``delay`` (a timedelta or seconds)
+    schedules it for later.
+
+    The job is a row written in the caller's transaction, so it only becomes
+    visible to workers if that transaction commits.
+    """
+    name = func if isinstance(func, str) else f"{func.__module__}.{func.__qualname__}"
+    if '<' in name:
+        raise ValueError(f"Only module-level functions can be queued, not {name}.")
+    if run_at is None:
+        run_at = timezone.now()
+        if delay:
+            run_at += delay if isinstance(delay, timedelta) else timedelta(seconds=delay)
+    return Job.objects.create(
+        name=name,
+        args=list(args),
+        priority=priority,
+        run_at=run_at,
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', DEFAULT_JOB_MAX_ATTEMPTS),
+    )
+
+
+def _claimable(now):
+    return Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now)
+
+
+def claim_jobs(worker_id, limit, lease=None):
+    """
+    Lease up to ``limit`` due jobs to ``worker_id`` and return them.
+
+    Candidates are read first and then taken with one UPDATE that repeats
+    the claimable condition, so when workers race for the same rows each
+    row goes to exactly one of them, on any database.
+    """
+    now = timezone.now()
+    lease = lease or getattr(settings, 'JOB_LEASE', DEFAULT_JOB_LEASE)
+    # Jobs whose last attempt's lease ran out have nothing left to retry with
+    Job.objects.filter(status=Job.RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, locked_by='', locked_until=None, last_error="Lease expired on the last attempt.")
+
+    ordering = ('-priority', 'run_at', 'id')
+    candidates = [
+        *Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by(*ordering).values_list(
+            'pk', 'priority', 'run_at')[:limit],
+        *Job.objects.filter(status=Job.RUNNING, locked_until__lt=now).order_by(*ordering).values_list(
+            'pk', 'priority', 'run_at')[:limit],
+    ]
+    candidates.sort(key=lambda row: (-row[1], row[2], row[0]))
+    ids = [pk for pk, _, _ in candidates[:limit]]
+    if not ids:
+        return []
+    token = f"{worker_id}:{uuid.uuid4().hex[:12]}"
+    Job.objects.filter(_claimable(now), pk__in=ids).update(
+        status=Job.RUNNING, locked_by=token, locked_until=now + timedelta(seconds=lease),
+        attempts=F('attempts') + 1)
+    return list(Job.objects.filter(pk__in=ids, locked_by=token).order_by(*ordering))
+
+
+def run_job(job):
+    """
+    Run a claimed job and record the outcome: delete it on success, or put
+    it back with a growing delay until it is out of attempts. Outcomes are
+    only written while the job is still leased to this run.
+    """
+    leased = Job.objects.filter(pk=job.pk, locked_by=job.locked_by)
+    try:
+        import_string(job.name)(*job.args)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception("Job %s %s%s failed (attempt %d of %d).",
+                         job.pk, job.name, tuple(job.args), job.attempts, job.max_attempts)
+        if job.attempts >= job.max_attempts:
+            leased.update(status=Job.FAILED, locked_by='', locked_until=None, last_error=error)
+        else:
+            leased.update(
+                status=Job.QUEUED, run_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+                locked_by='', locked_until=None, last_error=error)
+        return False
+    leased.delete()
+    return True
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'JOB_RETRY_BACKOFF', DEFAULT_JOB_RETRY_BACKOFF)
+    return min(base * 2 ** (attempts - 1), MAX_RETRY_DELAY) * random.uniform(0.8, 1.2)
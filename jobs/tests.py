@@ -0,0 +1,148 @@
+import signal
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .queue import MAX_RETRY_DELAY, claim_jobs, enqueue, retry_delay, run_job
+
+# Calls made by the jobs below, which must be importable by name
+CALLS = []
+
+
+def record_call(*args):
+    CALLS.append(args)
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+class JobTestMixin:
+    def setUp(self):
+        super().setUp()
+        CALLS.clear()
+        self.addCleanup(CALLS.clear)
+
+
+class EnqueueTests(JobTestMixin, TestCase):
+    def test_stores_the_call(self):
+        job = enqueue(record_call, 1, 'two', priority=5)
+        job.refresh_from_db()
+        self.assertEqual((job.name, job.args, job.priority), ('jobs.tests.record_call', [1, 'two'], 5))
+        self.assertEqual((job.status, job.attempts, job.max_attempts), (Job.QUEUED, 0, 5))
+        self.assertEqual(enqueue('jobs.tests.fail', 'x').name, 'jobs.tests.fail')
+
+    def test_schedules_for_later(self):
+        before = timezone.now()
+        self.assertGreaterEqual(enqueue(record_call, delay=60).run_at, before + timedelta(seconds=60))
+        self.assertGreaterEqual(enqueue(record_call, delay=timedelta(minutes=2)).run_at, before + timedelta(minutes=2))
+        run_at = before + timedelta(days=1)
+        self.assertEqual(enqueue(record_call, run_at=run_at).run_at, run_at)
+
+    @override_settings(JOB_MAX_ATTEMPTS=2)
+    def test_max_attempts_default_from_settings(self):
+        self.assertEqual(enqueue(record_call).max_attempts, 2)
+        self.assertEqual(enqueue(record_call, max_attempts=7).max_attempts, 7)
+
+    def test_rejects_functions_that_cannot_be_imported(self):
+        with self.assertRaises(ValueError):
+            enqueue(lambda: None)
+
+
+class ClaimJobsTests(JobTestMixin, TestCase):
+    def test_claims_due_jobs_by_priority(self):
+        low = enqueue(record_call, 'low')
+        high = enqueue(record_call, 'high', priority=10)
+        enqueue(record_call, 'later', delay=60)
+        claimed = claim_jobs('worker-1', 5)
+        self.assertEqual([job.pk for job in claimed], [high.pk, low.pk])
+        for job in claimed:
+            self.assertEqual((job.status, job.attempts), (Job.RUNNING, 1))
+            self.assertTrue(job.locked_by.startswith('worker-1:'))
+            self.assertGreater(job.locked_until, timezone.now())
+
+    def test_limit_and_leased_jobs_are_not_claimed_twice(self):
+        first, second = enqueue(record_call, 1), enqueue(record_call, 2)
+        self.assertEqual([job.pk for job in claim_jobs('worker-1', 1)], [first.pk])
+        self.assertEqual([job.pk for job in claim_jobs('worker-2', 5)], [second.pk])
+        self.assertEqual(claim_jobs('worker-3', 5), [])
+
+    def test_expired_lease_is_reclaimed(self):
+        job = enqueue(record_call)
+        claimed, = claim_jobs('worker-1', 1)
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed, = claim_jobs('worker-2', 1)
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (job.pk, 2))
+        self.assertNotEqual(reclaimed.locked_by, claimed.locked_by)
+        # The first worker's run can no longer record an outcome
+        self.assertTrue(run_job(claimed))
+        self.assertTrue(Job.objects.filter(pk=job.pk, locked_by=reclaimed.locked_by).exists())
+
+    def test_expired_lease_on_the_last_attempt_fails_the_job(self):
+        job = enqueue(record_call, max_attempts=1)
+        claim_jobs('worker-1', 1)
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim_jobs('worker-2', 1), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), (Job.FAILED, "Lease expired on the last attempt."))
+
+
+class RunJobTests(JobTestMixin, TestCase):
+    def test_success_deletes_the_job(self):
+        enqueue(record_call, 1, 'a')
+        job, = claim_jobs('worker', 1)
+        self.assertTrue(run_job(job))
+        self.assertEqual(CALLS, [(1, 'a')])
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOB_RETRY_BACKOFF=10)
+    def test_failure_is_retried_later(self):
+        enqueue(fail, 'boom')
+        job, = claim_jobs('worker', 1)
+        with self.assertLogs('jobs.queue', 'ERROR') as logs:
+            self.assertFalse(run_job(job))
+        self.assertIn('failed (attempt 1 of 5)', logs.output[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.locked_until), (Job.QUEUED, '', None))
+        self.assertIn('ValueError: boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=7))
+        self.assertEqual(claim_jobs('worker', 1), [])
+
+    def test_failure_on_the_last_attempt_is_final(self):
+        enqueue(fail, 'boom', max_attempts=1)
+        job, = claim_jobs('worker', 1)
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('ValueError: boom', job.last_error)
+
+
+class RetryDelayTests(TestCase):
+    @override_settings(JOB_RETRY_BACKOFF=10)
+    def test_doubles_per_attempt_with_jitter_and_a_cap(self):
+        with mock.patch('jobs.queue.random.uniform', return_value=1.0):
+            self.assertEqual([retry_delay(attempts) for attempts in (1, 2, 3)], [10, 20, 40])
+            self.assertEqual(retry_delay(20), MAX_RETRY_DELAY)
+        for _ in range(20):
+            self.assertTrue(8 <= retry_delay(1) <= 12)
+
+
+class RunWorkerTests(JobTestMixin, TransactionTestCase):
+    # Jobs run in worker threads, which only see committed rows
+    def test_once_runs_due_jobs_and_exits(self):
+        # The command installs its own SIGINT/SIGTERM handlers
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+        enqueue(record_call, 1)
+        enqueue(record_call, 2, delay=60)
+        out = StringIO()
+        call_command('run_worker', '--once', '--concurrency', '1', stdout=out)
+        self.assertEqual(CALLS, [(1,)])
+        self.assertIn('1 jobs succeeded, 0 failed', out.getvalue())
+        self.assertEqual(Job.objects.count(), 1)
@@ -3,5 +3,5 @@ from .models import Delivery
 from .serializers import DeliverySerializer
 
 class DeliveryViewSet(viewsets.ModelViewSet):
-    queryset = Delivery.objects.all()
+    queryset = Delivery.objects.order_by('-id')
     serializer_class = DeliverySerializer
\ No newline at end of file
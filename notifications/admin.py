@@ -2,8 +2,8 @@ from django.contrib import admin
 from .models import Notification
 
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('user', 'message', 'is_read', 'created_at')
-    list_filter = ('is_read', 'created_at')
+    list_display = ('user', 'kind', 'message', 'is_read', 'created_at')
+    list_filter = ('kind', 'is_read', 'created_at')
     search_fields = ('user__username', 'message')
 
 admin.site.register(Notification, NotificationAdmin)
\ No newline at end of file
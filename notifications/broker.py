@@ -0,0 +1,255 @@
+import asyncio
+import json
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import close_old_connections, connection
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import BrokerMessage
+
+# Undelivered events a connection may hold before it is closed; the client
+# then reconnects and catches up from the database with Last-Event-ID
+SUBSCRIPTION_QUEUE_SIZE = 100
+# DatabaseBroker: seconds between reads of new messages, and how far back a
+# read looks, which covers messages that commit out of id order
+DEFAULT_BROKER_POLL_INTERVAL = 1
+BROKER_MESSAGE_LOOKBACK = timedelta(seconds=30)
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """ One open stream: a queue filled from any thread, read on its event loop """
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+
+    def put(self, event):
+        # Runs on self.loop. A full queue means the client stopped reading:
+        # make room for the None that ends its stream.
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = None
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        """ The next event dict, or None when the stream should end """
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    """
+    Hands published events to the subscriptions of this process. Enough for
+    a single process that also runs the background tasks, i.e. with
+    ``BACKGROUND_TASKS_EAGER``; otherwise use a broker that relays between
+    processes. Publishing to a user without an open stream costs one dict
+    lookup.
+    """
+    # Whether events published in one process reach streams in another
+    cross_process = False
+
+    def __init__(self):
+        self._subscriptions = {}  # user id -> set of Subscription
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """ Call from the event loop that will read the subscription """
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, messages):
+        """ Deliver ``(user_id, event)`` pairs; safe to call from any thread """
+        self.deliver(messages)
+
+    def deliver(self, messages):
+        with self._lock:
+            targets = [
+                (subscription, event)
+                for user_id, event in messages
+                for subscription in self._subscriptions.get(user_id, ())
+            ]
+        for subscription, event in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                pass  # its event loop has closed; unsubscribe follows
+
+    def close(self):
+        """ Stop any background work; the broker is not used afterwards """
+
+
+class DatabaseBroker(InProcessBroker):
+    """
+    Relays events between processes through the BrokerMessage table, so the
+    ``run_worker`` process can reach the streams open in the web processes
+    without extra infrastructure. Each batch is one INSERT; a process with
+    open streams runs one thread that reads new messages every
+    ``NOTIFICATION_BROKER_POLL_INTERVAL`` seconds and delivers them locally.
+    """
+    cross_process = True
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+        self._listener_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._seen = {}  # message id -> created_at, for the lookback window
+        self._listening_since = None
+
+    def subscribe(self, user_id):
+        self._start_listener()
+        return super().subscribe(user_id)
+
+    def publish(self, messages):
+        messages = list(messages)
+        if messages:
+            BrokerMessage.objects.create(events=messages)
+            # Older messages have been read by every listener
+            BrokerMessage.objects.filter(created_at__lt=timezone.now() - 2 * BROKER_MESSAGE_LOOKBACK).delete()
+
+    def poll(self):
+        """
+        Deliver the messages not seen yet. Messages are read by age rather
+        than by id because ids can commit out of order. Returns the number
+        of messages delivered.
+        """
+        since = timezone.now() - BROKER_MESSAGE_LOOKBACK
+        rows = BrokerMessage.objects.filter(created_at__gte=since).exclude(
+            pk__in=list(self._seen)).order_by('id').values_list('id', 'created_at', 'events')
+        delivered = 0
+        for pk, created_at, events in rows:
+            self._seen[pk] = created_at
+            # Messages from before the first subscription are not replayed
+            if self._listening_since is None or created_at >= self._listening_since:
+                self.deliver(events)
+                delivered += 1
+        self._seen = {pk: created_at for pk, created_at in self._seen.items() if created_at >= since}
+        return delivered
+
+    def close(self):
+        self._stopped.set()
+        if self._listener is not None:
+            self._listener.join()
+
+    def _start_listener(self):
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                if self._listening_since is None:
+                    self._listening_since = timezone.now()
+                self._listener = threading.Thread(
+                    target=self._listen, name='notification-broker', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        interval = getattr(settings, 'NOTIFICATION_BROKER_POLL_INTERVAL', DEFAULT_BROKER_POLL_INTERVAL)
+        try:
+            while True:
+                try:
+                    close_old_connections()
+                    self.poll()
+                except Exception:
+                    logger.exception("Reading notification broker messages failed.")
+                if self._stopped.wait(interval):
+                    return
+        finally:
+            connection.close()
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Relays events between worker processes over Redis pub/sub: each batch is
+    one PUBLISH, and one listener thread per process delivers it locally.
+    Needs the ``redis`` package and ``NOTIFICATION_BROKER_URL``.
+    """
+    cross_process = True
+    channel = 'notifications:events'
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisBroker requires the 'redis' package.")
+        url = getattr(settings, 'NOTIFICATION_BROKER_URL', None)
+        if not url:
+            raise ImproperlyConfigured("RedisBroker requires NOTIFICATION_BROKER_URL.")
+        self._client = redis.Redis.from_url(url)
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        self._start_listener()
+        return super().subscribe(user_id)
+
+    def publish(self, messages):
+        messages = list(messages)
+        if messages:
+            self._client.publish(self.channel, json.dumps(messages))
+
+    def _start_listener(self):
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(
+                    target=self._listen, name='notification-broker', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            try:
+                self.deliver(json.loads(message['data']))
+            except ValueError:
+                logger.warning("Ignoring malformed notification broker message: %r", message['data'])
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker_class():
+    """
+    The class named by ``NOTIFICATION_BROKER`` (a dotted path); without one,
+    events stay within this process.
+    """
+    broker_path = getattr(settings, 'NOTIFICATION_BROKER', None)
+    return import_string(broker_path) if broker_path else InProcessBroker
+
+
+def get_broker():
+    """ Return this process's broker (see get_broker_class) """
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = get_broker_class()()
+        return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    global _broker
+    if setting in ('NOTIFICATION_BROKER', 'NOTIFICATION_BROKER_URL'):
+        with _broker_lock:
+            if _broker is not None:
+                _broker.close()
+            _broker = None
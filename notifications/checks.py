@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def check_notification_broker(app_configs, **kwargs):
+    """
+    Background tasks create the notifications, so unless they run in the
+    web process (BACKGROUND_TASKS_EAGER) the broker has to relay the
+    ``run_worker`` process's events to the streams open elsewhere.
+    """
+    from .broker import get_broker_class
+
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        return []
+    try:
+        broker_class = get_broker_class()
+    except ImportError as e:
+        return [Error(f"NOTIFICATION_BROKER cannot be imported: {e}", id='notifications.E002')]
+    if getattr(broker_class, 'cross_process', False):
+        return []
+    return [Error(
+        f"{broker_class.__name__} only reaches notification streams in its own process, but "
+        "notifications are created by run_worker.",
+        hint='Set NOTIFICATION_BROKER to "notifications.broker.DatabaseBroker" or '
+             '"notifications.broker.RedisBroker", or set BACKGROUND_TASKS_EAGER = True.',
+        id='notifications.E001',
+    )]
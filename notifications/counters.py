@@ -0,0 +1,55 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Notification, UnreadCounter
+
+
+def adjust_unread_counts(deltas):
+    """
+    Add ``{user_id: delta}`` to the users' unread counters. Users sharing a
+    delta are updated together, so a fan-out batch (+1 each) is one UPDATE.
+    ``F()`` lets concurrent changes to the same counter add up.
+    """
+    users_by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if delta:
+            users_by_delta[delta].append(user_id)
+    for delta, user_ids in users_by_delta.items():
+        UnreadCounter.objects.filter(user_id__in=user_ids).update(count=F('count') + delta)
+
+
+def count_new_notifications(notifications):
+    """ The counter deltas for newly created ``notifications`` """
+    return Counter(notification.user_id for notification in notifications if not notification.is_read)
+
+
+def get_unread_count(user_id):
+    """
+    The user's unread count. Users created without the post_save signal
+    (e.g. bulk_create) get their counter from a COUNT on first use.
+    """
+    count = UnreadCounter.objects.filter(user_id=user_id).values_list('count', flat=True).first()
+    if count is None:
+        with transaction.atomic():
+            counter, _ = UnreadCounter.objects.get_or_create(
+                user_id=user_id,
+                defaults={'count': Notification.objects.filter(user_id=user_id, is_read=False).count()})
+        count = counter.count
+    return count
+
+
+@transaction.atomic
+def mark_notifications_read(user_id, ids=None):
+    """
+    Mark the user's unread notifications read, only those in ``ids`` if
+    given, with one UPDATE, and take them off the counter in the same
+    transaction. Returns the number marked.
+    """
+    notifications = Notification.objects.filter(user_id=user_id, is_read=False)
+    if ids is not None:
+        notifications = notifications.filter(pk__in=ids)
+    marked = notifications.update(is_read=True)
+    adjust_unread_counts({user_id: -marked})
+    return marked
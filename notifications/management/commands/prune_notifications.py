@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from notifications.retention import prune_notifications
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete read notifications older than the retention period "
+        "(NOTIFICATION_RETENTION_DAYS), in chunks. Schedule it, e.g. daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Override NOTIFICATION_RETENTION_DAYS.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--archive', metavar='PATH',
+            help="Append the deleted notifications to this JSON Lines file first.")
+
+    def handle(self, *args, **options):
+        if options['archive']:
+            with open(options['archive'], 'a', encoding='utf-8') as archive:
+                deleted = prune_notifications(
+                    days=options['days'], batch_size=options['batch_size'], archive=archive)
+        else:
+            deleted = prune_notifications(days=options['days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} notifications."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_notification_notification_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='kind',
+            field=models.CharField(choices=[('general', 'General'), ('order_placed', 'Order placed'), ('product_sold', 'Product sold'), ('payment_captured', 'Payment captured'), ('delivery_status', 'Delivery status changed'), ('announcement', 'Announcement')], default='general', max_length=50),
+        ),
+    ]
@@ -2,7 +2,47 @@ from django.db import models
 from users.models import User
 
 class Notification(models.Model):
+    KIND_CHOICES = [
+        ('general', 'General'),
+        ('order_placed', 'Order placed'),
+        ('product_sold', 'Product sold'),
+        ('payment_captured', 'Payment captured'),
+        ('delivery_status', 'Delivery status changed'),
+        ('announcement', 'Announcement'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES, default='general')
     message = models.TextField()
+    # Events merged into this row; the message is the latest one's
+    digest_count = models.PositiveIntegerField(default=1)
     is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='notification_created_idx'),
+            # A user's unread notifications, newest first
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notification_user_unread_idx'),
+        ]
+
+class UnreadCounter(models.Model):
+    """ A user's number of unread notifications, kept up to date by notifications.counters """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='unread_notification_counter')
+    count = models.IntegerField(default=0)
+
+
+class BrokerMessage(models.Model):
+    """
+    A batch of stream events published by notifications.broker.DatabaseBroker;
+    every process with open streams reads it and delivers the events locally.
+    Rows are only needed for a few seconds and are deleted as new ones come in.
+    """
+    events = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='broker_message_created_idx'),
+        ]
@@ -0,0 +1,38 @@
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Notification
+
+DEFAULT_NOTIFICATION_RETENTION_DAYS = 90
+ARCHIVED_FIELDS = ('id', 'user_id', 'kind', 'message', 'digest_count', 'is_read', 'created_at')
+
+
+def prune_notifications(days=None, batch_size=1000, archive=None):
+    """
+    Delete read notifications older than ``days`` (``NOTIFICATION_RETENTION_DAYS``
+    by default), ``batch_size`` rows per transaction so no statement holds
+    locks for long. With ``archive``, a text file, each row is first written
+    to it as a JSON line. Unread notifications are kept whatever their age.
+
+    Returns the number of notifications deleted.
+    """
+    if days is None:
+        days = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', DEFAULT_NOTIFICATION_RETENTION_DAYS)
+    cutoff = timezone.now() - timedelta(days=days)
+    expired = Notification.objects.filter(is_read=True, created_at__lt=cutoff).order_by('created_at', 'id')
+    deleted = 0
+    while True:
+        # Deleted rows drop out of the filter, so each chunk starts from the oldest left
+        rows = list(expired.values(*ARCHIVED_FIELDS)[:batch_size])
+        if not rows:
+            return deleted
+        if archive is not None:
+            for row in rows:
+                archive.write(json.dumps({**row, 'created_at': row['created_at'].isoformat()}) + '\n')
+            # Rows are only deleted once they are safely written
+            archive.flush()
+        Notification.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+        deleted += len(rows)
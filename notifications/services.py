@@ -0,0 +1,225 @@
+import logging
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from agro_ecommerce.background import run_in_background
+from logistics.models import Delivery
+from orders.models import Order, OrderItem
+from users.models import User
+
+from .broker import get_broker
+from .counters import adjust_unread_counts, count_new_notifications
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT when fanning out; keeps each statement and its memory small
+DEFAULT_NOTIFICATION_BATCH_SIZE = 1000
+# Kinds whose events for one user are merged while unread, and for how long
+# (seconds) after the first of them
+DEFAULT_NOTIFICATION_DIGEST_KINDS = ('product_sold',)
+DEFAULT_NOTIFICATION_DIGEST_WINDOW = 600
+AUDIENCES = {
+    'all': {},
+    'farmers': {'is_farmer': True},
+    'buyers': {'is_buyer': True},
+}
+
+
+def create_notifications(notifications, batch_size=None):
+    """
+    Store ``(user_id, kind, message)`` triples with one bulk INSERT per
+    batch. ``notifications`` may be a generator, so a fan-out to every user
+    never holds more than one batch in memory.
+
+    Events of the ``NOTIFICATION_DIGEST_KINDS`` are coalesced: one for a
+    user who already has an unread notification of that kind created in
+    the last ``NOTIFICATION_DIGEST_WINDOW`` seconds is merged into it
+    instead of adding a row. Returns the number of events stored.
+    """
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_BATCH_SIZE', DEFAULT_NOTIFICATION_BATCH_SIZE)
+    notifications = iter(notifications)
+    stored = 0
+    while True:
+        batch = list(islice(notifications, batch_size))
+        if not batch:
+            return stored
+        _store_batch(batch)
+        stored += len(batch)
+
+
+def _store_batch(batch):
+    digest_kinds = set(getattr(settings, 'NOTIFICATION_DIGEST_KINDS', DEFAULT_NOTIFICATION_DIGEST_KINDS))
+    window = getattr(settings, 'NOTIFICATION_DIGEST_WINDOW', DEFAULT_NOTIFICATION_DIGEST_WINDOW)
+    # bulk_create skips auto_now_add; one timestamp per batch is enough
+    now = timezone.now()
+    rows = []
+    digests = {}  # (user_id, kind) -> the batch's Notification for it
+    for user_id, kind, message in batch:
+        key = (user_id, kind)
+        if window and kind in digest_kinds and key in digests:
+            digests[key].digest_count += 1
+            digests[key].message = message
+            continue
+        notification = Notification(user_id=user_id, kind=kind, message=message, created_at=now)
+        rows.append(notification)
+        if window and kind in digest_kinds:
+            digests[key] = notification
+
+    with transaction.atomic():
+        merged_ids = _merge_into_open_digests(digests, now - timedelta(seconds=window)) if digests else set()
+        merged = {key: digests[key] for key in merged_ids}
+        rows = [notification for notification in rows if (notification.user_id, notification.kind) not in merged]
+        Notification.objects.bulk_create(rows)
+        # Merged events leave the unread count as it was
+        adjust_unread_counts(count_new_notifications(rows))
+        if merged:
+            rows += Notification.objects.filter(pk__in=[digest.pk for digest in merged.values()])
+    publish_notifications(rows)
+
+
+def _merge_into_open_digests(digests, since):
+    """
+    Add the batch's ``digests`` to the matching unread notifications created
+    since ``since``, one UPDATE each. Returns the keys merged; their
+    Notification gets the pk of the row it went into.
+    """
+    open_rows = Notification.objects.filter(
+        user_id__in={user_id for user_id, _ in digests}, kind__in={kind for _, kind in digests},
+        is_read=False, created_at__gte=since,
+    ).order_by('created_at').values_list('user_id', 'kind', 'pk')
+    # The newest open row per (user, kind) wins
+    targets = {(user_id, kind): pk for user_id, kind, pk in open_rows if (user_id, kind) in digests}
+    merged = set()
+    for key, pk in targets.items():
+        digest = digests[key]
+        # F() keeps concurrent merges into the same row from losing counts;
+        # a row read in the meantime no longer matches and gets a new one
+        if Notification.objects.filter(pk=pk, is_read=False).update(
+                message=digest.message, digest_count=F('digest_count') + digest.digest_count):
+            digest.pk = pk
+            merged.add(key)
+    return merged
+
+
+def grown_digests(user_id, last_id):
+    """
+    The user's digests at or below ``last_id`` that may have grown after
+    the event with that id was sent. A digest is re-sent under its own id,
+    so a stream resuming after ``last_id`` would otherwise miss the update.
+
+    Rows only take merges within the digest window of their creation, and
+    the stream was open when ``last_id`` went out, so only digests created
+    less than a window before it can have grown since.
+    """
+    digest_kinds = getattr(settings, 'NOTIFICATION_DIGEST_KINDS', DEFAULT_NOTIFICATION_DIGEST_KINDS)
+    window = getattr(settings, 'NOTIFICATION_DIGEST_WINDOW', DEFAULT_NOTIFICATION_DIGEST_WINDOW)
+    last_sent = Notification.objects.filter(pk=last_id).values_list('created_at', flat=True).first()
+    if not window or not digest_kinds or last_sent is None:
+        return Notification.objects.none()
+    return Notification.objects.filter(
+        user_id=user_id, id__lte=last_id, kind__in=digest_kinds, digest_count__gt=1,
+        created_at__gte=last_sent - timedelta(seconds=window),
+    ).order_by('id')
+
+
+def notification_event(notification):
+    """ The JSON pushed to open notification streams """
+    return {
+        'id': notification.pk,
+        'kind': notification.kind,
+        'message': notification.message,
+        'digest_count': notification.digest_count,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+def publish_notifications(notifications):
+    """ Push saved notifications to their users' open streams once committed """
+    messages = [(notification.user_id, notification_event(notification)) for notification in notifications]
+    transaction.on_commit(lambda: get_broker().publish(messages))
+
+
+# --- Entry points: called inside a request; the work runs after commit ---
+
+def notify_users(user_ids, message, kind='general'):
+    """ Send the same notification to each of ``user_ids`` in the background """
+    run_in_background(send_to_users, list(user_ids), message, kind)
+
+
+def broadcast(message, audience='all', kind='announcement'):
+    """ Send a notification to every active user in ``audience`` (see AUDIENCES) """
+    if audience not in AUDIENCES:
+        raise ValueError(f"Unknown audience {audience!r}; use one of {', '.join(AUDIENCES)}.")
+    run_in_background(send_broadcast, message, audience, kind)
+
+
+def notify_order_placed(order_id):
+    run_in_background(send_order_placed, order_id)
+
+
+def notify_payment_captured(order_id):
+    run_in_background(send_payment_captured, order_id)
+
+
+def notify_delivery_status_changed(delivery_id):
+    run_in_background(send_delivery_status_changed, delivery_id)
+
+
+# --- Background tasks ---
+
+def send_to_users(user_ids, message, kind):
+    create_notifications((user_id, kind, message) for user_id in user_ids)
+
+
+def send_broadcast(message, audience, kind):
+    user_ids = User.objects.filter(is_active=True, **AUDIENCES[audience]).order_by('id').values_list(
+        'id', flat=True)
+    created = create_notifications(
+        (user_id, kind, message) for user_id in user_ids.iterator(chunk_size=DEFAULT_NOTIFICATION_BATCH_SIZE))
+    logger.info("Broadcast '%s' sent to %d users.", kind, created)
+
+
+def send_order_placed(order_id):
+    """ Tell the buyer their order was placed, and each farmer what of theirs sold """
+    order = Order.objects.filter(pk=order_id).first()
+    if order is None:
+        return
+    sold = {}  # farmer id -> lines of the order
+    items = OrderItem.objects.filter(order_id=order_id).select_related('product').only(
+        'quantity', 'product__name', 'product__farmer_id')
+    for item in items:
+        sold.setdefault(item.product.farmer_id, []).append(f"{item.quantity} x {item.product.name}")
+    notifications = [
+        (order.buyer_id, 'order_placed', f"Your order #{order.pk} was placed. Total: {order.total_price}."),
+        *((farmer_id, 'product_sold', f"Order #{order.pk} includes your products: {', '.join(lines)}.")
+          for farmer_id, lines in sold.items()),
+    ]
+    create_notifications(notifications)
+
+
+def send_payment_captured(order_id):
+    order = Order.objects.filter(pk=order_id).select_related('payment').first()
+    if order is None:
+        return
+    payment = getattr(order, 'payment', None)
+    amount = payment.amount if payment else order.total_price
+    create_notifications([
+        (order.buyer_id, 'payment_captured', f"We received your payment of {amount} for order #{order.pk}."),
+    ])
+
+
+def send_delivery_status_changed(delivery_id):
+    delivery = Delivery.objects.filter(pk=delivery_id).select_related('order').first()
+    if delivery is None:
+        return
+    create_notifications([
+        (delivery.order.buyer_id, 'delivery_status',
+         f"Delivery of order #{delivery.order_id} is now '{delivery.status}'."),
+    ])
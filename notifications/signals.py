@@ -0,0 +1,63 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from logistics.models import Delivery
+from users.models import User
+
+from .counters import adjust_unread_counts, count_new_notifications
+from .models import Notification, UnreadCounter
+from .services import notify_delivery_status_changed, publish_notifications
+
+
+@receiver(pre_save, sender=Delivery)
+def remember_delivery_status(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk is not None:
+        instance._saved_status = Delivery.objects.filter(pk=instance.pk).values_list(
+            'status', flat=True).first()
+
+
+@receiver(post_save, sender=Delivery)
+def notify_delivery_status(sender, instance, created, raw=False, **kwargs):
+    # A new delivery is announced with its order
+    if not raw and not created and getattr(instance, '_saved_status', instance.status) != instance.status:
+        notify_delivery_status_changed(instance.pk)
+    instance._saved_status = instance.status
+
+
+@receiver(post_save, sender=User)
+def create_unread_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UnreadCounter.objects.get_or_create(user=instance)
+
+
+# Bulk-created notifications are counted and pushed by create_notifications;
+# these cover notifications saved or deleted one at a time.
+
+@receiver(pre_save, sender=Notification)
+def remember_unread_state(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk is not None:
+        instance._saved_unread = Notification.objects.filter(pk=instance.pk).values_list(
+            'user_id', 'is_read').first()
+
+
+@receiver(post_save, sender=Notification)
+def count_saved_notification(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        adjust_unread_counts(count_new_notifications([instance]))
+        publish_notifications([instance])
+        return
+    deltas = {}
+    stored = getattr(instance, '_saved_unread', None)
+    if stored and not stored[1]:
+        deltas[stored[0]] = -1
+    if not instance.is_read:
+        deltas[instance.user_id] = deltas.get(instance.user_id, 0) + 1
+    adjust_unread_counts(deltas)
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        adjust_unread_counts({instance.user_id: -1})
@@ -1,3 +1,408 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from jobs.models import Job
+from jobs.queue import claim_jobs, run_job
+from orders.models import Order, OrderItem
+from products.models import Product
+from users.models import User
+
+from .broker import DatabaseBroker, get_broker
+from .checks import check_notification_broker
+from .counters import get_unread_count, mark_notifications_read
+from .models import BrokerMessage, Notification, UnreadCounter
+from .retention import prune_notifications
+from .services import (
+    create_notifications, notification_event, notify_order_placed, send_broadcast, send_order_placed,
+)
+
+
+class NotificationTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.buyer = User.objects.create(username='buyer', email='buyer@example.com', is_buyer=True)
+        self.farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+
+    def messages(self, user):
+        return list(Notification.objects.filter(user=user).order_by('id').values_list('kind', 'message'))
+
+
+@override_settings(NOTIFICATION_DIGEST_KINDS=[])
+class FanOutTests(NotificationTestMixin, TestCase):
+    def test_fan_out_inserts_one_batch_at_a_time(self):
+        users = [User.objects.create(username=f'user{n}', email=f'user{n}@example.com') for n in range(5)]
+        with CaptureQueriesContext(connection) as context:
+            stored = create_notifications(((user.pk, 'general', 'Hi') for user in users), batch_size=2)
+        self.assertEqual(stored, 5)
+        inserts = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('INSERT INTO "notifications_notification"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(Notification.objects.filter(message='Hi').count(), 5)
+
+    def test_broadcast_audiences(self):
+        inactive = User.objects.create(username='gone', email='gone@example.com', is_farmer=True, is_active=False)
+        both = User.objects.create(username='both', email='both@example.com', is_farmer=True, is_buyer=True)
+        for audience, expected in (
+            ('farmers', {self.farmer, both}),
+            ('buyers', {self.buyer, both}),
+            ('all', {self.farmer, self.buyer, both}),
+        ):
+            with self.subTest(audience=audience):
+                send_broadcast(f'To {audience}', audience, 'announcement')
+                recipients = {notification.user for notification in
+                              Notification.objects.filter(message=f'To {audience}').select_related('user')}
+                self.assertEqual(recipients, expected)
+        self.assertFalse(Notification.objects.filter(user=inactive).exists())
+
+    def test_broadcast_action_queues_a_job(self):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        self.assertEqual(client.post('/api/notifications/notifications/broadcast/', {'message': 'Hi'}).status_code, 403)
+
+        admin = User.objects.create(username='admin', email='admin@example.com', is_staff=True)
+        client.force_authenticate(admin)
+        url = '/api/notifications/notifications/broadcast/'
+        response = client.post(url, {'message': 'Market day', 'audience': 'farmers'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        job = Job.objects.get(name='notifications.services.send_broadcast')
+        self.assertEqual(job.args, ['Market day', 'farmers', 'announcement'])
+        self.assertEqual(client.post(url, {'message': ' '}, format='json').status_code, 400)
+        self.assertEqual(client.post(url, {'message': 'Hi', 'audience': 'staff'}, format='json').status_code, 400)
+
+    def test_order_placed_notifies_buyer_and_each_farmer(self):
+        other_farmer = User.objects.create(username='other', email='other@example.com', is_farmer=True)
+        carrots = Product.objects.create(name='Carrots', price=2, quantity=9, farmer=self.farmer)
+        beets = Product.objects.create(name='Beets', price=3, quantity=9, farmer=self.farmer)
+        honey = Product.objects.create(name='Honey', price=9, quantity=9, farmer=other_farmer)
+        order = Order.objects.create(buyer=self.buyer, total_price=16)
+        for product, quantity in ((carrots, 2), (beets, 1), (honey, 1)):
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+        send_order_placed(order.pk)
+        self.assertEqual(self.messages(self.buyer), [
+            ('order_placed', f"Your order #{order.pk} was placed. Total: 16.00.")])
+        self.assertEqual(self.messages(self.farmer), [
+            ('product_sold', f"Order #{order.pk} includes your products: 2 x Carrots, 1 x Beets.")])
+        self.assertEqual(self.messages(other_farmer), [
+            ('product_sold', f"Order #{order.pk} includes your products: 1 x Honey.")])
+
+
+@override_settings(NOTIFICATION_DIGEST_KINDS=[])
+class UnreadCountTests(NotificationTestMixin, TestCase):
+    url = '/api/notifications/notifications/'
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        create_notifications([(self.buyer.pk, 'general', f'Note {n}') for n in range(3)])
+        create_notifications([(self.farmer.pk, 'general', 'Theirs')])
+        self.mine = list(Notification.objects.filter(user=self.buyer).order_by('id').values_list('id', flat=True))
+        self.theirs = Notification.objects.get(user=self.farmer).pk
+
+    def unread(self):
+        return self.client.get(f'{self.url}unread-count/').json()['unread']
+
+    def test_unread_count_is_read_from_the_counter(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.unread(), 3)
+
+    def test_mark_all_read(self):
+        response = self.client.post(f'{self.url}mark-all-read/')
+        self.assertEqual(response.json(), {'marked': 3, 'unread': 0})
+        self.assertEqual(self.client.post(f'{self.url}mark-all-read/').json(), {'marked': 0, 'unread': 0})
+        self.assertFalse(Notification.objects.get(pk=self.theirs).is_read)
+
+    def test_mark_read_ignores_other_users_ids(self):
+        response = self.client.post(f'{self.url}mark-read/', {'ids': [self.mine[0], self.theirs]}, format='json')
+        self.assertEqual(response.json(), {'marked': 1, 'unread': 2})
+        # Already read: not counted twice
+        response = self.client.post(f'{self.url}mark-read/', {'ids': [self.mine[0]]}, format='json')
+        self.assertEqual(response.json(), {'marked': 0, 'unread': 2})
+        self.assertFalse(Notification.objects.get(pk=self.theirs).is_read)
+
+    def test_mark_read_validates_ids(self):
+        for ids in (None, [], 'all', ['x'], list(range(1001))):
+            with self.subTest(ids=ids):
+                response = self.client.post(f'{self.url}mark-read/', {'ids': ids}, format='json')
+                self.assertEqual(response.status_code, 400)
+
+    def test_single_saves_and_deletes_keep_the_counter(self):
+        notification = Notification.objects.get(pk=self.mine[0])
+        notification.is_read = True
+        notification.save()
+        self.assertEqual(self.unread(), 2)
+        notification.is_read = False
+        notification.save()
+        self.assertEqual(self.unread(), 3)
+        Notification.objects.create(user=self.buyer, message='One more')
+        self.assertEqual(self.unread(), 4)
+        Notification.objects.get(pk=self.mine[1]).delete()
+        self.assertEqual(self.unread(), 3)
+
+    def test_missing_counter_is_backfilled(self):
+        self.buyer.unread_notification_counter.delete()
+        self.assertEqual(self.unread(), 3)
+        self.assertEqual(UnreadCounter.objects.get(user=self.buyer).count, 3)
+
+    def test_users_only_see_their_own_notifications(self):
+        listed = [notification['id'] for notification in self.client.get(self.url).json()['results']]
+        self.assertEqual(listed, self.mine[::-1])
+        self.assertEqual(self.client.get(f'{self.url}{self.theirs}/').status_code, 404)
+        self.assertEqual(self.client.delete(f'{self.url}{self.theirs}/').status_code, 404)
+
+        admin = User.objects.create(username='admin', email='admin@example.com', is_staff=True)
+        self.client.force_authenticate(admin)
+        listed = {notification['id'] for notification in self.client.get(self.url).json()['results']}
+        self.assertEqual(listed, {*self.mine, self.theirs})
+
+
+class StreamClientMixin:
+    """ Opens the buyer's notification stream and reads it chunk by chunk """
+    url = '/api/notifications/stream/'
+
+    def setUp(self):
+        super().setUp()
+        self.token = str(AccessToken.for_user(self.buyer))
+
+    @asynccontextmanager
+    async def open_stream(self, headers=None):
+        response = await self.async_client.get(self.url, {'token': self.token}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        try:
+            self.assertEqual(await self.next_chunk(stream), 'retry: 5000\n\n')
+            yield stream
+        finally:
+            await stream.aclose()
+
+    async def next_chunk(self, stream):
+        return (await asyncio.wait_for(anext(stream), timeout=2)).decode()
+
+    async def next_event(self, stream):
+        chunk = await self.next_chunk(stream)
+        self.assertTrue(chunk.startswith('id: '), chunk)
+        return json.loads(chunk.split('data: ', 1)[1])
+
+
+# The stream itself is tested with the in-process broker, which delivers
+# synchronously; relaying between processes is covered by BrokerRelayTests
+@override_settings(NOTIFICATION_DIGEST_KINDS=[], NOTIFICATION_STREAM_HEARTBEAT=5, NOTIFICATION_BROKER=None)
+class NotificationStreamTests(StreamClientMixin, NotificationTestMixin, TestCase):
+    async def test_rejects_missing_and_invalid_tokens(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(self.url, {'token': 'not-a-token'})
+        self.assertEqual(response.status_code, 401)
+        body = json.loads(response.content)
+        self.assertEqual(body['code'], 'token_not_valid')
+        self.assertIsInstance(body['messages'], list)
+
+    async def test_replays_every_missed_notification_in_pages(self):
+        await sync_to_async(create_notifications)(
+            [(self.buyer.pk, 'general', f'Note {n}') for n in range(5)] + [(self.farmer.pk, 'general', 'Theirs')])
+        ids = await sync_to_async(list)(
+            Notification.objects.filter(user=self.buyer).order_by('id').values_list('id', flat=True))
+        with mock.patch('notifications.views.STREAM_REPLAY_LIMIT', 2):
+            async with self.open_stream(headers={'Last-Event-ID': str(ids[0])}) as stream:
+                replayed = [(await self.next_event(stream))['id'] for _ in ids[1:]]
+        self.assertEqual(replayed, ids[1:])
+
+    async def test_pushes_published_events(self):
+        async with self.open_stream() as stream:
+            mine = await sync_to_async(Notification.objects.create)(user=self.buyer, message='Hello')
+            theirs = await sync_to_async(Notification.objects.create)(user=self.farmer, message='Not yours')
+            get_broker().publish([(self.farmer.pk, notification_event(theirs)), (self.buyer.pk, notification_event(mine))])
+            event = await self.next_event(stream)
+            self.assertEqual((event['id'], event['message']), (mine.pk, 'Hello'))
+
+    async def test_skips_published_events_already_replayed(self):
+        await sync_to_async(create_notifications)([(self.buyer.pk, 'general', n) for n in ('Old', 'Missed')])
+        old, missed = await sync_to_async(list)(Notification.objects.filter(user=self.buyer).order_by('id'))
+        async with self.open_stream(headers={'Last-Event-ID': str(old.pk)}) as stream:
+            self.assertEqual((await self.next_event(stream))['id'], missed.pk)
+            grown = notification_event(missed) | {'digest_count': 2}
+            get_broker().publish([(self.buyer.pk, notification_event(missed)), (self.buyer.pk, grown)])
+            event = await self.next_event(stream)
+            self.assertEqual((event['id'], event['digest_count']), (missed.pk, 2))
+
+    @override_settings(NOTIFICATION_DIGEST_KINDS=['product_sold'])
+    async def test_resends_digests_that_grew_while_disconnected(self):
+        await sync_to_async(create_notifications)([(self.buyer.pk, 'product_sold', 'Order #1')])
+        await sync_to_async(create_notifications)([(self.buyer.pk, 'general', 'Seen last')])
+        digest, seen = await sync_to_async(list)(Notification.objects.filter(user=self.buyer).order_by('id'))
+        # The digest grows after the client saw both rows, then it reconnects
+        await sync_to_async(create_notifications)([(self.buyer.pk, 'product_sold', 'Order #2')])
+        async with self.open_stream(headers={'Last-Event-ID': str(seen.pk)}) as stream:
+            event = await self.next_event(stream)
+        self.assertEqual((event['id'], event['message'], event['digest_count']), (digest.pk, 'Order #2', 2))
+
+    @override_settings(NOTIFICATION_STREAM_HEARTBEAT=0.01)
+    async def test_sends_heartbeats_while_idle(self):
+        async with self.open_stream() as stream:
+            self.assertEqual(await self.next_chunk(stream), ': keepalive\n\n')
+
+    async def test_ends_a_stream_that_fell_behind(self):
+        async with self.open_stream() as stream:
+            subscription, = get_broker()._subscriptions[self.buyer.pk]
+            get_broker().publish([(self.buyer.pk, {'id': n, 'digest_count': 1})
+                                  for n in range(subscription.queue.maxsize + 1)])
+            with self.assertRaises(StopAsyncIteration):
+                await self.next_chunk(stream)
+            self.assertNotIn(self.buyer.pk, get_broker()._subscriptions)
+
+
+@override_settings(NOTIFICATION_DIGEST_KINDS=['product_sold'], NOTIFICATION_DIGEST_WINDOW=600)
+class DatabaseBrokerTests(TestCase):
+    def test_poll_delivers_each_new_message_once(self):
+        publisher, listener = DatabaseBroker(), DatabaseBroker()
+        publisher.publish([(1, {'id': 1})])
+        listener._listening_since = timezone.now()
+        publisher.publish([(1, {'id': 2}), (2, {'id': 3})])
+        publisher.publish([])
+        with mock.patch.object(listener, 'deliver') as deliver:
+            # Messages from before the listener started are skipped
+            self.assertEqual(listener.poll(), 1)
+            self.assertEqual(listener.poll(), 0)
+        deliver.assert_called_once_with([[1, {'id': 2}], [2, {'id': 3}]])
+
+    def test_old_messages_are_deleted_on_publish(self):
+        broker = DatabaseBroker()
+        broker.publish([(1, {'id': 1})])
+        BrokerMessage.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        broker.publish([(1, {'id': 2})])
+        self.assertEqual(list(BrokerMessage.objects.values_list('events', flat=True)), [[[1, {'id': 2}]]])
+
+    def test_check_requires_a_cross_process_broker_for_worker_tasks(self):
+        with override_settings(NOTIFICATION_BROKER=None, BACKGROUND_TASKS_EAGER=False):
+            self.assertEqual([error.id for error in check_notification_broker(None)], ['notifications.E001'])
+        with override_settings(NOTIFICATION_BROKER=None, BACKGROUND_TASKS_EAGER=True):
+            self.assertEqual(check_notification_broker(None), [])
+        with override_settings(NOTIFICATION_BROKER='notifications.broker.DatabaseBroker',
+                               BACKGROUND_TASKS_EAGER=False):
+            self.assertEqual(check_notification_broker(None), [])
+
+
+@override_settings(NOTIFICATION_DIGEST_KINDS=[], NOTIFICATION_STREAM_HEARTBEAT=5,
+                   NOTIFICATION_BROKER='notifications.broker.DatabaseBroker',
+                   NOTIFICATION_BROKER_POLL_INTERVAL=0.05, BACKGROUND_TASKS_EAGER=False)
+class BrokerRelayTests(StreamClientMixin, NotificationTestMixin, TransactionTestCase):
+    # The broker's listener thread only sees committed rows
+
+    async def test_events_from_a_worker_job_reach_open_streams(self):
+        order = await sync_to_async(Order.objects.create)(buyer=self.buyer, total_price=4)
+        await sync_to_async(notify_order_placed)(order.pk)
+        async with self.open_stream() as stream:
+            # run_worker is another process, with a broker of its own
+            with mock.patch('notifications.services.get_broker', return_value=DatabaseBroker()):
+                job, = await sync_to_async(claim_jobs)('worker-1', 1)
+                self.assertEqual(job.name, 'notifications.services.send_order_placed')
+                self.assertTrue(await sync_to_async(run_job)(job))
+            event = await self.next_event(stream)
+        self.assertEqual((event['kind'], event['message']),
+                         ('order_placed', f"Your order #{order.pk} was placed. Total: 4.00."))
+
+
+class DigestTests(NotificationTestMixin, TestCase):
+    def sold(self, *messages):
+        create_notifications([(self.farmer.pk, 'product_sold', message) for message in messages])
+
+    def digests(self):
+        return list(Notification.objects.filter(user=self.farmer).order_by('id').values_list(
+            'message', 'digest_count'))
+
+    def test_events_in_one_batch_are_merged(self):
+        self.sold('Order #1', 'Order #2', 'Order #3')
+        create_notifications([(self.farmer.pk, 'general', 'Hi'), (self.farmer.pk, 'general', 'Hi again')])
+        self.assertEqual(self.digests(), [('Order #3', 3), ('Hi', 1), ('Hi again', 1)])
+        self.assertEqual(get_unread_count(self.farmer.pk), 3)
+
+    def test_events_merge_into_an_open_digest(self):
+        self.sold('Order #1')
+        self.sold('Order #2', 'Order #3')
+        self.assertEqual(self.digests(), [('Order #3', 3)])
+        # Merging adds no unread notification
+        self.assertEqual(get_unread_count(self.farmer.pk), 1)
+        # Other users' digests are separate
+        create_notifications([(self.buyer.pk, 'product_sold', 'Order #4')])
+        self.assertEqual(self.digests(), [('Order #3', 3)])
+
+    def test_expired_window_starts_a_new_digest(self):
+        self.sold('Order #1')
+        Notification.objects.update(created_at=timezone.now() - timedelta(seconds=601))
+        self.sold('Order #2')
+        self.assertEqual(self.digests(), [('Order #1', 1), ('Order #2', 1)])
+        self.assertEqual(get_unread_count(self.farmer.pk), 2)
+
+    def test_read_digest_is_not_reopened(self):
+        self.sold('Order #1')
+        mark_notifications_read(self.farmer.pk)
+        self.sold('Order #2')
+        self.assertEqual(self.digests(), [('Order #1', 1), ('Order #2', 1)])
+        self.assertEqual(get_unread_count(self.farmer.pk), 1)
+
+    def test_digest_read_during_the_merge_gets_a_new_row(self):
+        self.sold('Order #1')
+        digest = Notification.objects.get(user=self.farmer)
+        real_update = QuerySet.update
+
+        def read_before_merging(queryset, **kwargs):
+            if 'digest_count' in kwargs:
+                # Read between the SELECT of open digests and their UPDATE
+                mark_notifications_read(self.farmer.pk, [digest.pk])
+            return real_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=read_before_merging):
+            self.sold('Order #2')
+        self.assertEqual(self.digests(), [('Order #1', 1), ('Order #2', 1)])
+        self.assertEqual(get_unread_count(self.farmer.pk), 1)
+
+
+class PruneNotificationsTests(NotificationTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        old = timezone.now() - timedelta(days=91)
+        create_notifications([(self.buyer.pk, 'general', f'Note {n}') for n in range(5)])
+        notifications = list(Notification.objects.order_by('id'))
+        self.old_read = [notification.pk for notification in notifications[:3]]
+        self.old_unread, self.recent_read = notifications[3].pk, notifications[4].pk
+        Notification.objects.filter(pk__in=[*self.old_read, self.old_unread]).update(created_at=old)
+        mark_notifications_read(self.buyer.pk, [*self.old_read, self.recent_read])
+
+    def test_archives_then_deletes_old_read_rows(self):
+        archive = io.StringIO()
+        self.assertEqual(prune_notifications(batch_size=2, archive=archive), 3)
+        archived = [json.loads(line) for line in archive.getvalue().splitlines()]
+        self.assertEqual([row['id'] for row in archived], self.old_read)
+        self.assertEqual(archived[0]['message'], 'Note 0')
+        self.assertEqual(set(Notification.objects.values_list('id', flat=True)), {self.old_unread, self.recent_read})
+
+    def test_unread_rows_are_kept_whatever_their_age(self):
+        prune_notifications(days=0)
+        self.assertEqual(list(Notification.objects.values_list('id', flat=True)), [self.old_unread])
+        self.assertEqual(get_unread_count(self.buyer.pk), 1)
+
+    def test_nothing_is_deleted_when_archiving_fails(self):
+        archive = mock.Mock(write=mock.Mock(side_effect=OSError('disk full')))
+        with self.assertRaises(OSError):
+            prune_notifications(archive=archive)
+        self.assertEqual(Notification.objects.count(), 5)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('prune_notifications', '--days', '30', stdout=out)
+        self.assertIn('Deleted 3 notifications.', out.getvalue())
@@ -1,7 +1,163 @@
-from rest_framework import viewsets
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.response import Response
 from .models import Notification
 from .serializers import NotificationSerializer
+from .broker import get_broker
+from .counters import get_unread_count, mark_notifications_read
+from .services import AUDIENCES, broadcast, grown_digests, notification_event
+from users.authentication import CachedJWTAuthentication
+
+# Notifications read per query when replaying to a reconnecting stream
+STREAM_REPLAY_LIMIT = 100
+# Ids accepted by one mark-read request
+MARK_READ_MAX_IDS = 1000
 
 class NotificationViewSet(viewsets.ModelViewSet):
-    queryset = Notification.objects.all()
-    serializer_class = NotificationSerializer
\ No newline at end of file
+    queryset = Notification.objects.order_by('-created_at', '-id')
+    serializer_class = NotificationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        """ Users see their own notifications; staff see everyone's """
+        queryset = super().get_queryset()
+        if self.request.user.is_staff:
+            return queryset
+        # Served by the (user, is_read, created_at) index
+        return queryset.filter(user=self.request.user)
+
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        """ The badge count, read from the user's counter rather than counted """
+        return Response({'unread': get_unread_count(request.user.pk)})
+
+    @action(detail=False, methods=['post'], url_path='mark-all-read')
+    def mark_all_read(self, request):
+        marked = mark_notifications_read(request.user.pk)
+        return Response({'marked': marked, 'unread': get_unread_count(request.user.pk)})
+
+    @action(detail=False, methods=['post'], url_path='mark-read')
+    def mark_read(self, request):
+        """ Mark the notifications in ``ids`` read; ids of other users' are ignored """
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            raise ValidationError({'ids': 'Expected a non-empty list of notification ids.'})
+        if len(ids) > MARK_READ_MAX_IDS:
+            raise ValidationError({'ids': f'At most {MARK_READ_MAX_IDS} ids per request.'})
+        try:
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            raise ValidationError({'ids': 'Expected a non-empty list of notification ids.'})
+        marked = mark_notifications_read(request.user.pk, ids)
+        return Response({'marked': marked, 'unread': get_unread_count(request.user.pk)})
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def broadcast(self, request):
+        """
+        Send ``message`` to every user in ``audience`` (all, farmers or
+        buyers). The notifications are written in the background, so this
+        returns 202 straight away however many users there are.
+        """
+        message = str(request.data.get('message') or '').strip()
+        audience = request.data.get('audience', 'all')
+        if not message:
+            raise ValidationError({'message': 'This field is required.'})
+        if audience not in AUDIENCES:
+            raise ValidationError({'audience': f"Expected one of {', '.join(AUDIENCES)}."})
+        broadcast(message, audience=audience)
+        return Response({'status': 'queued', 'audience': audience}, status=status.HTTP_202_ACCEPTED)
+
+
+
+def _authenticate_stream(request):
+    """
+    The user of a stream request. EventSource can't send headers, so the
+    access token may also come as ``?token=``.
+    """
+    authentication = CachedJWTAuthentication()
+    raw_token = request.GET.get('token')
+    if raw_token:
+        return authentication.get_user(authentication.get_validated_token(raw_token.encode()))
+    result = authentication.authenticate(request)
+    return result[0] if result else None
+
+
+def _format_event(event):
+    return f"id: {event['id']}\nevent: notification\ndata: {json.dumps(event)}\n\n"
+
+
+async def notification_stream(request):
+    """
+    Server-Sent Events stream of the user's new notifications.
+
+    Serve under ASGI: an idle stream is one parked coroutine and a small
+    queue, fed by the broker when notifications are created; no connection
+    polls the database (DatabaseBroker reads once per process). A comment line goes out every
+    ``NOTIFICATION_STREAM_HEARTBEAT`` seconds so proxies keep it open. A
+    reconnecting client (``Last-Event-ID``) first gets what it missed. A
+    digest that grows is sent again under the same id, so on reconnect the
+    digests that may have grown since are re-sent too (see grown_digests).
+    """
+    try:
+        user = await sync_to_async(_authenticate_stream)(request)
+    except AuthenticationFailed as e:
+        # The body DRF's exception handler would give, e.g. simplejwt's code and messages
+        return JsonResponse(e.detail if isinstance(e.detail, (dict, list)) else {'detail': e.detail},
+                            status=401, safe=False)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.GET.get('last_event_id') or 0)
+    except ValueError:
+        last_id = 0
+    heartbeat = getattr(settings, 'NOTIFICATION_STREAM_HEARTBEAT', 15)
+
+    async def events():
+        broker = get_broker()
+        # Subscribe before reading missed rows so nothing falls in between
+        subscription = broker.subscribe(user.pk)
+        replayed = {}  # id -> digest_count of rows sent from the database
+        try:
+            yield "retry: 5000\n\n"
+            if last_id:
+                # Digests already sent may have grown under their old id;
+                # send them first so the last id the client sees is the newest
+                grown = await sync_to_async(lambda: list(grown_digests(user.pk, last_id)))()
+                for notification in grown:
+                    replayed[notification.pk] = notification.digest_count
+                    yield _format_event(notification_event(notification))
+            # Page through everything missed; events published meanwhile
+            # wait in the subscription
+            after = last_id
+            while after:
+                missed = await sync_to_async(list)(
+                    Notification.objects.filter(user_id=user.pk, id__gt=after).order_by('id')[:STREAM_REPLAY_LIMIT])
+                for notification in missed:
+                    replayed[notification.pk] = notification.digest_count
+                    yield _format_event(notification_event(notification))
+                after = missed[-1].pk if len(missed) == STREAM_REPLAY_LIMIT else None
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    return  # fell behind; the client reconnects and catches up
+                if replayed.get(event['id'], 0) >= event['digest_count']:
+                    continue  # already sent by the replay
+                yield _format_event(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
@@ -0,0 +1,72 @@
+import time
+
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from logistics.models import Delivery
+from orders.models import Order, OrderItem
+from orders.serializers import OrderSerializer
+from payments.models import Payment
+from products.models import Product
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the order read path (queries and time per order) for orders "
+        "with 1, 10 and 100 items. Fixture rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=20, help="Orders per item count.")
+        parser.add_argument('--items', type=int, nargs='+', default=[1, 10, 100])
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs; the best is reported.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        farmer = User.objects.create(username='bench-farmer', email='bench-farmer@example.com', is_farmer=True)
+        products = Product.objects.bulk_create(
+            Product(name=f'Bench product {i}', description='Benchmark', price=1, quantity=10 ** 6, farmer=farmer)
+            for i in range(max(options['items']))
+        )
+        request = RequestFactory().get('/api/orders/orders/')
+
+        self.stdout.write(f"{'items':>6} {'orders':>7} {'queries':>8} {'ms/order':>10}")
+        for item_count in options['items']:
+            buyer = User.objects.create(
+                username=f'bench-buyer-{item_count}', email=f'bench-buyer-{item_count}@example.com')
+            orders = Order.objects.bulk_create(
+                Order(buyer=buyer, total_price=item_count) for _ in range(options['orders']))
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product=product, quantity=1, price=1)
+                for order in orders for product in products[:item_count]
+            )
+            Delivery.objects.bulk_create(Delivery(order=order, delivery_address='Bench road') for order in orders)
+            Payment.objects.bulk_create(Payment(order=order, amount=item_count) for order in orders)
+
+            queryset = OrderSerializer.setup_eager_loading(Order.objects.filter(buyer=buyer).order_by('-created_at', '-id'))
+            best = None
+            for _ in range(options['repeat']):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    OrderSerializer(queryset.all(), many=True, context={'request': request}).data
+                    elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+
+            self.stdout.write(
+                f"{item_count:>6} {len(orders):>7} {len(queries.captured_queries):>8} "
+                f"{best * 1000 / len(orders):>10.3f}"
+            )
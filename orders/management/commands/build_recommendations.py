@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from orders.recommendations import build_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the \"customers who bought this also bought\" lists from the "
+        "orders placed since the last run. Schedule it, e.g. every few minutes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help="Rebuild every list from all orders (needed after orders are deleted).")
+
+    def handle(self, *args, **options):
+        rebuilt = build_recommendations(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the recommendations of {rebuilt} products."))
@@ -9,6 +9,13 @@ class Order(models.Model):
     status = models.CharField(max_length=50, default='Pending')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Keyset pagination walks orders newest first, per buyer or overall
+        indexes = [
+            models.Index(fields=['buyer', 'created_at', 'id'], name='order_buyer_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+        ]
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -0,0 +1,125 @@
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Product, ProductRecommendation, RecommendationState
+
+from .models import OrderItem
+
+
+def co_purchase_counts(order_ids, product_ids, only_products=None):
+    """
+    Count, for every pair of distinct products, the orders containing both.
+
+    ``order_ids``/``product_ids`` are parallel arrays of order lines. This is
+    the sparse product of the order x product incidence matrix with its own
+    transpose, done with array operations: every order of n products
+    expands to its n*(n-1) ordered pairs, and identical pairs are counted
+    with ``np.unique``. ``only_products`` limits the left-hand product of
+    each pair, for incremental updates.
+
+    Returns ``(products, others, counts)`` arrays.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if not len(order_ids):
+        return empty, empty, empty
+    # One line per (order, product), grouped by order
+    lines = np.unique(np.stack([order_ids, product_ids], axis=1), axis=0)
+    orders, products = lines[:, 0], lines[:, 1]
+    _, starts, sizes = np.unique(orders, return_index=True, return_counts=True)
+
+    # Each order line becomes the left side of one pair per line in its order
+    line_starts = np.repeat(starts, sizes)
+    line_sizes = np.repeat(sizes, sizes)
+    selected = line_sizes > 1
+    if only_products is not None:
+        selected &= np.isin(products, only_products)
+    left_lines = np.flatnonzero(selected)
+    if not len(left_lines):
+        return empty, empty, empty
+    repeats = line_sizes[left_lines]
+    left = np.repeat(products[left_lines], repeats)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    right = products[np.repeat(line_starts[left_lines], repeats) + offsets]
+    distinct = left != right
+
+    pairs, counts = np.unique(np.stack([left[distinct], right[distinct]], axis=1), axis=0, return_counts=True)
+    return pairs[:, 0], pairs[:, 1], counts
+
+
+def top_neighbours(products, others, counts, k):
+    """ Keep each product's ``k`` highest counts; returns the arrays plus ranks """
+    order = np.lexsort((others, -counts, products))
+    products, others, counts = products[order], others[order], counts[order]
+    _, starts, sizes = np.unique(products, return_index=True, return_counts=True)
+    ranks = np.arange(len(products)) - np.repeat(starts, sizes)
+    keep = ranks < k
+    return products[keep], others[keep], counts[keep], ranks[keep]
+
+
+def build_recommendations(full=False, batch_size=1000):
+    """
+    Bring ProductRecommendation up to date with the orders.
+
+    Incremental runs read only the orders created since the last run. Only
+    the products in those orders have new co-purchase counts. Their lists
+    are recomputed exactly from every order containing them. ``full``
+    rebuilds every list from all orders, e.g. after orders were deleted.
+
+    Orders are counted once they are ``RECOMMENDATIONS_ORDER_LAG`` seconds
+    old. Ids and created_at are assigned at INSERT but become visible at
+    COMMIT, so a watermark on the newest visible order would skip one whose
+    transaction was still open; waiting out the lag covers any checkout
+    that commits within it.
+
+    Returns the number of products whose list was rebuilt.
+    """
+    top_k = getattr(settings, 'RECOMMENDATIONS_TOP_K', 10)
+    lag = timedelta(seconds=getattr(settings, 'RECOMMENDATIONS_ORDER_LAG', 300))
+    state, _ = RecommendationState.objects.get_or_create(pk=1)
+    built_through = timezone.now() - lag
+    counted_lines = OrderItem.objects.filter(order__created_at__lt=built_through)
+
+    if full or state.built_through is None:
+        affected = None
+        lines = counted_lines
+    else:
+        if built_through <= state.built_through:
+            return 0
+        new_lines = counted_lines.filter(order__created_at__gte=state.built_through)
+        affected = np.unique(np.array(list(new_lines.values_list('product_id', flat=True)), dtype=np.int64))
+        # Every order, old or new, that contains one of the affected products
+        lines = counted_lines.filter(
+            order__in=OrderItem.objects.filter(product__in=new_lines.values('product_id')).values('order_id'),
+        )
+
+    order_lines = np.array(list(lines.values_list('order_id', 'product_id')), dtype=np.int64).reshape(-1, 2)
+    products, others, counts = co_purchase_counts(order_lines[:, 0], order_lines[:, 1], only_products=affected)
+    products, others, counts, ranks = top_neighbours(products, others, counts, top_k)
+
+    # Skip products deleted since the order lines were read
+    candidates = np.union1d(products, others).tolist()
+    existing = set()
+    for start in range(0, len(candidates), batch_size):
+        existing.update(Product.objects.filter(
+            pk__in=candidates[start:start + batch_size]).values_list('id', flat=True))
+    rows = [
+        ProductRecommendation(product_id=product, recommended_id=other, score=count, rank=rank)
+        for product, other, count, rank in zip(products.tolist(), others.tolist(), counts.tolist(), ranks.tolist())
+        if product in existing and other in existing
+    ]
+    with transaction.atomic():
+        if affected is None:
+            ProductRecommendation.objects.all().delete()
+        else:
+            for start in range(0, len(affected), batch_size):
+                ProductRecommendation.objects.filter(
+                    product_id__in=affected[start:start + batch_size].tolist()).delete()
+        ProductRecommendation.objects.bulk_create(rows, batch_size=batch_size)
+        state.built_through = built_through
+        state.built_at = timezone.now()
+        state.save()
+    return len(np.unique(products)) if affected is None else len(affected)
@@ -1,8 +1,12 @@
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import Order, OrderItem
 from products.models import Product  # Import Product
+from products.inventory import InsufficientStock, reserve_stock
 from logistics.models import Delivery  # Import Delivery
 from payments.models import Payment  # Import Payment
+from notifications.services import notify_order_placed
 # You might need serializers for these related models too
 from products.serializers import ProductSerializer  # Assuming you have this
 from logistics.serializers import DeliverySerializer  # Create this if needed
@@ -26,6 +30,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         # Make price read_only if it's set based on the Product during creation
         # Price should be set based on Product at time of order creation
         read_only_fields = ['price']
+        extra_kwargs = {'quantity': {'min_value': 1}}
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -42,10 +47,11 @@ class OrderSerializer(serializers.ModelSerializer):
     # Assuming OneToOneFields named 'delivery' and 'payment' exist pointing TO Order
     # If they point FROM Order, the source might just be 'delivery'/'payment'
     # Check your Delivery/Payment models for related_name if needed
+    # allow_null renders a missing Delivery/Payment as None
     delivery = DeliverySerializer(
-        read_only=True, required=False)  # Make optional
+        read_only=True, allow_null=True)
     payment = PaymentSerializer(
-        read_only=True, required=False)  # Make optional
+        read_only=True, allow_null=True)
     buyer_details = UserSerializer(
         source='buyer', read_only=True)  # Show buyer info
 
@@ -66,6 +72,14 @@ class OrderSerializer(serializers.ModelSerializer):
         # Let backend calculate total, set buyer/status
         read_only_fields = ['buyer', 'status', 'total_price']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """ Load everything the read path nests, so each order serializes from memory """
+        items = OrderItem.objects.select_related('product__farmer', 'product__category')
+        return queryset.select_related('buyer', 'delivery', 'payment').prefetch_related(
+            Prefetch('orderitem_set', queryset=items))
+
+    @transaction.atomic
     def create(self, validated_data):
         # 1. Extract nested item data and delivery address
         order_items_data = validated_data.pop('order_items')
@@ -86,10 +100,16 @@ class OrderSerializer(serializers.ModelSerializer):
             # Add the calculated price back to item_data for OrderItem creation
             item_data['price'] = price
 
-            # Optional: Stock check
-            if product.quantity < quantity:
-                raise serializers.ValidationError(
-                    f"Not enough stock for {product.name}. Available: {product.quantity}")
+        # Reserve stock for every line in one conditional UPDATE; if any line
+        # is short nothing is decremented and the order is rejected
+        try:
+            reserve_stock(
+                (item_data['product'].pk, item_data['quantity']) for item_data in order_items_data)
+        except InsufficientStock as e:
+            raise serializers.ValidationError([
+                f"Not enough stock for {product.name if product else 'a removed product'}. Available: {available}"
+                for product, requested, available in e.shortages
+            ] or "Not enough stock for this order.")
 
         # 3. Create the Order instance
         order = Order.objects.create(
@@ -114,9 +134,6 @@ class OrderSerializer(serializers.ModelSerializer):
                     price=price
                 )
             )
-            # Optional: Decrease product stock
-            product.quantity -= quantity
-            product.save()
 
         OrderItem.objects.bulk_create(order_items_to_create)
 
@@ -135,27 +152,7 @@ class OrderSerializer(serializers.ModelSerializer):
             # transaction_id might be added later after actual payment
         )
 
-        return order
-
-    def to_representation(self, instance):
-        """ Ensure related objects are fetched efficiently and included """
-        representation = super().to_representation(instance)
-        # Ensure buyer details are included correctly if needed beyond just ID
-        # representation['buyer_details'] = UserSerializer(instance.buyer).data
-        # Ensure items are present
-        representation['items'] = OrderItemSerializer(
-            instance.orderitem_set.all(), many=True).data
+        # Buyer and farmers hear about it once the order is committed
+        notify_order_placed(order.pk)
 
-        # Add related delivery and payment if they exist
-        try:
-            representation['delivery'] = DeliverySerializer(
-                instance.delivery).data
-        except Delivery.DoesNotExist:
-            representation['delivery'] = None
-        try:
-            representation['payment'] = PaymentSerializer(
-                instance.payment).data
-        except Payment.DoesNotExist:
-            representation['payment'] = None
-
-        return representation
+        return order
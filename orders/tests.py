@@ -1,3 +1,141 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from agro_ecommerce.testing import QueryBudgetMixin
+from logistics.models import Delivery
+from payments.models import Payment
+from products.models import Product, ProductRecommendation
+from users.models import User
+from .models import Order, OrderItem
+from .recommendations import build_recommendations, co_purchase_counts
+
+
+class OrderListQueryTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.buyer = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='secret', is_buyer=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def add_orders(self, count):
+        for _ in range(count):
+            n = Order.objects.count()
+            farmer = User.objects.create(
+                username=f'farmer{n}', email=f'farmer{n}@example.com', is_farmer=True)
+            product = Product.objects.create(
+                name=f'Product {n}', description='Fresh', price=3, quantity=10, farmer=farmer)
+            order = Order.objects.create(buyer=self.buyer, total_price=6)
+            OrderItem.objects.create(order=order, product=product, quantity=2, price=3)
+            Delivery.objects.create(order=order, delivery_address='Farm road')
+            Payment.objects.create(order=order, amount=6)
+
+    def test_list_query_count_is_independent_of_rows(self):
+        def request():
+            response = self.client.get('/api/orders/orders/', {'page_size': 50})
+            self.assertEqual(response.status_code, 200)
+
+        self.assertQueryCountConstant(self.add_orders, request, sizes=(1, 10))
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.buyer = User.objects.create(username='buyer', email='buyer@example.com', is_buyer=True)
+        farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        self.carrots, self.beets, self.onions, self.honey = (
+            Product.objects.create(name=name, price=2, quantity=50, farmer=farmer)
+            for name in ('Carrots', 'Beets', 'Onions', 'Honey'))
+        self.now = timezone.now()
+
+    def order(self, *products, age=timedelta(hours=1), **fields):
+        order = Order.objects.create(buyer=self.buyer, total_price=2 * len(products), **fields)
+        # created_at is auto_now_add; backdate it past RECOMMENDATIONS_ORDER_LAG
+        Order.objects.filter(pk=order.pk).update(created_at=self.now - age)
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=2)
+        return order
+
+    def build(self, at=None, **kwargs):
+        with mock.patch('orders.recommendations.timezone.now', return_value=at or self.now):
+            return build_recommendations(**kwargs)
+
+    def recommended(self, product):
+        return list(ProductRecommendation.objects.filter(product=product).order_by('rank').values_list(
+            'recommended__name', 'score'))
+
+    def test_co_purchase_counts(self):
+        orders = np.array([1, 1, 1, 2, 2, 3], dtype=np.int64)
+        products = np.array([10, 20, 30, 10, 20, 10], dtype=np.int64)
+        pairs = co_purchase_counts(orders, products)
+        self.assertEqual(sorted(zip(*(array.tolist() for array in pairs))), [
+            (10, 20, 2), (10, 30, 1), (20, 10, 2), (20, 30, 1), (30, 10, 1), (30, 20, 1)])
+        only = co_purchase_counts(orders, products, only_products=[30])
+        self.assertEqual(sorted(zip(*(array.tolist() for array in only))), [(30, 10, 1), (30, 20, 1)])
+
+    def test_lists_rank_by_orders_in_common(self):
+        self.order(self.carrots, self.beets)
+        self.order(self.carrots, self.beets, self.onions)
+        self.order(self.honey)
+        self.assertEqual(self.build(), 3)
+        self.assertEqual(self.recommended(self.carrots), [('Beets', 2), ('Onions', 1)])
+        self.assertEqual(self.recommended(self.honey), [])
+
+    def test_incremental_run_updates_affected_products_only(self):
+        self.order(self.carrots, self.beets)
+        self.order(self.onions, self.honey)
+        self.build()
+        self.order(self.carrots, self.onions, age=timedelta(minutes=1))
+        later = self.now + timedelta(minutes=10)
+        self.assertEqual(self.build(at=later), 2)
+        self.assertEqual(self.recommended(self.carrots), [('Beets', 1), ('Onions', 1)])
+        self.assertEqual(self.recommended(self.onions), [('Carrots', 1), ('Honey', 1)])
+        self.assertEqual(self.build(at=later), 0)
+
+    def test_orders_within_the_lag_wait_for_a_later_run(self):
+        self.order(self.carrots, self.beets, age=timedelta(seconds=10))
+        self.build()
+        self.assertEqual(self.recommended(self.carrots), [])
+        self.build(at=self.now + timedelta(minutes=10))
+        self.assertEqual(self.recommended(self.carrots), [('Beets', 1)])
+
+    def test_late_committing_order_with_a_lower_id_is_counted(self):
+        self.order(self.carrots, self.beets, id=100)
+        self.build()
+        # Created before the run, by a transaction that committed after it
+        self.order(self.carrots, self.onions, id=50, age=timedelta(seconds=10))
+        self.build(at=self.now + timedelta(minutes=10))
+        self.assertEqual(self.recommended(self.carrots), [('Beets', 1), ('Onions', 1)])
+
+    def test_full_rebuild_forgets_deleted_orders(self):
+        order = self.order(self.carrots, self.beets)
+        self.build()
+        order.delete()
+        self.build(full=True)
+        self.assertFalse(ProductRecommendation.objects.exists())
+
+    def test_command_reports_rebuilt_products(self):
+        self.order(self.carrots, self.beets)
+        out = StringIO()
+        with mock.patch('orders.recommendations.timezone.now', return_value=self.now):
+            call_command('build_recommendations', '--full', stdout=out)
+        self.assertIn('Rebuilt the recommendations of 2 products.', out.getvalue())
 
-# Create your tests here.
+    def test_recommendations_action(self):
+        self.order(self.carrots, self.beets)
+        self.order(self.carrots, self.beets, self.onions)
+        self.build()
+        client = APIClient()
+        url = f'/api/products/products/{self.carrots.pk}/recommendations/'
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['name'] for product in response.json()], ['Beets', 'Onions'])
+        self.assertEqual([product['name'] for product in client.get(url, {'limit': 1}).json()], ['Beets'])
+        self.assertEqual(client.get(url, {'limit': 'x'}).status_code, 400)
+        self.assertEqual(client.get(f'/api/products/products/{self.honey.pk}/recommendations/').json(), [])
+        self.assertEqual(client.get('/api/products/products/999999/recommendations/').status_code, 404)
@@ -2,6 +2,7 @@ from rest_framework import viewsets, permissions # Add permissions
 from rest_framework.response import Response
 from rest_framework import status
 from django.db import transaction # Import transaction
+from idempotency.decorators import idempotent
 from .models import Order, OrderItem
 from .serializers import OrderSerializer, OrderItemSerializer
 
@@ -13,8 +14,11 @@ class OrderViewSet(viewsets.ModelViewSet):
         """ Filter orders to only show the logged-in user's orders """
         # Allow staff/admin to see all (optional)
         if self.request.user.is_staff:
-            return Order.objects.all().select_related('buyer', 'delivery', 'payment').prefetch_related('orderitem_set__product')
-        return Order.objects.filter(buyer=self.request.user).select_related('buyer', 'delivery', 'payment').prefetch_related('orderitem_set__product') # Efficiently fetch related data
+            queryset = Order.objects.all()
+        else:
+            queryset = Order.objects.filter(buyer=self.request.user)
+        # Newest first; keyset pagination uses the (buyer, created_at, id) index
+        return OrderSerializer.setup_eager_loading(queryset.order_by('-created_at', '-id')) # Efficiently fetch related data
 
     def get_serializer_context(self):
         """ Add request to the serializer context """
@@ -24,13 +28,19 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     # The default create/perform_create is now handled by the serializer's create method
     # But you could wrap it in a transaction here if preferred
+    # Retries carrying the same Idempotency-Key replay the first response
+    @idempotent
     @transaction.atomic # Ensure all creations succeed or fail together
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer) # Calls serializer.save() which calls serializer.create()
-        headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        # Re-read the new order through the eager-loading queryset so the
+        # response does not fetch each item's product separately
+        order = self.get_queryset().get(pk=serializer.instance.pk)
+        data = self.get_serializer(order).data
+        headers = self.get_success_headers(data)
+        return Response(data, status=status.HTTP_201_CREATED, headers=headers)
 
     # perform_create now just calls save, which triggers the serializer's create
     def perform_create(self, serializer):
@@ -48,6 +58,6 @@ class OrderItemViewSet(viewsets.ModelViewSet):
         """ Optionally filter items based on user's orders """
         user = self.request.user
         if user.is_staff:
-            return OrderItem.objects.all().select_related('order', 'product')
+            return OrderItem.objects.all().select_related('order', 'product__farmer')
         # Filter items belonging to orders owned by the current user
-        return OrderItem.objects.filter(order__buyer=user).select_related('order', 'product')
\ No newline at end of file
+        return OrderItem.objects.filter(order__buyer=user).select_related('order', 'product__farmer')
\ No newline at end of file
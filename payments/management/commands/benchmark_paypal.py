@@ -0,0 +1,59 @@
+import statistics
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+
+from payments.paypal import PayPalClient
+from payments.testing import FakePayPalServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare PayPal call latency against a local fake PayPal server: a fresh "
+        "connection and token per call versus the pooled, token-caching PayPalClient."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.005,
+                            help="Simulated server latency per request, in seconds.")
+
+    def handle(self, *args, **options):
+        with FakePayPalServer(latency=options['latency']) as server:
+            self.stdout.write(f"{'mode':<10} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'tokens':>7} {'conns':>6}")
+            self.report('unpooled', server, self.run_unpooled, options['calls'])
+            self.report('client', server, self.run_client, options['calls'])
+
+    def report(self, label, server, run, calls):
+        tokens, connections = server.calls['token'], server.connections
+        timings = sorted(run(server, calls))
+        self.stdout.write(
+            f"{label:<10} {statistics.mean(timings) * 1000:>8.2f} "
+            f"{timings[len(timings) // 2] * 1000:>8.2f} {timings[int(len(timings) * 0.95)] * 1000:>8.2f} "
+            f"{server.calls['token'] - tokens:>7} {server.connections - connections:>6}"
+        )
+
+    def run_unpooled(self, server, calls):
+        # What every request did before PayPalClient: module-level requests.post,
+        # so a new connection (and here, a new token) for each call.
+        timings = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            token = requests.post(
+                f"{server.base_url}/v1/oauth2/token", auth=(server.client_id, server.client_secret),
+                data={'grant_type': 'client_credentials'}).json()['access_token']
+            requests.post(
+                f"{server.base_url}/v2/checkout/orders", json={'intent': 'CAPTURE'},
+                headers={'Authorization': f"Bearer {token}"}).raise_for_status()
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    def run_client(self, server, calls):
+        client = PayPalClient(server.client_id, server.client_secret, server.base_url)
+        timings = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            client.create_order({'intent': 'CAPTURE'})
+            timings.append(time.perf_counter() - started)
+        return timings
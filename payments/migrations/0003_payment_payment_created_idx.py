@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_order_buyer_created_idx_and_more'),
+        ('payments', '0002_payment_payment_method_payment_paypal_order_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['created_at', 'id'], name='payment_created_idx'),
+        ),
+    ]
@@ -24,6 +24,11 @@ class Payment(models.Model):
     paypal_order_id = models.CharField(max_length=100, blank=True, null=True) # ID from PayPal create order call
     paypal_payment_id = models.CharField(max_length=100, blank=True, null=True) # ID from PayPal capture call (can be same as transaction_id)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='payment_created_idx'),
+        ]
+
     def __str__(self):
         return f"Payment for Order {self.order.id} - {self.status}"
 
@@ -0,0 +1,132 @@
+import threading
+import time
+import uuid
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class PayPalClient:
+    """
+    Thin client for the PayPal REST API.
+
+    * Client credentials are exchanged for an OAuth bearer token, which is
+      cached until shortly before it expires and shared between threads.
+    * All calls go through one ``requests.Session``, so TLS connections are
+      pooled and kept alive between requests.
+    * Every call has a timeout. Connection errors and 429/5xx responses are
+      retried with backoff; POSTs carry a ``PayPal-Request-Id`` so PayPal
+      treats a retried call as the same request.
+
+    Failed calls raise ``requests.HTTPError`` (with ``.response`` set) or
+    another ``requests.RequestException``.
+    """
+
+    # Refresh the token this many seconds before PayPal says it expires
+    token_refresh_margin = 60
+
+    def __init__(self, client_id, client_secret, base_url, timeout=(3.05, 20),
+                 max_retries=2, pool_size=10, backoff_factor=0.3):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._token = None
+        self._token_expires_at = 0
+        self._token_lock = threading.Lock()
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,  # a read timeout may mean PayPal already acted; surface it
+            status=max_retries,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'GET', 'POST'}),
+            backoff_factor=backoff_factor,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get_access_token(self, force_refresh=False):
+        with self._token_lock:
+            if force_refresh or not self._token or time.monotonic() >= self._token_expires_at:
+                response = self.session.post(
+                    f"{self.base_url}/v1/oauth2/token",
+                    auth=(self.client_id, self.client_secret),
+                    data={'grant_type': 'client_credentials'},
+                    headers={'Accept': 'application/json'},
+                    timeout=self.timeout,
+                )
+                response.raise_for_status()
+                token_data = response.json()
+                expires_in = int(token_data.get('expires_in', 0))
+                self._token = token_data['access_token']
+                self._token_expires_at = time.monotonic() + max(expires_in - self.token_refresh_margin, 0)
+            return self._token
+
+    def request(self, method, path, json=None, request_id=None):
+        headers = {'Content-Type': 'application/json'}
+        if method.upper() == 'POST':
+            headers['PayPal-Request-Id'] = request_id or str(uuid.uuid4())
+
+        for attempt in range(2):
+            headers['Authorization'] = f"Bearer {self.get_access_token(force_refresh=attempt > 0)}"
+            response = self.session.request(
+                method, f"{self.base_url}{path}", json=json, headers=headers, timeout=self.timeout)
+            # A revoked or expired token gets one refresh and another try
+            if response.status_code != 401:
+                break
+        response.raise_for_status()
+        return response.json() if response.content else {}
+
+    def create_order(self, payload, request_id=None):
+        return self.request('POST', '/v2/checkout/orders', json=payload, request_id=request_id)
+
+    def capture_order(self, paypal_order_id, request_id=None):
+        # Capturing the same PayPal order twice must not charge twice, so the
+        # request id is derived from the order id unless given.
+        return self.request(
+            'POST', f"/v2/checkout/orders/{paypal_order_id}/capture",
+            request_id=request_id or f"capture-{paypal_order_id}")
+
+
+def get_paypal_api_base():
+    if getattr(settings, 'PAYPAL_API_BASE', None):
+        return settings.PAYPAL_API_BASE
+    return f"https://api.{(settings.PAYPAL_MODE == 'live' and 'paypal.com' or 'sandbox.paypal.com')}"
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_paypal_client():
+    """
+    Return the process-wide PayPalClient for the current settings, so the
+    token cache and connection pool are shared by all requests.
+    """
+    config = (
+        settings.PAYPAL_CLIENT_ID,
+        settings.PAYPAL_CLIENT_SECRET,
+        get_paypal_api_base(),
+        getattr(settings, 'PAYPAL_TIMEOUT', (3.05, 20)),
+        getattr(settings, 'PAYPAL_MAX_RETRIES', 2),
+        getattr(settings, 'PAYPAL_POOL_SIZE', 10),
+    )
+    if not config[0] or not config[1]:
+        raise ImproperlyConfigured("PAYPAL_CLIENT_ID or PAYPAL_CLIENT_SECRET missing.")
+    with _clients_lock:
+        client = _clients.get(config)
+        if client is None:
+            client_id, client_secret, base_url, timeout, max_retries, pool_size = config
+            client = PayPalClient(client_id, client_secret, base_url, timeout=timeout,
+                                  max_retries=max_retries, pool_size=pool_size)
+            _clients.clear()
+            _clients[config] = client
+        return client
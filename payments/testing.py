@@ -0,0 +1,161 @@
+import base64
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakePayPalServer:
+    """
+    In-process stand-in for the PayPal REST API, used by the payments tests
+    and the PayPal latency benchmark.
+
+    Implements the token, create-order and capture endpoints. ``latency``
+    delays every response, ``fail_next(status, count)`` makes the next calls
+    fail, and the counters record tokens issued, calls per endpoint and TCP
+    connections opened.
+
+        with FakePayPalServer() as server:
+            client = PayPalClient('id', 'secret', server.base_url)
+    """
+
+    def __init__(self, client_id='test-client', client_secret='test-secret',
+                 latency=0.0, token_expires_in=32400):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.latency = latency
+        self.token_expires_in = token_expires_in
+        self.tokens = set()
+        self.orders = {}
+        self.captures_by_request_id = {}
+        self.calls = {'token': 0, 'create': 0, 'capture': 0}
+        self.connections = 0
+        self._failures = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, status, count=1):
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def revoke_tokens(self):
+        with self._lock:
+            self.tokens.clear()
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler, self)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # --- Request handling (called from the server threads) ---
+
+    def handle(self, method, path, headers, body):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self._failures:
+                return self._failures.pop(0), {'name': 'INTERNAL_SERVICE_ERROR', 'details': []}
+
+            if method == 'POST' and path == '/v1/oauth2/token':
+                return self._issue_token(headers)
+
+            token = headers.get('Authorization', '').removeprefix('Bearer ')
+            if token not in self.tokens:
+                return 401, {'error': 'invalid_token'}
+
+            if method == 'POST' and path == '/v2/checkout/orders':
+                self.calls['create'] += 1
+                order_id = uuid.uuid4().hex[:17].upper()
+                self.orders[order_id] = {'id': order_id, 'status': 'CREATED', 'request': body}
+                return 201, {'id': order_id, 'status': 'CREATED'}
+
+            match = re.fullmatch(r'/v2/checkout/orders/(\w+)/capture', path)
+            if method == 'POST' and match:
+                return self._capture(match.group(1), headers.get('PayPal-Request-Id'))
+
+        return 404, {'name': 'RESOURCE_NOT_FOUND'}
+
+    def _issue_token(self, headers):
+        expected = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
+        if headers.get('Authorization') != f"Basic {expected}":
+            return 401, {'error': 'invalid_client'}
+        self.calls['token'] += 1
+        token = uuid.uuid4().hex
+        self.tokens.add(token)
+        return 200, {'access_token': token, 'token_type': 'Bearer', 'expires_in': self.token_expires_in}
+
+    def _capture(self, order_id, request_id):
+        if request_id and request_id in self.captures_by_request_id:
+            return 201, self.captures_by_request_id[request_id]
+        order = self.orders.get(order_id)
+        if order is None:
+            return 404, {'name': 'RESOURCE_NOT_FOUND'}
+        if order['status'] == 'COMPLETED':
+            return 422, {'name': 'UNPROCESSABLE_ENTITY', 'details': [{'issue': 'ORDER_ALREADY_CAPTURED'}]}
+        self.calls['capture'] += 1
+        order['status'] = 'COMPLETED'
+        response = {
+            'id': order_id,
+            'status': 'COMPLETED',
+            'purchase_units': [{'payments': {'captures': [{'id': f"CAP-{order_id}", 'status': 'COMPLETED'}]}}],
+        }
+        if request_id:
+            self.captures_by_request_id[request_id] = response
+        return 201, response
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, fake):
+        self.fake = fake
+        super().__init__(address, handler)
+
+    def process_request(self, request, client_address):
+        with self.fake._lock:
+            self.fake.connections += 1
+        super().process_request(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is observable
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            body = json.loads(raw) if raw and self.headers.get('Content-Type') == 'application/json' else raw
+        except ValueError:
+            body = raw
+        status, payload = self.server.fake.handle('POST', self.path, self.headers, body)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
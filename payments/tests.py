@@ -1,3 +1,174 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from orders.models import Order
+from users.models import User
+from .models import Payment
+from .paypal import PayPalClient, get_paypal_client
+from .views import update_payment_if_status
+from .testing import FakePayPalServer
+
+
+class PayPalClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server = FakePayPalServer().start()
+        self.addCleanup(self.server.stop)
+        self.client = PayPalClient(
+            self.server.client_id, self.server.client_secret, self.server.base_url, backoff_factor=0)
+
+    def test_token_is_cached_and_connection_reused(self):
+        for _ in range(3):
+            self.client.create_order({'intent': 'CAPTURE'})
+        self.assertEqual(self.server.calls['token'], 1)
+        self.assertEqual(self.server.calls['create'], 3)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_expired_token_is_refreshed(self):
+        self.server.token_expires_in = 0
+        self.client.create_order({})
+        self.client.create_order({})
+        self.assertEqual(self.server.calls['token'], 2)
+
+    def test_revoked_token_is_refreshed_once(self):
+        self.client.create_order({})
+        self.server.revoke_tokens()
+        self.client.create_order({})
+        self.assertEqual(self.server.calls['token'], 2)
+        self.assertEqual(self.server.calls['create'], 2)
+
+    def test_server_errors_are_retried(self):
+        self.client.get_access_token()
+        self.server.fail_next(503)
+        self.assertIn('id', self.client.create_order({}))
+        self.assertEqual(self.server.calls['create'], 1)
+
+    def test_retries_are_bounded(self):
+        self.client.get_access_token()
+        self.server.fail_next(503, count=3)
+        with self.assertRaises(requests.HTTPError) as raised:
+            self.client.create_order({})
+        self.assertEqual(raised.exception.response.status_code, 503)
+
+    def test_capture_is_idempotent(self):
+        order_id = self.client.create_order({})['id']
+        first = self.client.capture_order(order_id)
+        second = self.client.capture_order(order_id)
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.calls['capture'], 1)
+
+
+class PayPalViewTestMixin:
+    def setUp(self):
+        self.server = FakePayPalServer().start()
+        self.addCleanup(self.server.stop)
+        overrides = override_settings(
+            PAYPAL_API_BASE=self.server.base_url,
+            PAYPAL_CLIENT_ID=self.server.client_id,
+            PAYPAL_CLIENT_SECRET=self.server.client_secret,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.buyer = User.objects.create(username='buyer', email='buyer@example.com', is_buyer=True)
+        self.order = Order.objects.create(buyer=self.buyer, total_price='12.50')
+        self.payment = Payment.objects.create(order=self.order, amount='12.50')
+        self.api = APIClient()
+        self.api.force_authenticate(self.buyer)
+
+
+class PayPalViewTests(PayPalViewTestMixin, TestCase):
+    def test_create_and_capture(self):
+        response = self.api.post('/api/payments/paypal/create-order/', {'order_id': self.order.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        paypal_order_id = response.json()['id']
+        self.assertEqual(
+            self.server.orders[paypal_order_id]['request']['purchase_units'][0]['amount']['value'], '12.50')
+
+        response = self.api.post('/api/payments/paypal/capture-order/', {
+            'orderID': paypal_order_id, 'djangoOrderID': self.order.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.payment.status, 'Completed')
+        self.assertEqual(self.payment.transaction_id, f"CAP-{paypal_order_id}")
+        self.assertEqual(self.order.status, 'Processing')
+        self.assertEqual(self.server.calls['token'], 1)
+
+    def test_create_marks_payment_failed_on_paypal_error(self):
+        # Fetch the token first, so the failure hits the create-order call
+        get_paypal_client().get_access_token()
+        self.server.fail_next(400)
+        response = self.api.post('/api/payments/paypal/create-order/', {'order_id': self.order.id}, format='json')
+        self.assertEqual(response.status_code, 500)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'Failed')
+        self.assertEqual(self.server.calls['token'], 1)
+        self.assertEqual(self.server.orders, {})
+
+
+class PaymentStatusGuardTests(PayPalViewTestMixin, TestCase):
+    """ Status changes made while PayPal is called are not overwritten """
+
+    def change_payment_during(self, method, **changes):
+        """ Patch PayPalClient.``method`` to change the payment, as a concurrent request would """
+        original = getattr(PayPalClient, method)
+
+        def concurrent_change(client, *args, **kwargs):
+            result = original(client, *args, **kwargs)
+            Payment.objects.filter(pk=self.payment.pk).update(**changes)
+            return result
+        patcher = mock.patch.object(PayPalClient, method, concurrent_change)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_paypal_order(self):
+        response = self.api.post('/api/payments/paypal/create-order/', {'order_id': self.order.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def capture(self, paypal_order_id):
+        return self.api.post('/api/payments/paypal/capture-order/', {
+            'orderID': paypal_order_id, 'djangoOrderID': self.order.id}, format='json')
+
+    def test_stale_status_does_not_overwrite_newer_one(self):
+        stale = Payment.objects.get(pk=self.payment.pk)
+        Payment.objects.filter(pk=self.payment.pk).update(status='Completed')
+        self.assertFalse(update_payment_if_status(stale, ['Pending'], status='Failed'))
+        self.assertEqual(stale.status, 'Pending')
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'Completed')
+
+    def test_create_conflicts_when_payment_changed_meanwhile(self):
+        self.change_payment_during('create_order', status='Completed')
+        response = self.api.post('/api/payments/paypal/create-order/', {'order_id': self.order.id}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'Completed')
+        self.assertIsNone(self.payment.paypal_order_id)
+
+    def test_capture_conflicts_when_payment_failed_meanwhile(self):
+        paypal_order_id = self.create_paypal_order()
+        self.change_payment_during('capture_order', status='Failed')
+        response = self.capture(paypal_order_id)
+        self.assertEqual(response.status_code, 409)
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.payment.status, 'Failed')
+        self.assertEqual(self.order.status, 'Pending')
+
+    def test_duplicate_capture_reports_the_first_one(self):
+        paypal_order_id = self.create_paypal_order()
+        # Another capture of the same order completes while this one waits on PayPal
+        self.change_payment_during('capture_order', status='Completed', transaction_id='FIRST')
+        response = self.capture(paypal_order_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['transaction_id'], 'FIRST')
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.transaction_id, 'FIRST')
+        # A further retry sees the stored state without calling PayPal
+        response = self.capture(paypal_order_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.calls['capture'], 1)
@@ -3,46 +3,52 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.db import transaction
-from django.conf import settings
 import traceback
 import requests
-import base64
 
+from idempotency.decorators import idempotent
 from .models import Payment
+from .paypal import get_paypal_client
 from .serializers import PaymentSerializer
 from orders.models import Order
+from notifications.services import notify_payment_captured
 
 # --- Standard PaymentViewSet (For Admin/Internal Use) ---
 class PaymentViewSet(viewsets.ModelViewSet):
-    queryset = Payment.objects.all().select_related('order', 'order__buyer')
+    queryset = Payment.objects.order_by('-created_at', '-id').select_related('order', 'order__buyer')
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAdminUser]
 
-# --- Helper Function to Get PayPal Auth Token ---
-def get_paypal_auth_header():
-    client_id = settings.PAYPAL_CLIENT_ID
-    client_secret = settings.PAYPAL_CLIENT_SECRET
+# --- PayPal Specific Views (Using the pooled PayPalClient) ---
+#
+# The PayPal round trip happens outside any database transaction, so a slow
+# PayPal response never holds a write lock. Payment state is changed afterwards
+# with single UPDATEs guarded by the status the payment was read with; if a
+# concurrent request moved the payment on in the meantime, the guard matches
+# no row and nothing is overwritten.
 
-    if not client_id or not client_secret:
-        print("CRITICAL ERROR: PAYPAL_CLIENT_ID or PAYPAL_CLIENT_SECRET missing.")
-        return None
+def update_payment_if_status(payment, expected_statuses, **changes):
+    """ Apply `changes` only while the payment is still in one of `expected_statuses` """
+    updated = Payment.objects.filter(
+        pk=payment.pk, status__in=expected_statuses).update(**changes)
+    if updated:
+        for field, value in changes.items():
+            setattr(payment, field, value)
+    return bool(updated)
 
-    auth_string = f"{client_id}:{client_secret}"
-    encoded_auth = base64.b64encode(auth_string.encode('utf-8')).decode('utf-8')
-    return f"Basic {encoded_auth}"
-
-
-# --- PayPal Specific Views (Using Direct HTTP Requests) ---
 
 class CreatePayPalOrderView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    @transaction.atomic
+    creatable_statuses = ['Pending', 'Failed']
+
+    @idempotent
     def post(self, request, *args, **kwargs):
         django_order_id = request.data.get('order_id')
         if not django_order_id:
             return Response({"error": "Django Order ID is required."}, status=status.HTTP_400_BAD_REQUEST)
 
+        payment = None
         try:
             order = Order.objects.select_related('payment').get(
                 id=django_order_id,
@@ -54,17 +60,12 @@ class CreatePayPalOrderView(APIView):
                  print(f"Error: Payment record missing for Order ID {django_order_id}")
                  return Response({"error": "Payment record not found for this order."}, status=status.HTTP_404_NOT_FOUND)
 
-            if payment.status not in ['Pending', 'Failed']:
+            if payment.status not in self.creatable_statuses:
                  print(f"Warning: Attempt to create PayPal order for payment ID {payment.id} with status '{payment.status}'.")
                  return Response({"error": f"Cannot create PayPal order for payment with status '{payment.status}'."}, status=status.HTTP_400_BAD_REQUEST)
 
             order_amount = "{:.2f}".format(order.total_price)
 
-            paypal_url = f"https://api.{(settings.PAYPAL_MODE == 'live' and 'paypal.com' or 'sandbox.paypal.com')}/v2/checkout/orders"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": get_paypal_auth_header()
-            }
             payload = {
                 "intent": "CAPTURE",
                 "purchase_units": [{
@@ -78,11 +79,9 @@ class CreatePayPalOrderView(APIView):
                 }]
             }
 
-            print(f"Sending PayPal Create Order request to: {paypal_url}")
+            print(f"Sending PayPal Create Order request for Order ID {order.id}")
             try:
-                response = requests.post(paypal_url, headers=headers, json=payload)
-                response.raise_for_status()
-                paypal_data = response.json()
+                paypal_data = get_paypal_client().create_order(payload)
 
                 paypal_order_id = paypal_data.get('id')
                 if not paypal_order_id:
@@ -90,10 +89,11 @@ class CreatePayPalOrderView(APIView):
                      raise Exception("PayPal Create Order response missing 'id'")
 
                 print(f"PayPal order created successfully. PayPal Order ID: {paypal_order_id}")
-                payment.paypal_order_id = paypal_order_id
-                payment.status = 'Pending PayPal'
-                payment.payment_method = 'PayPal'
-                payment.save()
+                if not update_payment_if_status(
+                        payment, [payment.status],
+                        paypal_order_id=paypal_order_id, status='Pending PayPal', payment_method='PayPal'):
+                    print(f"Warning: Payment ID {payment.id} changed while its PayPal order was being created.")
+                    return Response({"error": "Payment was updated by another request. Please retry."}, status=status.HTTP_409_CONFLICT)
 
                 return Response({"id": paypal_order_id}, status=status.HTTP_201_CREATED)
 
@@ -102,19 +102,17 @@ class CreatePayPalOrderView(APIView):
                 print("PayPal HTTPError:", http_err)
                 error_message = str(http_err)
                 try:
-                    error_details = response.json()
+                    error_details = http_err.response.json()
                     if 'details' in error_details:
                        error_message = ", ".join([d.get('description', d.get('issue', 'Unknown issue')) for d in error_details['details']])
                 except: pass
 
-                payment.status = 'Failed'
-                payment.save()
+                update_payment_if_status(payment, self.creatable_statuses, status='Failed')
                 return Response({"error": f"Failed to create PayPal order: {error_message}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
             except requests.exceptions.RequestException as req_err:
                 print("PayPal RequestException:", req_err)
-                payment.status = 'Failed'
-                payment.save()
+                update_payment_if_status(payment, self.creatable_statuses, status='Failed')
                 return Response({"error": f"Connection error with PayPal: {req_err}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         except Order.DoesNotExist:
@@ -122,16 +120,15 @@ class CreatePayPalOrderView(APIView):
             return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             traceback.print_exc()
-            if 'payment' in locals() and payment:
-                payment.status = 'Failed'
-                payment.save()
+            if payment:
+                update_payment_if_status(payment, self.creatable_statuses, status='Failed')
             return Response({"error": "An unexpected server error occurred."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 class CapturePayPalOrderView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    @transaction.atomic
+    @idempotent
     def post(self, request, *args, **kwargs):
         paypal_order_id = request.data.get('orderID')
         django_order_id = request.data.get('djangoOrderID')
@@ -154,18 +151,10 @@ class CapturePayPalOrderView(APIView):
             if payment.status != 'Pending PayPal':
                 return Response({"error": f"Cannot capture payment with status '{payment.status}'."}, status=status.HTTP_400_BAD_REQUEST)
 
-            capture_url = f"https://api.{(settings.PAYPAL_MODE == 'live' and 'paypal.com' or 'sandbox.paypal.com')}/v2/checkout/orders/{paypal_order_id}/capture"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": get_paypal_auth_header()
-            }
-
-            print(f"Sending PayPal Capture request to: {capture_url}")
+            print(f"Sending PayPal Capture request for PayPal Order ID {paypal_order_id}")
 
             try:
-                capture_response = requests.post(capture_url, headers=headers)
-                capture_response.raise_for_status()
-                capture_data = capture_response.json()
+                capture_data = get_paypal_client().capture_order(paypal_order_id)
                 paypal_status = capture_data.get('status', 'UNKNOWN').upper()
                 print("PayPal Capture API Response:", capture_data)
 
@@ -181,20 +170,28 @@ class CapturePayPalOrderView(APIView):
                     except Exception as extract_err:
                          print(f"Error extracting capture ID: {extract_err}")
 
-                    payment.status = 'Completed'
-                    payment.transaction_id = capture_id or paypal_order_id
-                    payment.paypal_payment_id = capture_id or paypal_order_id
-                    payment.save()
-
-                    order = payment.order
-                    order.status = 'Processing'
-                    order.save()
+                    # Short transaction: both rows change together or not at all
+                    with transaction.atomic():
+                        completed = update_payment_if_status(
+                            payment, ['Pending PayPal'],
+                            status='Completed',
+                            transaction_id=capture_id or paypal_order_id,
+                            paypal_payment_id=capture_id or paypal_order_id,
+                        )
+                        if completed:
+                            Order.objects.filter(pk=payment.order_id).update(status='Processing')
+                            notify_payment_captured(payment.order_id)
+
+                    if not completed:
+                        # A concurrent capture got there first; report the stored state
+                        payment.refresh_from_db()
+                        if payment.status != 'Completed':
+                            return Response({"error": f"Cannot capture payment with status '{payment.status}'."}, status=status.HTTP_409_CONFLICT)
 
                     serializer = PaymentSerializer(payment)
                     return Response(serializer.data, status=status.HTTP_200_OK)
                 else:
-                    payment.status = 'Failed'
-                    payment.save()
+                    update_payment_if_status(payment, ['Pending PayPal'], status='Failed')
                     error_message = f"PayPal Capture Status: {paypal_status}."
                     return Response({"error": error_message}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -203,12 +200,11 @@ class CapturePayPalOrderView(APIView):
                 error_message = f"PayPal API Error during capture ({http_err})."
                 error_data = None # Initialize
                 try:
-                    error_data = capture_response.json() # Attempt to get JSON error details
+                    error_data = http_err.response.json() # Attempt to get JSON error details
                     error_message += f" Details: {error_data}"
                 except: pass
 
-                payment.status = 'Failed'
-                payment.save()
+                update_payment_if_status(payment, ['Pending PayPal'], status='Failed')
                 # --- Enhanced Error Response ---
                 error_response_payload = {"error": error_message} # Base error
                 if error_data and isinstance(error_data, dict) and error_data.get('details'):
@@ -218,8 +214,7 @@ class CapturePayPalOrderView(APIView):
 
             except requests.exceptions.RequestException as req_err:
                 print("PayPal RequestException during Capture:", req_err)
-                payment.status = 'Failed'
-                payment.save()
+                update_payment_if_status(payment, ['Pending PayPal'], status='Failed')
                 return Response({"error": f"Connection error during PayPal capture: {req_err}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Payment.DoesNotExist:
              print(f"Error: Payment record not found matching PayPal Order {paypal_order_id}, Django Order {django_order_id} - User: {request.user.id}")
@@ -229,8 +224,7 @@ class CapturePayPalOrderView(APIView):
             traceback.print_exc()
 
             try:
-                if 'payment' in locals() and payment:
-                    payment.status = 'Failed'
-                    payment.save()
+                if payment:
+                    update_payment_if_status(payment, ['Pending PayPal'], status='Failed')
             except: pass
             return Response({"error": "An unexpected server error occurred during PayPal capture."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, Category
+from .models import Product, Category, ProductRecommendation
 
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'price', 'quantity', 'farmer', 'category')
@@ -10,5 +10,10 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
 
+class ProductRecommendationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'rank', 'recommended', 'score')
+    raw_id_fields = ('product', 'recommended')
+
 admin.site.register(Product, ProductAdmin)
-admin.site.register(Category, CategoryAdmin)
\ No newline at end of file
+admin.site.register(Category, CategoryAdmin)
+admin.site.register(ProductRecommendation, ProductRecommendationAdmin)
\ No newline at end of file
@@ -0,0 +1,129 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+CATALOGUE_VERSION_KEY = 'products:catalogue-version'
+# Bumped when products are deleted; see products.pricing.PriceSnapshot
+PRODUCT_DELETIONS_KEY = 'products:deletions-version'
+
+
+def get_catalogue_version():
+    return _get_counter(CATALOGUE_VERSION_KEY)
+
+
+def bump_catalogue_version():
+    return _bump_counter(CATALOGUE_VERSION_KEY)
+
+
+def get_deletions_version():
+    return _get_counter(PRODUCT_DELETIONS_KEY)
+
+
+def record_product_deletion():
+    """ Bump the deletions version once the current transaction commits """
+    transaction.on_commit(lambda: _bump_counter(PRODUCT_DELETIONS_KEY))
+
+
+def _get_counter(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def _bump_counter(key):
+    try:
+        return cache.incr(key)
+    except ValueError:  # not set yet, or evicted
+        cache.set(key, 2, None)
+        return 2
+
+
+def invalidate_catalogue():
+    """
+    Retire every cached catalogue response once the current transaction
+    commits. Bumping after commit means no request can re-cache data the
+    write is about to replace under the new version.
+    """
+    transaction.on_commit(bump_catalogue_version)
+
+
+def catalogue_cache_key(request, prefix):
+    # The full URI covers host (absolute image URLs), path, cursor and filters
+    query = sorted(request.query_params.lists())
+    raw = f"{request.build_absolute_uri(request.path)}?{query}|{request.accepted_renderer.format}"
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f"products:{prefix}:{get_catalogue_version()}:{digest}"
+
+
+class CatalogueCacheMixin:
+    """
+    Serve list and retrieve responses from the cache. Keys include the
+    catalogue version, which Product/Category changes and stock reservations
+    bump, so writes are visible on the next read.
+
+    Responses must not depend on the requesting user.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response('list', super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response('detail', super().retrieve, request, *args, **kwargs)
+
+    def _cached_response(self, kind, handler, request, *args, **kwargs):
+        key = catalogue_cache_key(request, f"{self.basename}-{kind}")
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300))
+        return response
+
+
+# --- Conditional GET (ETag / Last-Modified) ---
+# Used with django.views.decorators.http.condition, which answers a matching
+# If-None-Match / If-Modified-Since with 304 before the view serializes anything.
+
+def catalogue_list_etag(request, *args, **kwargs):
+    """ List bodies change only when the catalogue version does """
+    # Vary on the negotiated renderer like catalogue_cache_key: JSON and the
+    # browsable API must not share a validator.
+    query = sorted(request.query_params.lists())
+    renderer = getattr(request, 'accepted_renderer', None)
+    raw = (f"{request.build_absolute_uri(request.path)}?{query}"
+           f"|{getattr(renderer, 'format', '')}|{get_catalogue_version()}")
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def updated_at_etag(model):
+    # Rows whose bodies embed related data (a product's farmer and category)
+    # are touched by products.signals when that data changes.
+    def etag(request, pk=None, *args, **kwargs):
+        updated_at = _updated_at(request, model, pk)
+        if not updated_at:
+            return None
+        renderer = getattr(request, 'accepted_renderer', None)
+        return f"{model._meta.model_name}-{pk}-{updated_at.timestamp():.6f}-{getattr(renderer, 'format', '')}"
+    return etag
+
+
+def updated_at_last_modified(model):
+    def last_modified(request, pk=None, *args, **kwargs):
+        return _updated_at(request, model, pk)
+    return last_modified
+
+
+def _updated_at(request, model, pk):
+    # The ETag and Last-Modified callbacks share one indexed lookup per request
+    http_request = getattr(request, '_request', request)
+    memo = http_request.__dict__.setdefault('_updated_at_memo', {})
+    key = (model, pk)
+    if key not in memo:
+        memo[key] = model.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return memo[key]
@@ -0,0 +1,132 @@
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+
+from .cache import get_catalogue_version
+
+# Upper bounds of the price facet buckets; the last bucket is open-ended
+DEFAULT_PRICE_FACET_BOUNDARIES = (5, 10, 25, 50, 100)
+# Farmers listed in the farmer facet, most products first
+FARMER_FACET_LIMIT = 20
+TRUE_VALUES = {'true', '1', 't', 'y', 'yes'}
+FALSE_VALUES = {'false', '0', 'f', 'n', 'no'}
+
+
+def parse_facet_filters(params):
+    """
+    Read the catalogue filters from query parameters:
+    ``category`` and ``farmer`` (ids; repeat or comma-separate for several),
+    ``min_price``/``max_price`` and ``in_stock`` (true/false). Returns a
+    normalised dict with only the filters that were given.
+    """
+    filters = {}
+    for name in ('category', 'farmer'):
+        values = [value for param in params.getlist(name) for value in param.split(',') if value.strip()]
+        if values:
+            try:
+                filters[name] = tuple(sorted({int(value) for value in values}))
+            except ValueError:
+                raise ValidationError({name: 'Expected one or more ids.'})
+    for name in ('min_price', 'max_price'):
+        if params.get(name):
+            try:
+                filters[name] = Decimal(params[name])
+            except InvalidOperation:
+                raise ValidationError({name: 'A number is required.'})
+            if not filters[name].is_finite():
+                raise ValidationError({name: 'A number is required.'})
+    if params.get('in_stock'):
+        value = params['in_stock'].lower()
+        if value not in TRUE_VALUES | FALSE_VALUES:
+            raise ValidationError({'in_stock': 'Expected true or false.'})
+        filters['in_stock'] = value in TRUE_VALUES
+    return filters
+
+
+def apply_facet_filters(queryset, filters, skip=None):
+    """ Apply ``filters``, except the facet named ``skip`` """
+    condition = Q()
+    if 'category' in filters and skip != 'category':
+        condition &= Q(category_id__in=filters['category'])
+    if 'farmer' in filters and skip != 'farmer':
+        condition &= Q(farmer_id__in=filters['farmer'])
+    if skip != 'price':
+        if 'min_price' in filters:
+            condition &= Q(price__gte=filters['min_price'])
+        if 'max_price' in filters:
+            condition &= Q(price__lte=filters['max_price'])
+    if 'in_stock' in filters and skip != 'in_stock':
+        condition &= Q(quantity__gt=0) if filters['in_stock'] else Q(quantity__lte=0)
+    return queryset.filter(condition)
+
+
+def get_facet_counts(queryset, filters, cache_key_extra=''):
+    """
+    Count the products per value of every facet, cached under the catalogue
+    version so any product change retires the counts.
+
+    Each facet is counted with the other facets' filters applied but not its
+    own, so the response shows how many products picking another value
+    would give ("Vegetables (132)") rather than only the selected value.
+    ``queryset`` must not depend on the user; ``cache_key_extra`` must
+    describe anything besides ``filters`` that narrows it (e.g. a search).
+    """
+    raw = repr((sorted(filters.items()), cache_key_extra))
+    key = f"products:facets:{get_catalogue_version()}:{hashlib.md5(raw.encode('utf-8')).hexdigest()}"
+    facets = cache.get(key)
+    if facets is None:
+        facets = _count_facets(queryset.order_by(), filters)
+        cache.set(key, facets, getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300))
+    return facets
+
+
+def _count_facets(queryset, filters):
+    # One GROUP BY or conditional-aggregate query per facet
+    category_rows = apply_facet_filters(queryset, filters, skip='category').values(
+        'category_id', 'category__name').annotate(count=Count('id')).order_by('-count', 'category__name')
+    farmer_rows = apply_facet_filters(queryset, filters, skip='farmer').values(
+        'farmer_id', 'farmer__username').annotate(count=Count('id')).order_by('-count', 'farmer_id')
+
+    bounds = [None, *getattr(settings, 'PRODUCT_PRICE_FACET_BOUNDARIES', DEFAULT_PRICE_FACET_BOUNDARIES), None]
+    ranges = list(zip(bounds, bounds[1:]))
+    price_counts = apply_facet_filters(queryset, filters, skip='price').aggregate(**{
+        f'bucket_{i}': Count('id', filter=_price_range(low, high) or None)
+        for i, (low, high) in enumerate(ranges)})
+
+    stock_counts = apply_facet_filters(queryset, filters, skip='in_stock').aggregate(
+        in_stock=Count('id', filter=Q(quantity__gt=0)), out_of_stock=Count('id', filter=Q(quantity__lte=0)))
+
+    return {
+        'category': [
+            {'value': row['category_id'], 'label': row['category__name'], 'count': row['count'],
+             'selected': row['category_id'] in filters.get('category', ())}
+            for row in category_rows
+        ],
+        'farmer': [
+            {'value': row['farmer_id'], 'label': row['farmer__username'], 'count': row['count'],
+             'selected': row['farmer_id'] in filters.get('farmer', ())}
+            for row in farmer_rows[:FARMER_FACET_LIMIT]
+        ],
+        'price': [
+            {'min': str(low) if low is not None else None, 'max': str(high) if high is not None else None,
+             'count': price_counts[f'bucket_{i}']}
+            for i, (low, high) in enumerate(ranges)
+        ],
+        'in_stock': [
+            {'value': True, 'count': stock_counts['in_stock'], 'selected': filters.get('in_stock') is True},
+            {'value': False, 'count': stock_counts['out_of_stock'], 'selected': filters.get('in_stock') is False},
+        ],
+    }
+
+
+def _price_range(low, high):
+    condition = Q()
+    if low is not None:
+        condition &= Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
@@ -0,0 +1,36 @@
+import logging
+
+from django.utils import timezone
+
+from agro_ecommerce.images import generate_variants
+
+from .cache import invalidate_catalogue
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+
+def generate_product_image_variants(product_id):
+    """ Background task: render the variants of a product's current image """
+    product = Product.objects.filter(pk=product_id).only('image', 'image_variants').first()
+    if product is None or not product.image:
+        return
+    if product.image_variants.get('source') == product.image.name:
+        return  # already rendered, e.g. the task was queued twice
+    try:
+        variants = generate_variants(product.image.name)
+    except FileNotFoundError:
+        logger.warning("Image %s of product %s is missing; no variants generated.", product.image.name, product_id)
+        return
+    if store_product_image_variants(product_id, variants):
+        invalidate_catalogue()
+
+
+def store_product_image_variants(product_id, variants):
+    """
+    Save ``variants`` if the product still has the image they were made
+    from, so a slow task never overwrites the variants of a newer upload.
+    Returns the number of rows updated.
+    """
+    return Product.objects.filter(pk=product_id, image=variants['source']).update(
+        image_variants=variants, updated_at=timezone.now())
@@ -0,0 +1,210 @@
+import codecs
+import csv
+import json
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+from rest_framework import serializers
+
+from .cache import invalidate_catalogue
+from .models import Category, Product
+from .search import get_search_backend
+
+FORMATS = ('csv', 'jsonl')
+# Columns an import row may set, besides the sku it is matched by
+IMPORT_FIELDS = ('name', 'description', 'price', 'quantity', 'category', 'image_url')
+# Columns the search index covers
+SEARCHED_FIELDS = {'name', 'description', 'category_id'}
+# Per-row errors beyond this are counted but not listed
+MAX_REPORTED_ERRORS = 1000
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    """ One row of a product import; ``category`` is a category name """
+    sku = serializers.CharField(max_length=64)
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'))
+    quantity = serializers.IntegerField(min_value=0)
+    category = serializers.CharField(required=False, allow_blank=True, allow_null=True, max_length=100)
+    image_url = serializers.URLField(required=False, allow_blank=True, allow_null=True, max_length=1000)
+
+
+# One instance per mode, reused for every row: building a serializer per row
+# deep-copies its fields and would dominate the import time.
+_ROW_VALIDATORS = {
+    False: ProductImportRowSerializer(),
+    True: ProductImportRowSerializer(partial=True),
+}
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.error_count = 0
+        self.errors = []  # (row_number, errors) for the first MAX_REPORTED_ERRORS
+
+    def add_error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, {
+                field: [str(message) for message in messages] for field, messages in errors.items()}))
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'error_count': self.error_count,
+            'errors': [{'row': row_number, 'errors': errors} for row_number, errors in self.errors],
+        }
+
+
+def guess_format(filename):
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return None
+
+
+def read_rows(binary_file, file_format):
+    """
+    Yield ``(row_number, row)`` from a binary file one row at a time, so the
+    whole file is never held in memory. ``row`` is a dict, or an error
+    message for a line that could not be parsed.
+    """
+    lines = codecs.iterdecode(binary_file, 'utf-8-sig')
+    if file_format == 'csv':
+        # Row numbers count the header as row 1, as spreadsheets show them
+        for row_number, row in enumerate(csv.DictReader(lines), start=2):
+            yield row_number, row
+    elif file_format == 'jsonl':
+        for row_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield row_number, f"Invalid JSON: {e}"
+                continue
+            yield row_number, row if isinstance(row, dict) else "Each line must be a JSON object."
+    else:
+        raise ValueError(f"Unsupported import format {file_format!r}; use one of {', '.join(FORMATS)}.")
+
+
+def import_products(farmer, rows, batch_size=500):
+    """
+    Create or update ``farmer``'s products from ``(row_number, row)`` pairs,
+    matching existing products by sku.
+
+    Rows are validated and written in batches: per batch there is one
+    query for existing skus, at most one for unknown category names, one
+    bulk INSERT and one bulk UPDATE. Invalid rows are reported and skipped;
+    valid rows in the same batch are still saved. Updates overwrite only
+    the columns present in the row, and rows that match what is stored are
+    not written at all.
+    """
+    result = ImportResult()
+    categories = {}  # lower-cased name -> Category id, shared by all batches
+    seen_skus = set()
+    batch = []
+    for row_number, row in rows:
+        batch.append((row_number, row))
+        if len(batch) >= batch_size:
+            _import_batch(farmer, batch, categories, seen_skus, result)
+            batch = []
+    if batch:
+        _import_batch(farmer, batch, categories, seen_skus, result)
+    if result.created or result.updated:
+        invalidate_catalogue()
+    return result
+
+
+def _import_batch(farmer, batch, categories, seen_skus, result):
+    parsed = []
+    for row_number, row in batch:
+        if not isinstance(row, dict):
+            result.add_error(row_number, {'non_field_errors': [row]})
+            continue
+        sku = str(row.get('sku') or '').strip()
+        if sku in seen_skus:
+            result.add_error(row_number, {'sku': [f"Duplicate sku '{sku}' in this import."]})
+            continue
+        if sku:
+            seen_skus.add(sku)
+        parsed.append((row_number, sku, row))
+
+    existing = {
+        product.sku: product
+        for product in Product.objects.filter(farmer=farmer, sku__in=[sku for _, sku, _ in parsed if sku])
+    }
+
+    valid = []
+    for row_number, sku, row in parsed:
+        # CSV cells are strings; an empty cell means "no value"
+        data = {key: (None if value == '' and key in ('category', 'image_url') else value)
+                for key, value in row.items() if key == 'sku' or key in IMPORT_FIELDS}
+        # Existing products are updated with whichever columns the row has
+        validator = _ROW_VALIDATORS[sku in existing]
+        try:
+            valid.append((row_number, validator.run_validation(data)))
+        except serializers.ValidationError as e:
+            result.add_error(row_number, e.detail)
+
+    _resolve_categories(
+        {data['category'].strip().lower() for _, data in valid if data.get('category')}, categories)
+
+    now = timezone.now()
+    to_create, to_update, to_reindex, update_fields = [], [], [], {'updated_at'}
+    for row_number, data in valid:
+        data = dict(data)
+        if 'category' in data:
+            name = data.pop('category')
+            if name and name.strip().lower() not in categories:
+                result.add_error(row_number, {'category': [f"Unknown category '{name}'."]})
+                continue
+            data['category_id'] = categories[name.strip().lower()] if name else None
+        product = existing.get(data['sku'])
+        if product is None:
+            to_create.append(Product(farmer=farmer, updated_at=now, **data))
+        else:
+            # Re-importing a file mostly repeats what is stored; leave those rows alone
+            changed = [field for field, value in data.items() if getattr(product, field) != value]
+            if not changed:
+                result.unchanged += 1
+                continue
+            for field in changed:
+                setattr(product, field, data[field])
+            # bulk_update skips auto_now, and ETags rely on updated_at
+            product.updated_at = now
+            update_fields.update('category' if field == 'category_id' else field for field in changed)
+            to_update.append(product)
+            if SEARCHED_FIELDS.intersection(changed):
+                to_reindex.append(product)
+
+    if not to_create and not to_update:
+        return
+    with transaction.atomic():
+        Product.objects.bulk_create(to_create)
+        if to_update:
+            Product.objects.bulk_update(to_update, sorted(update_fields))
+        # bulk_create/bulk_update send no signals, so index here
+        get_search_backend().index_products([product.pk for product in to_create + to_reindex])
+    result.created += len(to_create)
+    result.updated += len(to_update)
+
+
+def _resolve_categories(names, categories):
+    """ Look up category names not resolved by an earlier batch, in one query """
+    missing = names - categories.keys()
+    if missing:
+        matches = Category.objects.annotate(lower_name=Lower('name')).filter(
+            lower_name__in=missing).order_by('-id').values_list('lower_name', 'id')
+        # Names are unique case-insensitively; for legacy duplicates the oldest wins
+        categories.update(matches)
@@ -0,0 +1,128 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .cache import invalidate_catalogue
+from .models import Product
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when a reservation cannot be met. ``shortages`` holds
+    ``(product, requested, available)`` tuples; ``product`` is None when the
+    product no longer exists.
+    """
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(', '.join(
+            f"{product.name if product else 'unknown product'}: requested {requested}, available {available}"
+            for product, requested, available in shortages
+        ))
+
+
+def reserve_stock(lines):
+    """
+    Decrement stock for ``lines`` -- ``(product_id, quantity)`` pairs -- all or
+    nothing.
+
+    Every line is applied by a single conditional UPDATE::
+
+        UPDATE products_product
+           SET quantity = CASE id WHEN <id> THEN quantity - <qty> ... END
+         WHERE id IN (...) AND quantity >= CASE id WHEN <id> THEN <qty> ... END
+
+    The database checks and decrements each row atomically, so concurrent
+    checkouts can neither oversell nor lose updates. If fewer rows match than
+    were requested, the update is rolled back and InsufficientStock is raised.
+    """
+    requested = defaultdict(int)
+    for product_id, quantity in lines:
+        if quantity <= 0:
+            raise ValueError("Reserved quantities must be positive.")
+        requested[product_id] += quantity
+    if not requested:
+        return
+
+    def per_product(value):
+        return Case(
+            *[When(pk=pk, then=value(quantity)) for pk, quantity in requested.items()],
+            output_field=IntegerField(),
+        )
+
+    try:
+        with transaction.atomic():
+            updated = Product.objects.filter(
+                pk__in=requested.keys(),
+                quantity__gte=per_product(Value),
+            ).update(
+                quantity=per_product(lambda quantity: F('quantity') - quantity),
+                updated_at=timezone.now(),
+            )
+            if updated != len(requested):
+                raise InsufficientStock([])
+    except InsufficientStock:
+        raise InsufficientStock(_find_shortages(requested)) from None
+    # Catalogue responses show stock levels
+    invalidate_catalogue()
+
+
+def _find_shortages(requested):
+    products = Product.objects.in_bulk(requested.keys())
+    shortages = []
+    for pk, quantity in requested.items():
+        product = products.get(pk)
+        available = product.quantity if product else 0
+        if available < quantity:
+            shortages.append((product, quantity, available))
+    return shortages
+
+
+def apply_stock_updates(farmer, changes):
+    """
+    Apply price/quantity ``changes`` -- dicts with ``id`` and any of
+    ``price``, ``quantity`` and ``updated_at`` -- to ``farmer``'s products.
+
+    The products are loaded (and locked) with one query that also checks
+    ownership, and every changed row is written by one bulk UPDATE. A change
+    is not applied, and is returned as a conflict, when the product is not
+    the farmer's (``'not_found'``) or when its ``updated_at`` no longer
+    matches the one sent (``'modified'``).
+
+    Returns ``(updated_ids, unchanged_ids, conflicts)`` where ``conflicts``
+    holds ``(product_id, reason, product_or_None)`` tuples.
+    """
+    changes = {change['id']: change for change in changes}
+    updated, unchanged, conflicts = [], [], []
+    with transaction.atomic():
+        products = Product.objects.select_for_update().filter(
+            farmer=farmer, pk__in=changes.keys()).only('id', 'price', 'quantity', 'updated_at')
+        products = {product.pk: product for product in products}
+
+        now = timezone.now()
+        update_fields = {'updated_at'}
+        for pk, change in changes.items():
+            product = products.get(pk)
+            if product is None:
+                conflicts.append((pk, 'not_found', None))
+                continue
+            if 'updated_at' in change and change['updated_at'] != product.updated_at:
+                conflicts.append((pk, 'modified', product))
+                continue
+            fields = [field for field in ('price', 'quantity')
+                      if field in change and getattr(product, field) != change[field]]
+            if not fields:
+                unchanged.append(pk)
+                continue
+            for field in fields:
+                setattr(product, field, change[field])
+            product.updated_at = now
+            update_fields.update(fields)
+            updated.append(product)
+
+        if updated:
+            Product.objects.bulk_update(updated, sorted(update_fields))
+            invalidate_catalogue()
+    return [product.pk for product in updated], unchanged, conflicts
@@ -0,0 +1,81 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from agro_ecommerce.images import generate_variants
+from products.cache import invalidate_catalogue
+from products.images import store_product_image_variants
+from products.models import Product
+from users.images import store_profile_picture_variants
+from users.models import Profile
+
+# name -> (model, image field, variants field, store function)
+TARGETS = {
+    'products': (Product, 'image', 'image_variants', store_product_image_variants),
+    'profiles': (Profile, 'profile_picture', 'picture_variants', store_profile_picture_variants),
+}
+
+
+def _setup_worker():
+    # Needed when workers are spawned rather than forked
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate resized WebP/JPEG variants for product images and profile "
+        "pictures that don't have them yet, using a pool of worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only', choices=sorted(TARGETS), action='append',
+            help="Limit to products or profiles (may be repeated).")
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Worker processes (default: number of CPUs).")
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Also process images that already have variants, e.g. after "
+                 "changing IMAGE_VARIANT_SIZES. Existing files are reused.")
+
+    def handle(self, *args, **options):
+        # Rows sharing an image (such as the default avatar) are rendered once
+        pending = defaultdict(list)  # source name -> [(target, pk)]
+        for target in options['only'] or sorted(TARGETS):
+            model, image_field, variants_field, _ = TARGETS[target]
+            rows = model.objects.exclude(**{image_field: ''}).exclude(**{f"{image_field}__isnull": True})
+            for pk, source, variants in rows.values_list('pk', image_field, variants_field).iterator():
+                if options['force'] or variants.get('source') != source:
+                    pending[source].append((target, pk))
+
+        if not pending:
+            self.stdout.write("All images already have variants.")
+            return
+
+        self.stdout.write(f"Rendering {len(pending)} images with {options['workers']} workers...")
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        updated = defaultdict(int)
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_setup_worker) as pool:
+            futures = {pool.submit(generate_variants, source): source for source in pending}
+            for future in as_completed(futures):
+                source = futures[future]
+                try:
+                    variants = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{source}: {e}")
+                    continue
+                for target, pk in pending[source]:
+                    updated[target] += TARGETS[target][3](pk, variants)
+
+        if updated['products']:
+            invalidate_catalogue()
+        summary = ', '.join(f"{count} {target}" for target, count in sorted(updated.items())) or 'nothing'
+        self.stdout.write(self.style.SUCCESS(f"Stored variants for {summary}; {failed} images failed."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importers import FORMATS, guess_format, import_products, read_rows
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update a farmer's products from a CSV file (with a header "
+        "row) or a JSON Lines file, matching existing products by sku. "
+        "Columns: sku, name, description, price, quantity, category, image_url."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--farmer', required=True, help="Username of the farmer who owns the products.")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            farmer = User.objects.get(username=options['farmer'], is_farmer=True)
+        except User.DoesNotExist:
+            raise CommandError(f"No farmer with username '{options['farmer']}'.")
+        file_format = options['format'] or guess_format(options['path'])
+        if file_format is None:
+            raise CommandError("Can't tell the file format from its name; pass --format.")
+
+        with open(options['path'], 'rb') as import_file:
+            result = import_products(
+                farmer, read_rows(import_file, file_format), batch_size=options['batch_size'])
+        for row_number, errors in result.errors:
+            self.stderr.write(f"Row {row_number}: {errors}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result.created} products, updated {result.updated}, "
+            f"unchanged {result.unchanged}, skipped {result.error_count}."))
@@ -3,11 +3,14 @@ from users.models import User
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
 
 class Product(models.Model):
+    # Farmer-chosen stock-keeping unit; bulk imports match existing products by it
+    sku = models.CharField(max_length=64, null=True, blank=True)
     name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -18,6 +21,56 @@ class Product(models.Model):
     image = models.ImageField(upload_to='product_images/', null=True, blank=True)
     # Add a field for image URL as an alternative to uploaded images
     image_url = models.URLField(max_length=1000, blank=True, null=True)
+    # Resized copies of `image`, written by products.images in the background
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Drives ETag/Last-Modified; bulk and F() updates must set it explicitly
+    updated_at = models.DateTimeField(auto_now=True)
+    # Review aggregates, maintained by reviews.signals; repair them with
+    # `manage.py recompute_product_ratings`. rating_avg is 0 without reviews.
+    rating_sum = models.IntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['farmer', 'sku'], condition=models.Q(sku__isnull=False),
+                name='product_farmer_sku_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['rating_avg', 'id'], name='product_rating_idx'),
+            # Catalogue facets (products.facets): price ranges, and category
+            # counts among products in stock
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['category', 'price'], condition=models.Q(quantity__gt=0),
+                         name='product_in_stock_category_idx'),
+            # Incremental refresh of the price snapshot (products.pricing)
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ]
     
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+class ProductRecommendation(models.Model):
+    """
+    "Customers who bought this also bought": a product's most co-purchased
+    products, best first. Built from order history by
+    orders.recommendations (`manage.py build_recommendations`).
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    # Number of orders containing both products
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        # Also the index for reading a product's list in order
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='product_recommendation_rank_uniq'),
+        ]
+
+class RecommendationState(models.Model):
+    """ Single row: how far into the orders the recommendations are built """
+    # Orders created before this are counted; null until the first build
+    built_through = models.DateTimeField(null=True, blank=True)
+    built_at = models.DateTimeField(null=True, blank=True)
@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+
+from .cache import get_catalogue_version, get_deletions_version
+from .models import Product
+
+# Rows changed this long before the newest change already seen are read
+# again on refresh, so a transaction that committed late is not missed
+REFRESH_OVERLAP = timedelta(minutes=5)
+# Rebuild from scratch at least this often (seconds)
+SNAPSHOT_MAX_AGE = 3600
+PERCENTILES = (10, 25, 50, 75, 90)
+# Memoized (category, bins) results kept between changes, least recently used dropped
+STATS_MEMO_SIZE = 256
+NO_CATEGORY = -1
+
+
+class PriceSnapshot:
+    """
+    In-memory ``(product id, category id, price)`` arrays for computing
+    price statistics with NumPy instead of querying products per request.
+
+    ``refresh()`` is cheap when nothing changed: it compares the catalogue
+    and deletion versions. After a change only the products updated since the last
+    refresh are read and patched in. Deletions bump a separate counter
+    (products.cache.record_product_deletion) and trigger a full rebuild;
+    a category delete touches the detached products, so they are patched
+    like any other update. Statistics are memoized until the next change,
+    so their cost does not grow with the number of requests.
+    """
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)  # sorted
+        self.categories = np.empty(0, dtype=np.int64)
+        self.prices = np.empty(0, dtype=np.float64)
+        self.watermark = None  # newest updated_at seen
+        self.catalogue_version = None
+        self.deletions_version = None
+        self.built_at = 0.0
+        self._stats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        # Deletions bump both counters, but not atomically; check both
+        version, deletions = get_catalogue_version(), get_deletions_version()
+        with self._lock:
+            if version == self.catalogue_version and deletions == self.deletions_version:
+                return
+            if (self.watermark is None or deletions != self.deletions_version
+                    or time.monotonic() - self.built_at > SNAPSHOT_MAX_AGE):
+                self._rebuild()
+            else:
+                self._apply_changes()
+            self.catalogue_version = version
+            self.deletions_version = deletions
+            self._stats.clear()
+
+    def _rebuild(self):
+        rows = Product.objects.order_by('id').values_list('id', 'category_id', 'price', 'updated_at')
+        ids, categories, prices, self.watermark = _to_arrays(rows.iterator(chunk_size=5000))
+        self.ids, self.categories, self.prices = ids, categories, prices
+        self.built_at = time.monotonic()
+
+    def _apply_changes(self):
+        rows = Product.objects.filter(updated_at__gte=self.watermark - REFRESH_OVERLAP).values_list(
+            'id', 'category_id', 'price', 'updated_at')
+        ids, categories, prices, watermark = _to_arrays(rows)
+        if len(ids):
+            positions = np.searchsorted(self.ids, ids)
+            known = positions < len(self.ids)
+            known[known] = self.ids[positions[known]] == ids[known]
+            self.categories[positions[known]] = categories[known]
+            self.prices[positions[known]] = prices[known]
+            if not known.all():
+                merged_ids = np.concatenate([self.ids, ids[~known]])
+                order = np.argsort(merged_ids, kind='stable')
+                self.ids = merged_ids[order]
+                self.categories = np.concatenate([self.categories, categories[~known]])[order]
+                self.prices = np.concatenate([self.prices, prices[~known]])[order]
+            self.watermark = max(self.watermark, watermark)
+
+    def stats(self, category=None, bins=10):
+        """
+        Price statistics (count, min, max, mean, percentiles, histogram) of
+        one category, or of the whole catalogue plus each category when
+        ``category`` is None. Use ``NO_CATEGORY`` for uncategorised products.
+        """
+        self.refresh()
+        key = (category, bins)
+        with self._lock:
+            if key in self._stats:
+                self._stats.move_to_end(key)
+                return self._stats[key]
+            if category is not None:
+                stats = _price_stats(self.prices[self.categories == category], bins)
+            else:
+                stats = {**_price_stats(self.prices, bins), 'categories': self._per_category(bins)}
+            self._stats[key] = stats
+            if len(self._stats) > STATS_MEMO_SIZE:
+                self._stats.popitem(last=False)
+            return stats
+
+    def _per_category(self, bins):
+        order = np.argsort(self.categories, kind='stable')
+        categories, starts = np.unique(self.categories[order], return_index=True)
+        groups = np.split(self.prices[order], starts[1:])
+        return [
+            {'category': None if category == NO_CATEGORY else int(category), **_price_stats(prices, bins)}
+            for category, prices in zip(categories, groups)
+        ]
+
+
+def _to_arrays(rows):
+    ids, categories, prices = [], [], []
+    watermark = None
+    for pk, category_id, price, updated_at in rows:
+        ids.append(pk)
+        categories.append(NO_CATEGORY if category_id is None else category_id)
+        prices.append(price)
+        if watermark is None or updated_at > watermark:
+            watermark = updated_at
+    return (np.array(ids, dtype=np.int64), np.array(categories, dtype=np.int64),
+            np.array(prices, dtype=np.float64), watermark)
+
+
+def _price_stats(prices, bins):
+    if not len(prices):
+        return {'count': 0, 'min': None, 'max': None, 'mean': None, 'percentiles': {}, 'histogram': []}
+    counts, edges = np.histogram(prices, bins=bins)
+    return {
+        'count': int(len(prices)),
+        'min': round(float(prices.min()), 2),
+        'max': round(float(prices.max()), 2),
+        'mean': round(float(prices.mean()), 2),
+        'percentiles': {
+            f'p{q}': round(float(value), 2) for q, value in zip(PERCENTILES, np.percentile(prices, PERCENTILES))},
+        'histogram': [
+            {'min': round(float(low), 2), 'max': round(float(high), 2), 'count': int(count)}
+            for low, high, count in zip(edges, edges[1:], counts)
+        ],
+    }
+
+
+price_snapshot = PriceSnapshot()
@@ -0,0 +1,181 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, ExpressionWrapper, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+FTS_TABLE = 'products_product_fts'
+
+# Only word characters are passed on to the search engine; this keeps
+# user input from being interpreted as FTS5 query syntax.
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query or '')[:16]
+
+
+class BaseSearchBackend:
+    """
+    Interface for product search backends.
+
+    ``search`` narrows a product queryset to the products matching all of
+    the query's tokens (see ``tokenize``; never empty) and annotates them
+    with ``search_rank``, lower being a better match. The match and the
+    ranking are part of the queryset's own SQL, so other filters, counts and
+    pagination all run over every match.
+    Backends that keep their own index also implement the indexing methods;
+    the default implementations are no-ops for backends that query the
+    product table directly.
+    """
+
+    def search(self, queryset, tokens):
+        raise NotImplementedError
+
+    def index_products(self, product_ids):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    Inverted index stored in an SQLite FTS5 virtual table, keyed by product id.
+    Results are ranked with bm25, weighting name over category over description.
+    """
+
+    weights = (10.0, 1.0, 5.0)  # name, description, category
+
+    def search(self, queryset, tokens):
+        # Every token must match; the last one is treated as a prefix so
+        # results show up while the user is still typing.
+        match = ' '.join(f'"{token}"' for token in tokens) + '*'
+        table = Product._meta.db_table
+        matches = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        rank = RawSQL(
+            f"SELECT bm25({FTS_TABLE}, %s, %s, %s) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.id",
+            [*self.weights, match], output_field=FloatField(),
+        )
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+    def index_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        rows = Product.objects.filter(pk__in=product_ids).values_list(
+            'id', 'name', 'description', 'category__name')
+        with connection.cursor() as cursor:
+            self._delete(cursor, product_ids)
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)",
+                [(pk, name, description, category or '') for pk, name, description, category in rows],
+            )
+
+    def remove_products(self, product_ids):
+        product_ids = list(product_ids)
+        if product_ids:
+            with connection.cursor() as cursor:
+                self._delete(cursor, product_ids)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        ids = Product.objects.values_list('id', flat=True).order_by('id')
+        batch = []
+        for pk in ids.iterator(chunk_size=1000):
+            batch.append(pk)
+            if len(batch) == 1000:
+                self.index_products(batch)
+                batch = []
+        self.index_products(batch)
+
+    def _delete(self, cursor, product_ids):
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in product_ids])
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Full-text search using PostgreSQL's tsvector ranking. For large catalogues
+    add a GIN index over the same weighted vector expression.
+    """
+
+    def search(self, queryset, tokens):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        vector = (
+            SearchVector('name', weight='A')
+            + SearchVector('category__name', weight='B')
+            + SearchVector('description', weight='C')
+        )
+        search_query = SearchQuery(' & '.join(f'{token}:*' for token in tokens), search_type='raw')
+        # ts_rank grows with relevance; negate it so the best match sorts first
+        return queryset.annotate(search_rank=-SearchRank(vector, search_query)).filter(search_rank__lt=0)
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """
+    Portable fallback that scores products with LIKE lookups. It scans the
+    product table, so it is only meant for databases without a native
+    full-text engine.
+    """
+
+    def search(self, queryset, tokens):
+        score = Value(0)
+        for token in tokens:
+            queryset = queryset.filter(
+                Q(name__icontains=token)
+                | Q(description__icontains=token)
+                | Q(category__name__icontains=token)
+            )
+            score = (
+                score
+                - Case(When(name__icontains=token, then=Value(10)), default=Value(0))
+                - Case(When(category__name__icontains=token, then=Value(5)), default=Value(0))
+                - Case(When(description__icontains=token, then=Value(1)), default=Value(0))
+            )
+        return queryset.annotate(search_rank=ExpressionWrapper(score, output_field=IntegerField()))
+
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Return the configured search backend. ``PRODUCT_SEARCH_BACKEND`` may name
+    a backend class by dotted path; otherwise one is picked for the database.
+    """
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+        if backend_path:
+            backend_class = import_string(backend_path)
+        elif connection.vendor == 'sqlite':
+            backend_class = SQLiteFTSBackend
+        elif connection.vendor == 'postgresql':
+            backend_class = PostgresSearchBackend
+        else:
+            backend_class = SimpleSearchBackend
+        _backend = backend_class()
+    return _backend
+
+
+def search_products(queryset, query):
+    """
+    Restrict ``queryset`` to products matching ``query``, best match first.
+    Ties keep a stable order by id, so cursor pages over the ranking neither
+    skip nor repeat products.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset.none()
+    return get_search_backend().search(queryset, tokens).order_by('search_rank', 'id')
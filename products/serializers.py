@@ -1,16 +1,23 @@
+from decimal import Decimal
+
+from django.core.files.storage import default_storage
 from rest_framework import serializers
+from agro_ecommerce.images import variant_srcset
 from .models import Product, Category
 from users.serializers import UserSerializer
 
 class ProductSerializer(serializers.ModelSerializer):
     farmer_details = UserSerializer(source='farmer', read_only=True)
     image_path = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+    average_rating = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'quantity', 'farmer', 
-                 'category', 'image', 'image_url', 'image_path', 'farmer_details']
-        read_only_fields = ['farmer']
+        fields = ['id', 'sku', 'name', 'description', 'price', 'quantity', 'farmer', 
+                 'category', 'image', 'image_url', 'image_path', 'image_variants',
+                 'farmer_details', 'average_rating', 'rating_count', 'updated_at']
+        read_only_fields = ['farmer', 'updated_at']
         
     def get_image_path(self, obj):
         """Return the complete URL for the image"""
@@ -19,12 +26,68 @@ class ProductSerializer(serializers.ModelSerializer):
             if request:
                 return request.build_absolute_uri(obj.image.url)
         return obj.image_url or None
+
+    def get_average_rating(self, obj):
+        """Mean review rating from the stored aggregates; null without reviews"""
+        return round(obj.rating_avg, 2) if obj.rating_count else None
+
+    def validate_sku(self, value):
+        """A farmer's skus must be unique; blank means no sku"""
+        if not value:
+            return None
+        request = self.context.get('request')
+        farmer = self.instance.farmer if self.instance else getattr(request, 'user', None)
+        products = Product.objects.filter(farmer=farmer, sku=value)
+        if self.instance:
+            products = products.exclude(pk=self.instance.pk)
+        if farmer is not None and products.exists():
+            raise serializers.ValidationError("You already have a product with this SKU.")
+        return value
+
+    def get_image_variants(self, obj):
+        """Resized WebP/JPEG copies with srcset strings; null until generated"""
+        if not obj.image or obj.image_variants.get('source') != obj.image.name:
+            return None
+        request = self.context.get('request')
+
+        def build_url(name):
+            url = default_storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+        return variant_srcset(obj.image_variants, build_url)
         
     def to_representation(self, instance):
         """Add farmer details to the response"""
         representation = super().to_representation(instance)
         return representation
 
+class ProductStockUpdateListSerializer(serializers.ListSerializer):
+    def validate(self, data):
+        ids = [item['id'] for item in data]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Each product may appear only once.")
+        return data
+
+
+class ProductStockUpdateSerializer(serializers.Serializer):
+    """
+    One entry of a bulk price/stock update. ``updated_at``, when sent, must
+    match the stored value, so an edit based on stale data is reported as a
+    conflict instead of overwriting a newer change.
+    """
+    id = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'), required=False)
+    quantity = serializers.IntegerField(min_value=0, required=False)
+    updated_at = serializers.DateTimeField(required=False)
+
+    class Meta:
+        list_serializer_class = ProductStockUpdateListSerializer
+
+    def validate(self, data):
+        if 'price' not in data and 'quantity' not in data:
+            raise serializers.ValidationError("Send a price, a quantity or both.")
+        return data
+
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
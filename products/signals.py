@@ -0,0 +1,87 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from agro_ecommerce.background import run_in_background
+
+from .cache import invalidate_catalogue, record_product_deletion
+from .images import generate_product_image_variants
+from .models import Category, Product
+from .search import get_search_backend
+from users.models import User
+
+# User fields product responses embed as farmer_details (UserSerializer)
+FARMER_DETAIL_FIELDS = {'username', 'first_name', 'last_name', 'email', 'is_farmer', 'is_buyer'}
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, raw=False, **kwargs):
+    # A new category has no products yet; a renamed one changes the
+    # indexed category text of all of its products.
+    if not created and not raw:
+        get_search_backend().index_products(
+            instance.product_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_products(sender, instance, **kwargs):
+    # Products are detached with SET_NULL, which sends no signals of its own.
+    # Their bodies lose the category, so touch them for the ETag validators.
+    instance._indexed_product_ids = list(
+        instance.product_set.values_list('id', flat=True))
+    instance.product_set.update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Category)
+def reindex_detached_products(sender, instance, **kwargs):
+    get_search_backend().index_products(
+        getattr(instance, '_indexed_product_ids', []))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalogue_cache(sender, **kwargs):
+    invalidate_catalogue()
+
+
+@receiver(post_delete, sender=Product)
+def count_product_deletion(sender, **kwargs):
+    # Deleted rows leave nothing for the price snapshot's updated_at scan
+    record_product_deletion()
+
+
+@receiver(post_save, sender=User)
+def invalidate_farmer_products(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Login bookkeeping (last_login) and new users change no product body
+    if raw or created or (update_fields is not None and not FARMER_DETAIL_FIELDS.intersection(update_fields)):
+        return
+    # Touching the products moves their detail ETag / Last-Modified as well
+    touched = Product.objects.filter(farmer_id=instance.pk).update(updated_at=timezone.now())
+    if touched or instance.is_farmer:
+        invalidate_catalogue()
+
+
+@receiver(post_save, sender=Product)
+def schedule_image_variants(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.image:
+        if instance.image_variants.get('source') != instance.image.name:
+            run_in_background(generate_product_image_variants, instance.pk)
+    elif instance.image_variants:
+        # Image removed: drop the variants of the old one
+        Product.objects.filter(pk=instance.pk).update(image_variants={})
+        instance.image_variants = {}
@@ -1,3 +1,768 @@
+import io
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from agro_ecommerce.images import generate_variants
+from agro_ecommerce.testing import ImageVariantTestMixin, QueryBudgetMixin
+from jobs.models import Job
+from reviews.models import Review
+from users.models import User
+from .cache import get_catalogue_version
+from .images import generate_product_image_variants, store_product_image_variants
+from .importers import import_products, read_rows
+from .inventory import InsufficientStock, reserve_stock
+from .models import Category, Product
+from .pricing import PriceSnapshot
+
+
+class ProductListQueryTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Vegetables')
+
+    def add_products(self, count):
+        # Run on_commit hooks so the catalogue cache sees the new rows
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                n = Product.objects.count()
+                farmer = User.objects.create(
+                    username=f'farmer{n}', email=f'farmer{n}@example.com', is_farmer=True)
+                Product.objects.create(
+                    name=f'Product {n}', description='Fresh', price=2, quantity=10,
+                    farmer=farmer, category=self.category)
+
+    def test_list_query_count_is_independent_of_rows(self):
+        def request():
+            response = self.client.get('/api/products/products/', {'page_size': 50})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(all(p['farmer_details'] for p in response.json()['results']))
+
+        self.assertQueryCountConstant(self.add_products, request, sizes=(1, 15))
+
+    def test_search_query_count_is_independent_of_rows(self):
+        def request():
+            response = self.client.get('/api/products/products/', {'q': 'product', 'page_size': 50})
+            self.assertEqual(response.status_code, 200)
+
+        self.assertQueryCountConstant(self.add_products, request, sizes=(1, 15))
+
+
+class ProductSearchTests(TestCase):
+    url = '/api/products/products/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        self.vegetables = Category.objects.create(name='Vegetables')
+        self.fruit = Category.objects.create(name='Fruit')
+
+    def add(self, name, description='', category=None, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(name=name, description=description, price=2, quantity=5,
+                                          farmer=self.farmer, category=category, **fields)
+
+    def search(self, query, **params):
+        response = self.client.get(self.url, {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.json()['results']]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.add('Salad mix', 'Greens with tomato slices')
+        self.add('Tomato', 'Red and ripe')
+        self.add('Onion', 'Yellow')
+        self.assertEqual(self.search('tomato'), ['Tomato', 'Salad mix'])
+
+    def test_last_token_matches_as_a_prefix(self):
+        self.add('Tomatoes', 'Red cherry')
+        self.add('Tomcat treats')
+        self.assertCountEqual(self.search('tom'), ['Tomatoes', 'Tomcat treats'])
+        self.assertEqual(self.search('cherry tom'), ['Tomatoes'])
+        # Only the last token is a prefix
+        self.assertEqual(self.search('tom cherry'), [])
+
+    def test_search_syntax_is_matched_as_plain_words(self):
+        self.add('Tomato', 'Red')
+        for query in ('"AND OR *', 'tomato" OR *', '*', 'NEAR(tomato', 'name:tomato'):
+            with self.subTest(query=query):
+                self.search(query)
+        self.assertEqual(self.search('"tomato'), ['Tomato'])
+        self.assertEqual(self.search('tomato OR onion'), [])
+
+    def test_filters_and_paging_cover_every_match(self):
+        for n in range(5):
+            self.add(f'Tomato {n}', category=self.vegetables)
+        self.add('Apple', 'Pairs well with tomato', category=self.fruit)
+        # The fruit is the weakest match but still found once filtered for
+        self.assertEqual(self.search('tomato', category=self.fruit.pk), ['Apple'])
+
+        names, url = [], self.url + '?q=tomato&page_size=2'
+        while url:
+            body = self.client.get(url).json()
+            names += [product['name'] for product in body['results']]
+            url = body['next']
+        self.assertEqual(names, [f'Tomato {n}' for n in range(5)] + ['Apple'])
+
+    def test_index_follows_product_changes(self):
+        product = self.add('Tomato', 'Red')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Pepper'
+            product.save()
+        self.assertEqual(self.search('tomato'), [])
+        self.assertEqual(self.search('pepper'), ['Pepper'])
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self.search('pepper'), [])
+
+    def test_index_follows_category_changes(self):
+        self.add('Carrots', category=self.vegetables)
+        self.assertEqual(self.search('vegetables'), ['Carrots'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vegetables.name = 'Roots'
+            self.vegetables.save()
+        self.assertEqual(self.search('vegetables'), [])
+        self.assertEqual(self.search('roots'), ['Carrots'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vegetables.delete()
+        self.assertEqual(self.search('roots'), [])
+        self.assertEqual(self.search('carrots'), ['Carrots'])
+
+
+class ProductReviewsTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        self.product = Product.objects.create(name='Carrots', price=2, quantity=5, farmer=farmer)
+        self.other = Product.objects.create(name='Onions', price=1, quantity=5, farmer=farmer)
+        self.url = f'/api/products/products/{self.product.pk}/reviews/'
+        self.client = APIClient()
+
+    def add_reviews(self, count, product=None):
+        for _ in range(count):
+            n = Review.objects.count()
+            user = User.objects.create(username=f'buyer{n}', email=f'buyer{n}@example.com')
+            Review.objects.create(product=product or self.product, user=user, rating=n % 5 + 1,
+                                  comment=f'Review {n}')
+
+    def get(self, url=None, **params):
+        response = self.client.get(url or self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_newest_first_by_cursor(self):
+        self.add_reviews(5)
+        self.add_reviews(2, product=self.other)
+        comments, body = [], self.get(page_size=2)
+        while True:
+            comments += [review['comment'] for review in body['results']]
+            if not body['next']:
+                break
+            body = self.get(body['next'])
+        self.assertEqual(comments, [f'Review {n}' for n in (4, 3, 2, 1, 0)])
+
+    def test_rating_filter(self):
+        self.add_reviews(10)
+        body = self.get(rating=3)
+        self.assertEqual([review['comment'] for review in body['results']], ['Review 7', 'Review 2'])
+        self.assertEqual({review['rating'] for review in body['results']}, {3})
+
+    def test_invalid_rating_and_unknown_product_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'rating': 'five'}).status_code, 400)
+        missing = self.other.pk + 100
+        self.assertEqual(self.client.get(f'/api/products/products/{missing}/reviews/').status_code, 404)
+
+    def test_query_count_is_independent_of_rows(self):
+        def request():
+            # username comes from the joined user, not a query per review
+            self.assertTrue(all(review['username'] for review in self.get(page_size=50)['results']))
+
+        self.assertQueryCountConstant(self.add_reviews, request, sizes=(1, 15))
+
+
+class ReserveStockTests(TestCase):
+    def setUp(self):
+        farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        self.carrots = Product.objects.create(name='Carrots', price=2, quantity=5, farmer=farmer)
+        self.onions = Product.objects.create(name='Onions', price=1, quantity=3, farmer=farmer)
+
+    def assertStock(self, carrots, onions):
+        self.carrots.refresh_from_db()
+        self.onions.refresh_from_db()
+        self.assertEqual((self.carrots.quantity, self.onions.quantity), (carrots, onions))
+
+    def test_multi_item_reservation_decrements_each_line(self):
+        reserve_stock([(self.carrots.pk, 2), (self.onions.pk, 1), (self.carrots.pk, 1)])
+        self.assertStock(2, 2)
+
+    def test_stock_can_reach_exactly_zero(self):
+        reserve_stock([(self.carrots.pk, 5), (self.onions.pk, 3)])
+        self.assertStock(0, 0)
+        with self.assertRaises(InsufficientStock):
+            reserve_stock([(self.carrots.pk, 1)])
+        self.assertStock(0, 0)
+
+    def test_shortage_decrements_nothing(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_stock([(self.carrots.pk, 2), (self.onions.pk, 4)])
+        self.assertEqual(raised.exception.shortages, [(self.onions, 4, 3)])
+        self.assertStock(5, 3)
+
+    def test_missing_product_is_a_shortage(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_stock([(self.carrots.pk, 1), (self.onions.pk + 100, 1)])
+        self.assertEqual(raised.exception.shortages, [(None, 1, 0)])
+        self.assertStock(5, 3)
+
+    def test_order_for_more_than_the_stock_is_rejected(self):
+        buyer = User.objects.create(username='buyer', email='buyer@example.com', is_buyer=True)
+        client = APIClient()
+        client.force_authenticate(buyer)
+        response = client.post('/api/orders/orders/', {
+            'order_items': [{'product_id': self.carrots.pk, 'quantity': 1},
+                            {'product_id': self.onions.pk, 'quantity': 9}],
+            'delivery_address': 'Farm road',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Onions', str(response.json()))
+        self.assertStock(5, 3)
+
+
+class CatalogueCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(name='Carrots', price=2, quantity=5, farmer=self.farmer)
+
+    def farmer_names(self):
+        list_body = self.client.get('/api/products/products/').json()
+        detail_body = self.client.get(f'/api/products/products/{self.product.pk}/').json()
+        return list_body['results'][0]['farmer_details']['first_name'], detail_body['farmer_details']['first_name']
+
+    def test_farmer_update_refreshes_cached_products(self):
+        self.assertEqual(self.farmer_names(), (None, None))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.farmer.first_name = 'Ann'
+            self.farmer.save()
+        self.assertEqual(self.farmer_names(), ('Ann', 'Ann'))
+
+    def test_login_bookkeeping_keeps_the_cache(self):
+        version = get_catalogue_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.farmer.save(update_fields=['last_login'])
+        self.assertEqual(get_catalogue_version(), version)
+
+    def cached(self, url):
+        """ The list and detail bodies at ``url`` as the API serves them now """
+        response = self.client.get(url)
+        return response.json() if response.status_code == 200 else response.status_code
+
+    def product_bodies(self):
+        return (self.cached('/api/products/products/')['results'],
+                self.cached(f'/api/products/products/{self.product.pk}/'))
+
+    def test_unsignalled_writes_are_not_seen(self):
+        before = self.product_bodies()
+        Product.objects.filter(pk=self.product.pk).update(name='Beets')
+        self.assertEqual(self.product_bodies(), before)
+
+    def test_product_save_and_delete_retire_cached_responses(self):
+        self.product_bodies()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Beets'
+            self.product.save()
+        products, detail = self.product_bodies()
+        self.assertEqual(([p['name'] for p in products], detail['name']), (['Beets'], 'Beets'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.product.pk).delete()
+        self.assertEqual(self.product_bodies(), ([], 404))
+
+    def test_category_save_and_delete_retire_cached_responses(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(name='Roots')
+            self.product.category = category
+            self.product.save()
+        url = f'/api/products/categories/{category.pk}/'
+        self.assertEqual(self.cached(url)['name'], 'Roots')
+        self.assertEqual(self.product_bodies()[1]['category'], category.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            category.name = 'Vegetables'
+            category.save()
+        self.assertEqual(self.cached(url)['name'], 'Vegetables')
+        self.assertEqual([c['name'] for c in self.cached('/api/products/categories/')['results']], ['Vegetables'])
+        with self.captureOnCommitCallbacks(execute=True):
+            category.delete()
+        self.assertEqual(self.cached(url), 404)
+        self.assertEqual(self.cached('/api/products/categories/')['results'], [])
+        self.assertIsNone(self.product_bodies()[1]['category'])
+
+    def test_order_stock_reservation_retires_cached_responses(self):
+        self.assertEqual(self.product_bodies()[1]['quantity'], 5)
+        buyer = User.objects.create(username='buyer', email='buyer@example.com', is_buyer=True)
+        client = APIClient()
+        client.force_authenticate(buyer)
+        version = get_catalogue_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/orders/orders/', {
+                'order_items': [{'product_id': self.product.pk, 'quantity': 2}],
+                'delivery_address': 'Farm road',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertGreater(get_catalogue_version(), version)
+        self.assertEqual(self.product_bodies()[1]['quantity'], 3)
+
+
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        self.category = Category.objects.create(name='Vegetables')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(
+                name='Carrots', price=2, quantity=5, farmer=self.farmer, category=self.category)
+        self.detail_url = f'/api/products/products/{self.product.pk}/'
+
+    def revalidate(self, url, **headers):
+        etag = self.client.get(url, **headers)['ETag']
+        return etag, self.client.get(url, HTTP_IF_NONE_MATCH=etag, **headers).status_code
+
+    def test_unchanged_list_and_detail_answer_304(self):
+        for url in ('/api/products/products/', self.detail_url):
+            self.assertEqual(self.revalidate(url)[1], 304)
+
+    def test_detail_honours_if_modified_since(self):
+        last_modified = self.client.get(self.detail_url)['Last-Modified']
+        response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_farmer_update_changes_validators(self):
+        list_etag, _ = self.revalidate('/api/products/products/')
+        detail_etag, _ = self.revalidate(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.farmer.first_name = 'Ann'
+            self.farmer.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['farmer_details']['first_name'], 'Ann')
+        response = self.client.get('/api/products/products/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_category_delete_changes_detail_validator(self):
+        detail_etag, _ = self.revalidate(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['category'])
+
+    def test_renderers_do_not_share_validators(self):
+        for url in ('/api/products/products/', self.detail_url):
+            json_etag = self.client.get(url, HTTP_ACCEPT='application/json')['ETag']
+            html_etag = self.client.get(url, HTTP_ACCEPT='text/html')['ETag']
+            self.assertNotEqual(json_etag, html_etag)
+            response = self.client.get(url, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=json_etag)
+            self.assertEqual(response.status_code, 200)
+
+
+class GenerateVariantsTests(ImageVariantTestMixin, TestCase):
+    def test_variants_fit_the_width_without_upscaling(self):
+        name = default_storage.save('product_images/a.jpg', self.upload('a.jpg'))
+        variants = generate_variants(name)
+        self.assertEqual(variants['source'], name)
+        sizes = variants['sizes']
+        self.assertEqual((sizes['thumb']['width'], sizes['thumb']['height']), (160, 100))
+        self.assertEqual((sizes['large']['width'], sizes['large']['height']), (320, 200))
+        for entry in sizes.values():
+            for extension, image_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                with default_storage.open(entry[extension]) as file, Image.open(file) as image:
+                    self.assertEqual(image.format, image_format)
+                    self.assertEqual(image.size, (entry['width'], entry['height']))
+
+    def test_rotated_sources_use_the_displayed_orientation(self):
+        name = default_storage.save('product_images/r.jpg', self.upload('r.jpg', orientation=6))
+        thumb = generate_variants(name)['sizes']['thumb']
+        self.assertEqual((thumb['width'], thumb['height']), (160, 256))
+
+    def test_rerunning_reuses_the_rendered_files(self):
+        name = default_storage.save('product_images/a.jpg', self.upload('a.jpg'))
+        first = generate_variants(name)
+        directory = default_storage.path(first['sizes']['thumb']['webp']).rsplit('/', 1)[0]
+        files = sorted(default_storage.listdir(directory)[1])
+        self.assertEqual(generate_variants(name), first)
+        self.assertEqual(sorted(default_storage.listdir(directory)[1]), files)
+
+
+class ProductImageVariantTests(ImageVariantTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        self.product = Product.objects.create(
+            name='Carrots', price=2, quantity=5, farmer=self.farmer, image=self.upload('carrots.jpg'))
+
+    def test_upload_queues_a_variant_job(self):
+        job = Job.objects.get(name='products.images.generate_product_image_variants')
+        self.assertEqual(job.args, [self.product.pk])
+
+    def test_job_stores_variants_and_serializer_exposes_srcset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_product_image_variants(self.product.pk)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_variants['source'], self.product.image.name)
+        body = APIClient().get(f'/api/products/products/{self.product.pk}/').json()
+        self.assertEqual(set(body['image_variants']['sizes']), {'thumb', 'large'})
+        self.assertIn(' 160w, ', body['image_variants']['srcset']['webp'])
+
+    def test_stale_variants_do_not_replace_a_newer_upload(self):
+        variants = generate_variants(self.product.image.name)
+        self.product.image = self.upload('beets.jpg')
+        self.product.save()
+        self.assertEqual(store_product_image_variants(self.product.pk, variants), 0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_variants, {})
+
+    def test_removing_the_image_drops_its_variants(self):
+        generate_product_image_variants(self.product.pk)
+        self.product.refresh_from_db()
+        self.product.image = None
+        self.product.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_variants, {})
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        self.other_farmer = User.objects.create(username='other', email='other@example.com', is_farmer=True)
+        self.category = Category.objects.create(name='Vegetables')
+        self.client = APIClient()
+        self.client.force_authenticate(self.farmer)
+
+    def import_csv(self, text, farmer=None):
+        return import_products(farmer or self.farmer, read_rows(io.BytesIO(text.encode()), 'csv'))
+
+    def upload(self, text, name='products.csv', **data):
+        return self.client.post('/api/products/products/import/', {
+            'file': SimpleUploadedFile(name, text.encode()), **data}, format='multipart')
+
+    def test_skus_are_unique_per_farmer(self):
+        Product.objects.create(name='Carrots', price=2, quantity=5, farmer=self.farmer, sku='C1')
+        Product.objects.create(name='Carrots', price=2, quantity=5, farmer=self.other_farmer, sku='C1')
+        Product.objects.create(name='Loose', price=1, quantity=1, farmer=self.farmer)
+        Product.objects.create(name='Loose', price=1, quantity=1, farmer=self.farmer)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Product.objects.create(name='Again', price=2, quantity=5, farmer=self.farmer, sku='C1')
+
+    def test_reimport_updates_by_sku(self):
+        result = self.import_csv(
+            "sku,name,price,quantity,category\n"
+            "C1,Carrots,2.00,5,vegetables\n"
+            "B1,Beets,3.00,7,\n")
+        self.assertEqual((result.created, result.updated, result.error_count), (2, 0, 0))
+        carrots = Product.objects.get(farmer=self.farmer, sku='C1')
+        self.assertEqual(carrots.category, self.category)
+
+        # Columns a row leaves out keep their stored values
+        result = self.import_csv("sku,quantity\nC1,9\nB1,7\n")
+        self.assertEqual((result.created, result.updated, result.unchanged), (0, 1, 1))
+        carrots.refresh_from_db()
+        self.assertEqual((carrots.name, carrots.quantity, carrots.category), ('Carrots', 9, self.category))
+        self.assertEqual(Product.objects.filter(farmer=self.farmer).count(), 2)
+
+    def test_skus_of_other_farmers_are_not_touched(self):
+        theirs = Product.objects.create(name='Carrots', price=2, quantity=5, farmer=self.other_farmer, sku='C1')
+        result = self.import_csv("sku,name,price,quantity\nC1,My carrots,4,1\n")
+        self.assertEqual(result.created, 1)
+        theirs.refresh_from_db()
+        self.assertEqual((theirs.name, theirs.quantity), ('Carrots', 5))
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        result = self.import_csv(
+            "sku,name,price,quantity,category\n"
+            "C1,Carrots,2.00,5,\n"
+            "B1,Beets,-1,7,\n"
+            "P1,,1.00,2,\n"
+            "O1,Onions,1.00,3,Fruit\n"
+            "C1,Carrots again,2.00,5,\n")
+        self.assertEqual((result.created, result.error_count), (1, 4))
+        self.assertEqual([row_number for row_number, _ in result.errors], [6, 3, 4, 5])
+        errors = dict(result.errors)
+        self.assertIn('price', errors[3])
+        self.assertIn('name', errors[4])
+        self.assertEqual(errors[5], {'category': ["Unknown category 'Fruit'."]})
+        self.assertEqual(errors[6], {'sku': ["Duplicate sku 'C1' in this import."]})
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['C1'])
+
+    def test_unparsable_json_lines_are_reported(self):
+        rows = read_rows(io.BytesIO(
+            b'{"sku": "C1", "name": "Carrots", "price": "2", "quantity": 5}\n'
+            b'not json\n'
+            b'[1, 2]\n'), 'jsonl')
+        result = import_products(self.farmer, rows)
+        self.assertEqual((result.created, result.error_count), (1, 2))
+        self.assertEqual([row_number for row_number, _ in result.errors], [2, 3])
+
+    def test_bulk_import_reports_errors(self):
+        with mock.patch('products.importers.MAX_REPORTED_ERRORS', 1):
+            response = self.upload(
+                "sku,name,price,quantity\n"
+                "C1,Carrots,2,5\n"
+                "B1,Beets,-1,7\n"
+                "O1,Onions,x,3\n")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['created'], body['updated'], body['error_count']), (1, 0, 2))
+        self.assertEqual(len(body['errors']), 1)
+        self.assertEqual(body['errors'][0]['row'], 3)
+        self.assertIn('price', body['errors'][0]['errors'])
+        self.assertEqual(Product.objects.get(sku='C1').farmer, self.farmer)
+
+    def test_bulk_import_rejects_unusable_uploads(self):
+        response = self.client.post('/api/products/products/import/', {}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.upload("sku\n", name='products.xlsx').status_code, 400)
+        response = self.upload("sku,name\n", name='products.txt', format='jsonl')
+        self.assertEqual(response.status_code, 200)
+        # Latin-1 bytes are not UTF-8
+        response = self.client.post('/api/products/products/import/', {
+            'file': SimpleUploadedFile('products.csv', 'sku,name\nC1,Pi\xf1a\n'.encode('latin-1'))},
+            format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkStockUpdateTests(TestCase):
+    url = '/api/products/products/bulk/'
+
+    def setUp(self):
+        cache.clear()
+        self.farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        other_farmer = User.objects.create(username='other', email='other@example.com', is_farmer=True)
+        self.carrots = Product.objects.create(name='Carrots', price=2, quantity=5, farmer=self.farmer)
+        self.beets = Product.objects.create(name='Beets', price=3, quantity=7, farmer=self.farmer)
+        self.theirs = Product.objects.create(name='Onions', price=1, quantity=9, farmer=other_farmer)
+        self.client = APIClient()
+        self.client.force_authenticate(self.farmer)
+
+    def patch(self, changes):
+        return self.client.patch(self.url, changes, format='json')
+
+    def test_updates_changed_products_only(self):
+        updated_at = self.carrots.updated_at
+        response = self.patch([
+            {'id': self.carrots.pk, 'price': '2.50', 'quantity': 40},
+            {'id': self.beets.pk, 'quantity': 7},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'updated': [self.carrots.pk], 'unchanged': [self.beets.pk], 'conflicts': []})
+        self.carrots.refresh_from_db()
+        self.assertEqual((str(self.carrots.price), self.carrots.quantity), ('2.50', 40))
+        self.assertGreater(self.carrots.updated_at, updated_at)
+
+    def test_unknown_and_foreign_products_are_conflicts(self):
+        response = self.patch([
+            {'id': self.carrots.pk, 'quantity': 1},
+            {'id': self.theirs.pk, 'quantity': 0},
+            {'id': 999999, 'quantity': 3},
+        ])
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['updated'], [self.carrots.pk])
+        self.assertEqual(body['conflicts'], [
+            {'id': self.theirs.pk, 'reason': 'not_found', 'current': None},
+            {'id': 999999, 'reason': 'not_found', 'current': None},
+        ])
+        self.theirs.refresh_from_db()
+        self.assertEqual(self.theirs.quantity, 9)
+
+    def test_stale_updated_at_is_a_conflict(self):
+        stale = self.carrots.updated_at.isoformat()
+        Product.objects.filter(pk=self.carrots.pk).update(quantity=6, updated_at=timezone.now())
+        response = self.patch([{'id': self.carrots.pk, 'quantity': 1, 'updated_at': stale}])
+        conflict, = response.json()['conflicts']
+        self.assertEqual((conflict['reason'], conflict['current']['quantity']), ('modified', 6))
+        self.carrots.refresh_from_db()
+        self.assertEqual(self.carrots.quantity, 6)
+
+    def test_invalid_entries_reject_the_whole_request(self):
+        for changes in (
+            [{'id': self.carrots.pk, 'quantity': 1}, {'id': self.beets.pk, 'quantity': -1}],
+            [{'id': self.carrots.pk, 'price': '-0.01'}],
+            [{'id': self.carrots.pk}],
+            [{'id': self.carrots.pk, 'quantity': 1}, {'id': self.carrots.pk, 'quantity': 2}],
+        ):
+            with self.subTest(changes=changes):
+                self.assertEqual(self.patch(changes).status_code, 400)
+        self.carrots.refresh_from_db()
+        self.assertEqual((self.carrots.price, self.carrots.quantity), (2, 5))
+
+
+class FacetTests(TestCase):
+    url = '/api/products/products/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.vegetables = Category.objects.create(name='Vegetables')
+        self.fruit = Category.objects.create(name='Fruit')
+        self.ann = User.objects.create(username='ann', email='ann@example.com', is_farmer=True)
+        self.bob = User.objects.create(username='bob', email='bob@example.com', is_farmer=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            for farmer, category, price, quantity in (
+                (self.ann, self.vegetables, 3, 5),
+                (self.ann, self.vegetables, 12, 0),
+                (self.bob, self.vegetables, 7, 1),
+                (self.bob, self.fruit, 30, 2),
+            ):
+                Product.objects.create(name='Produce', price=price, quantity=quantity,
+                                       farmer=farmer, category=category)
+
+    def facets(self, **params):
+        response = self.client.get(self.url, {'facets': 'true', **params})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        facets = body['facets']
+        counts = {
+            name: {entry['value']: (entry['count'], entry['selected']) for entry in facets[name]}
+            for name in ('category', 'farmer', 'in_stock')
+        }
+        counts['price'] = [entry['count'] for entry in facets['price']]
+        return len(body['results']), counts
+
+    def test_selected_facet_still_counts_its_siblings(self):
+        count, facets = self.facets(category=self.vegetables.pk)
+        self.assertEqual(count, 3)
+        self.assertEqual(facets['category'], {self.vegetables.pk: (3, True), self.fruit.pk: (1, False)})
+        # The other facets are narrowed by the category
+        self.assertEqual(facets['farmer'], {self.ann.pk: (2, False), self.bob.pk: (1, False)})
+        self.assertEqual(facets['price'], [1, 1, 1, 0, 0, 0])
+        self.assertEqual(facets['in_stock'], {True: (2, False), False: (1, False)})
+
+    def test_each_facet_ignores_only_its_own_filter(self):
+        count, facets = self.facets(category=self.vegetables.pk, farmer=self.bob.pk, in_stock='true')
+        self.assertEqual(count, 1)
+        self.assertEqual(facets['category'], {self.vegetables.pk: (1, True), self.fruit.pk: (1, False)})
+        self.assertEqual(facets['farmer'], {self.ann.pk: (1, False), self.bob.pk: (1, True)})
+        self.assertEqual(facets['in_stock'], {True: (1, True), False: (0, False)})
+
+    def test_price_filter_keeps_every_price_bucket(self):
+        count, facets = self.facets(min_price='5', max_price='10')
+        self.assertEqual(count, 1)
+        self.assertEqual(facets['price'], [1, 1, 1, 1, 0, 0])
+
+    def test_cached_counts_follow_catalogue_changes(self):
+        _, before = self.facets()
+        # Written without signals: the cached payload is served
+        Product.objects.filter(category=self.fruit).update(category=self.vegetables)
+        self.assertEqual(self.facets()[1], before)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Apples', price=4, quantity=3, farmer=self.bob, category=self.fruit)
+        _, after = self.facets()
+        self.assertEqual(after['category'], {self.vegetables.pk: (4, False), self.fruit.pk: (1, False)})
+        self.assertEqual(after['farmer'], {self.bob.pk: (3, False), self.ann.pk: (2, False)})
+
+    def test_search_counts_every_match(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for price in range(1, 7):
+                Product.objects.create(name='Tomato', price=price, quantity=1,
+                                       farmer=self.ann, category=self.vegetables)
+            Product.objects.create(name='Apple', description='Goes with tomato', price=2, quantity=0,
+                                   farmer=self.bob, category=self.fruit)
+        count, facets = self.facets(q='tomato', page_size=3)
+        self.assertEqual(count, 3)
+        self.assertEqual(facets['category'], {self.vegetables.pk: (6, False), self.fruit.pk: (1, False)})
+        self.assertEqual(facets['farmer'], {self.ann.pk: (6, False), self.bob.pk: (1, False)})
+        self.assertEqual(facets['price'], [5, 2, 0, 0, 0, 0])
+        self.assertEqual(facets['in_stock'], {True: (6, False), False: (1, False)})
+        # The search is part of the cache key, and combines with the filters
+        count, facets = self.facets(q='tomato', category=self.fruit.pk)
+        self.assertEqual(count, 1)
+        self.assertEqual(facets['category'], {self.vegetables.pk: (6, False), self.fruit.pk: (1, True)})
+        self.assertEqual(facets['farmer'], {self.bob.pk: (1, False)})
+
+    def test_invalid_filters_are_rejected(self):
+        for params in ({'category': 'veg'}, {'min_price': 'NaN'}, {'in_stock': 'maybe'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class PriceStatsTests(TestCase):
+    url = '/api/products/products/price-stats/'
+
+    def setUp(self):
+        cache.clear()
+        self.snapshot = PriceSnapshot()
+        patcher = mock.patch('products.views.price_snapshot', self.snapshot)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        self.vegetables = Category.objects.create(name='Vegetables')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.carrots = self.add_product(2, self.vegetables)
+            self.beets = self.add_product(4, self.vegetables)
+            self.honey = self.add_product(9, None)
+
+    def add_product(self, price, category):
+        return Product.objects.create(name='Produce', price=price, quantity=1, farmer=self.farmer, category=category)
+
+    def stats(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_whole_catalogue_and_per_category(self):
+        stats = self.stats(bins=2)
+        self.assertEqual((stats['count'], stats['min'], stats['max'], stats['mean']), (3, 2.0, 9.0, 5.0))
+        self.assertEqual(stats['percentiles']['p50'], 4.0)
+        self.assertEqual([bucket['count'] for bucket in stats['histogram']], [2, 1])
+        self.assertEqual([(entry['category'], entry['count']) for entry in stats['categories']],
+                         [(None, 1), (self.vegetables.pk, 2)])
+        self.assertEqual(self.stats(category=self.vegetables.pk)['mean'], 3.0)
+        self.assertEqual(self.stats(category='none')['count'], 1)
+
+    def test_updates_are_patched_in_without_a_rebuild(self):
+        self.stats()
+        with mock.patch.object(self.snapshot, '_rebuild', wraps=self.snapshot._rebuild) as rebuild, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.carrots.price = 6
+            self.carrots.save()
+            self.add_product(1, self.vegetables)
+        stats = self.stats(category=self.vegetables.pk)
+        rebuild.assert_not_called()
+        self.assertEqual((stats['count'], stats['min'], stats['max']), (3, 1.0, 6.0))
+
+    def test_deleted_products_are_dropped(self):
+        self.stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.beets.delete()
+        self.assertEqual(self.stats(category=self.vegetables.pk)['count'], 1)
+        self.assertEqual(self.stats()['count'], 2)
+
+    def test_deleted_category_detaches_its_products(self):
+        self.stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vegetables.delete()
+        stats = self.stats()
+        self.assertEqual([(entry['category'], entry['count']) for entry in stats['categories']], [(None, 3)])
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in ({'bins': 0}, {'bins': 101}, {'bins': 'x'}, {'category': 'veg'}, {'category': 999999}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
 
-# Create your tests here.
+    def test_memoized_stats_are_capped(self):
+        with mock.patch('products.pricing.STATS_MEMO_SIZE', 2):
+            for bins in (1, 2, 3, 2):
+                self.stats(bins=bins)
+        self.assertEqual(list(self.snapshot._stats), [(None, 3), (None, 2)])
@@ -1,9 +1,25 @@
+import csv
+
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
-from .models import Product, Category
-from .serializers import ProductSerializer, CategorySerializer
+from .models import Product, Category, ProductRecommendation
+from reviews.models import Review
+from reviews.serializers import ReviewSerializer
+from .serializers import ProductSerializer, CategorySerializer, ProductStockUpdateSerializer
+from .search import search_products
+from .importers import FORMATS, guess_format, import_products, read_rows
+from .inventory import apply_stock_updates
+from .pricing import NO_CATEGORY, price_snapshot
+from .facets import TRUE_VALUES, apply_facet_filters, get_facet_counts, parse_facet_filters
+from .cache import (
+    CatalogueCacheMixin, catalogue_list_etag, updated_at_etag, updated_at_last_modified,
+)
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
 
 class IsFarmer(permissions.BasePermission):
@@ -19,7 +35,11 @@ class IsFarmer(permissions.BasePermission):
         return request.user.is_authenticated and request.user.is_farmer
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+# Unchanged catalogue data is answered with 304 Not Modified
+@method_decorator(condition(etag_func=catalogue_list_etag), name='list')
+@method_decorator(condition(etag_func=updated_at_etag(Product),
+                            last_modified_func=updated_at_last_modified(Product)), name='retrieve')
+class ProductViewSet(CatalogueCacheMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsFarmer]
@@ -29,15 +49,66 @@ class ProductViewSet(viewsets.ModelViewSet):
         """
         This view should return a list of all products,
         but for non-GET methods, it filters by the farmer.
+        List requests can also search, filter and sort (see filter_list).
         """
-        queryset = Product.objects.all()
+        # farmer_details is nested in every row, so join it up front
+        queryset = Product.objects.select_related('farmer', 'category').order_by('-id')
 
         # For unsafe methods other than POST, only return user's products
         if self.request.method not in permissions.SAFE_METHODS and self.request.method != 'POST':
             queryset = queryset.filter(farmer=self.request.user)
 
+        if self.action == 'list':
+            queryset = self.filter_list(queryset)
+
+        return queryset
+
+    def filter_list(self, queryset):
+        """
+        List options:
+        * ``?q=<terms>`` ranks matching products by relevance.
+        * ``?min_rating=<n>`` keeps products whose average rating is at least n.
+        * ``?category=``, ``?farmer=``, ``?min_price=``, ``?max_price=`` and
+          ``?in_stock=`` filter on the facets (see products.facets);
+          ``?facets=true`` adds the per-value counts to the response.
+        * ``?ordering=rating`` / ``-rating`` sorts by average rating.
+        Ratings come from the aggregates stored on the product, so none of
+        these joins the reviews table.
+        """
+        queryset = self.narrow_list(queryset)
+        queryset = apply_facet_filters(queryset, parse_facet_filters(self.request.query_params))
+
+        ordering = self.request.query_params.get('ordering')
+        if ordering in ('rating', '-rating'):
+            direction = '-' if ordering.startswith('-') else ''
+            queryset = queryset.order_by(f'{direction}rating_avg', f'{direction}id')
         return queryset
 
+    def narrow_list(self, queryset):
+        """ The search and rating filters, which facet counts are taken within """
+        params = self.request.query_params
+        min_rating = params.get('min_rating')
+        if min_rating:
+            try:
+                queryset = queryset.filter(rating_count__gt=0, rating_avg__gte=float(min_rating))
+            except ValueError:
+                raise ValidationError({'min_rating': 'A number is required.'})
+
+        query = params.get('q', '').strip()
+        if query:
+            queryset = search_products(queryset, query)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200 and request.query_params.get('facets', '').lower() in TRUE_VALUES:
+            response.data['facets'] = get_facet_counts(
+                self.narrow_list(Product.objects.all()),
+                parse_facet_filters(request.query_params),
+                cache_key_extra=(request.query_params.get('q', '').strip(), request.query_params.get('min_rating')),
+            )
+        return response
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context.update({"request": self.request})
@@ -49,9 +120,117 @@ class ProductViewSet(viewsets.ModelViewSet):
         """
         serializer.save(farmer=self.request.user)
 
+    @action(detail=True, methods=['get'], serializer_class=ReviewSerializer)
+    def reviews(self, request, pk=None):
+        """
+        The product's reviews, newest first, one cursor page at a time.
+        ``?rating=<n>`` keeps only reviews with that rating.
+        """
+        if not Product.objects.filter(pk=pk).exists():
+            raise NotFound("Product not found.")
+        reviews = Review.objects.filter(product_id=pk).select_related('user').order_by('-created_at', '-id')
+        rating = request.query_params.get('rating')
+        if rating:
+            try:
+                reviews = reviews.filter(rating=int(rating))
+            except ValueError:
+                raise ValidationError({'rating': 'A whole number is required.'})
+        page = self.paginate_queryset(reviews)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def recommendations(self, request, pk=None):
+        """
+        "Customers who bought this also bought": up to ``?limit=`` (default
+        10) products, read from the precomputed list in one indexed query.
+        """
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            raise ValidationError({'limit': 'A whole number is required.'})
+        recommendations = ProductRecommendation.objects.filter(product_id=pk).select_related(
+            'recommended__farmer', 'recommended__category').order_by('rank')[:max(limit, 0)]
+        products = [recommendation.recommended for recommendation in recommendations]
+        if not products and not Product.objects.filter(pk=pk).exists():
+            raise NotFound("Product not found.")
+        return Response(ProductSerializer(products, many=True, context=self.get_serializer_context()).data)
+
+    @action(detail=False, methods=['get'], url_path='price-stats')
+    def price_stats(self, request):
+        """
+        Price min/max/mean, percentiles and a histogram for a price slider:
+        for ``?category=<id>`` (``none`` for uncategorised products), or for
+        the whole catalogue and each category. ``?bins=`` sets the number of
+        histogram buckets (default 10).
+        """
+        try:
+            bins = int(request.query_params.get('bins', 10))
+        except ValueError:
+            bins = 0
+        if not 1 <= bins <= 100:
+            raise ValidationError({'bins': 'Expected a whole number from 1 to 100.'})
+        category = request.query_params.get('category')
+        if category is not None:
+            try:
+                category = NO_CATEGORY if category.lower() == 'none' else int(category)
+            except ValueError:
+                raise ValidationError({'category': 'Expected a category id or "none".'})
+            if category != NO_CATEGORY and not Category.objects.filter(pk=category).exists():
+                raise ValidationError({'category': 'Unknown category.'})
+        return Response(price_snapshot.stats(category=category, bins=bins))
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Create or update the farmer's products from a CSV or JSON Lines file
+        uploaded as ``file``, matching existing products by ``sku``. The file
+        is read row by row and written in batches; the response reports the
+        counts and the errors of the rows that were skipped.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload a CSV or JSON Lines file in the 'file' field."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('format') or guess_format(upload.name)
+        if file_format not in FORMATS:
+            return Response({"error": f"Unknown file format; send 'format' as one of: {', '.join(FORMATS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = import_products(request.user, read_rows(upload, file_format))
+        except (UnicodeDecodeError, csv.Error) as e:
+            # Batches before the unreadable part have already been saved
+            return Response({"error": f"Could not read the file: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['patch'], url_path='bulk', parser_classes=[JSONParser])
+    def bulk_update_stock(self, request):
+        """
+        Update the price and/or quantity of many of the farmer's products:
+        ``[{"id": 1, "price": "2.50", "quantity": 40, "updated_at": "..."}, ...]``.
+        ``updated_at`` is optional; when sent, a product changed since then is
+        reported under ``conflicts`` (with its current values) and left alone,
+        as are products that don't exist or belong to someone else.
+        """
+        serializer = ProductStockUpdateSerializer(data=request.data, many=True, max_length=1000)
+        serializer.is_valid(raise_exception=True)
+        updated, unchanged, conflicts = apply_stock_updates(request.user, serializer.validated_data)
+        return Response({
+            "updated": updated,
+            "unchanged": unchanged,
+            "conflicts": [
+                {"id": product_id, "reason": reason,
+                 "current": ProductStockUpdateSerializer(product).data if product else None}
+                for product_id, reason, product in conflicts
+            ],
+        }, status=status.HTTP_200_OK)
+
 
-class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+@method_decorator(condition(etag_func=catalogue_list_etag), name='list')
+@method_decorator(condition(etag_func=updated_at_etag(Category),
+                            last_modified_func=updated_at_last_modified(Category)), name='retrieve')
+class CategoryViewSet(CatalogueCacheMixin, viewsets.ModelViewSet):
+    queryset = Category.objects.order_by('id')
     serializer_class = CategorySerializer
     # Only farmers can create/edit categories
     permission_classes = [IsFarmer]
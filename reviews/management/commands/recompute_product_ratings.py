@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from reviews.ratings import recompute_product_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute the rating sum, count and average of every product from its reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        fixed = recompute_product_ratings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Fixed the rating aggregates of {fixed} products."))
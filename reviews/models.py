@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from users.models import User
 from products.models import Product
 
@@ -7,4 +7,28 @@ class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     rating = models.IntegerField()
     comment = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='review_created_idx'),
+            # Product pages: a product's reviews, newest first, by cursor
+            models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+        ]
+
+    # (product_id, rating) as last loaded or saved; reviews.signals uses it
+    # to move a changed review out of the old product's aggregates
+    _saved_rating = (None, None)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'product_id' in instance.__dict__ and 'rating' in instance.__dict__:
+            instance._saved_rating = (instance.product_id, instance.rating)
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The aggregates on Product are updated by a post_save receiver and
+        # must commit or roll back together with the review
+        with transaction.atomic():
+            super().save(*args, **kwargs)
@@ -0,0 +1,56 @@
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from products.cache import invalidate_catalogue
+from products.models import Product
+
+from .models import Review
+
+
+def adjust_product_rating(product_id, rating_delta, count_delta):
+    """
+    Add ``rating_delta`` to a product's rating sum and ``count_delta`` to
+    its review count, recomputing the average, in one UPDATE. The new values
+    are computed by the database from the stored ones (``F()``), so
+    concurrent reviews of the same product don't overwrite each other.
+    """
+    new_sum = F('rating_sum') + rating_delta
+    new_count = F('rating_count') + count_delta
+    Product.objects.filter(pk=product_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        # SET expressions all read the row as it was before the UPDATE
+        rating_avg=Case(
+            When(rating_count=-count_delta, then=Value(0.0)),
+            default=Cast(new_sum, FloatField()) / Cast(new_count, FloatField()),
+            output_field=FloatField(),
+        ),
+        updated_at=timezone.now(),
+    )
+    invalidate_catalogue()
+
+
+def recompute_product_ratings(batch_size=500):
+    """
+    Recompute every product's rating aggregates from its reviews and write
+    the ones that drifted. Returns the number of products fixed.
+    """
+    totals = {
+        row['product_id']: (row['total'], row['count'])
+        for row in Review.objects.values('product_id').annotate(total=Sum('rating'), count=Count('id'))
+    }
+    now = timezone.now()
+    fixed = []
+    stored = Product.objects.values_list('id', 'rating_sum', 'rating_count', 'rating_avg')
+    for pk, rating_sum, rating_count, rating_avg in stored.iterator(chunk_size=2000):
+        total, count = totals.get(pk, (0, 0))
+        average = total / count if count else 0.0
+        if (rating_sum, rating_count) != (total, count) or abs(rating_avg - average) > 1e-9:
+            fixed.append(Product(pk=pk, rating_sum=total, rating_count=count,
+                                 rating_avg=average, updated_at=now))
+    Product.objects.bulk_update(
+        fixed, ['rating_sum', 'rating_count', 'rating_avg', 'updated_at'], batch_size=batch_size)
+    if fixed:
+        invalidate_catalogue()
+    return len(fixed)
@@ -2,6 +2,8 @@ from rest_framework import serializers
 from .models import Review
 
 class ReviewSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+
     class Meta:
         model = Review
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
@@ -0,0 +1,67 @@
+import threading
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from products.models import Product
+
+from .models import Review
+from .ratings import adjust_product_rating
+
+# (deletion origin, product ids) of the products a delete() is removing. Their
+# reviews go by cascade first; recomputing the aggregates of a row about to be
+# deleted would only cost an UPDATE and a catalogue bump per review.
+_deleting_products = threading.local()
+
+
+@receiver(pre_save, sender=Review)
+def remember_saved_rating(sender, instance, raw=False, **kwargs):
+    # Reviews loaded without product/rating (e.g. with .only()) or built by
+    # hand with an existing pk: read what is stored before it is overwritten
+    if not raw and instance.pk is not None and instance._saved_rating == (None, None):
+        stored = Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+        if stored:
+            instance._saved_rating = stored
+
+
+@receiver(post_save, sender=Review)
+def update_product_rating(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_product_id, old_rating = instance._saved_rating
+    if created or old_product_id is None:
+        adjust_product_rating(instance.product_id, instance.rating, 1)
+    elif old_product_id != instance.product_id:
+        adjust_product_rating(old_product_id, -old_rating, -1)
+        adjust_product_rating(instance.product_id, instance.rating, 1)
+    elif old_rating != instance.rating:
+        adjust_product_rating(instance.product_id, instance.rating - old_rating, 0)
+    instance._saved_rating = (instance.product_id, instance.rating)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_deleted_product(sender, instance, origin=None, **kwargs):
+    # A delete() sends every pre_delete before any row goes
+    deleting = getattr(_deleting_products, 'value', None)
+    if deleting is None or deleting[0] is not origin:
+        deleting = _deleting_products.value = (origin, set())
+    deleting[1].add(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def forget_deleted_product(sender, instance, **kwargs):
+    # Reviews are deleted before the products they point to
+    _deleting_products.value = None
+
+
+@receiver(post_delete, sender=Review)
+def remove_product_rating(sender, instance, origin=None, **kwargs):
+    # Also sent for reviews deleted by cascade, inside the deletion's
+    # transaction. Cascades load the full row, so the stored values are known.
+    old_product_id, old_rating = instance._saved_rating
+    if old_product_id is None:  # deleted without being loaded or saved
+        old_product_id, old_rating = instance.product_id, instance.rating
+    deleting = getattr(_deleting_products, 'value', None)
+    if deleting is not None and deleting[0] is origin and old_product_id in deleting[1]:
+        return
+    adjust_product_rating(old_product_id, -old_rating, -1)
@@ -1,3 +1,95 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from products.models import Product
+from users.models import User
+
+from .models import Review
+from .ratings import recompute_product_ratings
+
+
+class ProductRatingTests(TestCase):
+    def setUp(self):
+        farmer = User.objects.create(username='farmer', email='farmer@example.com', is_farmer=True)
+        self.buyer = User.objects.create(username='buyer', email='buyer@example.com', is_buyer=True)
+        self.carrots = Product.objects.create(name='Carrots', price=2, quantity=5, farmer=farmer)
+        self.beets = Product.objects.create(name='Beets', price=3, quantity=7, farmer=farmer)
+
+    def review(self, product, rating, user=None):
+        return Review.objects.create(product=product, user=user or self.buyer, rating=rating, comment='')
+
+    def assertRating(self, product, rating_sum, rating_count, rating_avg):
+        product.refresh_from_db()
+        self.assertEqual((product.rating_sum, product.rating_count), (rating_sum, rating_count))
+        self.assertAlmostEqual(product.rating_avg, rating_avg)
+
+    def test_create_adds_to_the_aggregates(self):
+        self.review(self.carrots, 4)
+        self.review(self.carrots, 5)
+        self.assertRating(self.carrots, 9, 2, 4.5)
+        self.assertRating(self.beets, 0, 0, 0)
+
+    def test_edit_applies_the_difference(self):
+        review = self.review(self.carrots, 4)
+        self.review(self.carrots, 2)
+        review.rating = 1
+        review.save()
+        self.assertRating(self.carrots, 3, 2, 1.5)
+        # Loaded without its rating: the stored one is read before saving
+        partial = Review.objects.only('id').get(pk=review.pk)
+        partial.rating = 5
+        partial.save()
+        self.assertRating(self.carrots, 7, 2, 3.5)
+
+    def test_moving_a_review_moves_its_rating(self):
+        review = self.review(self.carrots, 4)
+        review.product = self.beets
+        review.save()
+        self.assertRating(self.carrots, 0, 0, 0)
+        self.assertRating(self.beets, 4, 1, 4.0)
+
+    def test_delete_removes_from_the_aggregates(self):
+        review = self.review(self.carrots, 4)
+        self.review(self.carrots, 2)
+        review.delete()
+        self.assertRating(self.carrots, 2, 1, 2.0)
+        Review.objects.filter(product=self.carrots).delete()
+        self.assertRating(self.carrots, 0, 0, 0)
+
+    def test_deleting_a_product_skips_its_rating_updates(self):
+        for rating in (3, 4, 5):
+            self.review(self.carrots, rating)
+        with CaptureQueriesContext(connection) as context:
+            self.carrots.delete()
+        updates = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('UPDATE "products_product"')]
+        self.assertEqual(updates, [])
+        self.assertFalse(Review.objects.exists())
+
+    def test_deleting_a_user_still_updates_other_products(self):
+        critic = User.objects.create(username='critic', email='critic@example.com', is_buyer=True)
+        self.review(self.carrots, 5)
+        self.review(self.carrots, 1, user=critic)
+        critic.delete()
+        self.assertRating(self.carrots, 5, 1, 5.0)
+
+    def test_recompute_fixes_drifted_products(self):
+        self.review(self.carrots, 4)
+        Product.objects.filter(pk=self.carrots.pk).update(rating_sum=40, rating_count=3, rating_avg=13)
+        self.assertEqual(recompute_product_ratings(), 1)
+        self.assertRating(self.carrots, 4, 1, 4.0)
+        self.assertEqual(recompute_product_ratings(), 0)
 
-# Create your tests here.
+    def test_migration_backfills_existing_reviews(self):
+        self.review(self.carrots, 4)
+        self.review(self.carrots, 3)
+        self.review(self.beets, 5)
+        Product.objects.update(rating_sum=0, rating_count=0, rating_avg=0)
+        migration = import_module('products.migrations.0008_product_rating_aggregates')
+        migration.populate_rating_aggregates(apps, None)
+        self.assertRating(self.carrots, 7, 2, 3.5)
+        self.assertRating(self.beets, 5, 1, 5.0)
@@ -3,5 +3,6 @@ from .models import Review
 from .serializers import ReviewSerializer
 
 class ReviewViewSet(viewsets.ModelViewSet):
-    queryset = Review.objects.all()
-    serializer_class = ReviewSerializer
\ No newline at end of file
+    # username is nested in every row, so join the user up front
+    queryset = Review.objects.select_related('user').order_by('-created_at', '-id')
+    serializer_class = ReviewSerializer
@@ -0,0 +1,106 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class UserCache:
+    """
+    Cache of authenticated ``User`` records (with their profile) by user id.
+
+    A bounded in-process LRU answers most lookups. When ``SHARED_CACHE``
+    names an entry in ``CACHES``, that cache adds a second tier shared by all
+    workers and holds a per-user version. Entries are keyed by user id and
+    that version, and ``invalidate`` bumps it, so a user saved in one worker
+    is reloaded in every other worker too. Without a shared tier, other
+    workers may serve a stale entry for up to ``TIMEOUT`` seconds.
+
+    Callers always get their own copy of the cached instance.
+    """
+
+    def __init__(self, max_size=1024, timeout=60, shared_alias=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.shared_alias = shared_alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'USER_AUTH_CACHE', {})
+        return cls(
+            max_size=options.get('MAX_SIZE', 1024),
+            timeout=options.get('TIMEOUT', 60),
+            shared_alias=options.get('SHARED_CACHE'),
+        )
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def _version_key(self, user_id):
+        return f'users:auth-version:{user_id}'
+
+    def _user_key(self, user_id, version):
+        return f'users:auth-user:{user_id}:{version}'
+
+    def _version(self, user_id):
+        shared = self.shared
+        return shared.get(self._version_key(user_id), 0) if shared is not None else 0
+
+    def get(self, user_id):
+        version = self._version(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry_version, expires_at, user = entry
+                if entry_version == version and expires_at > now:
+                    self._entries.move_to_end(user_id)
+                    return copy.deepcopy(user)
+                del self._entries[user_id]
+
+        shared = self.shared
+        if shared is not None:
+            user = shared.get(self._user_key(user_id, version))
+            if user is not None:
+                self._store_local(user_id, version, user)
+                return copy.deepcopy(user)
+        return None
+
+    def set(self, user_id, user):
+        version = self._version(user_id)
+        user = copy.deepcopy(user)
+        self._store_local(user_id, version, user)
+        shared = self.shared
+        if shared is not None:
+            shared.set(self._user_key(user_id, version), user, self.timeout)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        shared = self.shared
+        if shared is not None:
+            key = self._version_key(user_id)
+            if not shared.add(key, 1, None):
+                try:
+                    shared.incr(key)
+                except ValueError:  # evicted between add() and incr()
+                    shared.set(key, 1, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store_local(self, user_id, version, user):
+        with self._lock:
+            self._entries[user_id] = (version, time.monotonic() + self.timeout, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+user_cache = UserCache.from_settings()
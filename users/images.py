@@ -0,0 +1,40 @@
+import logging
+
+from django.utils import timezone
+
+from agro_ecommerce.images import generate_variants
+
+from .cache import user_cache
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+
+def generate_profile_picture_variants(profile_id):
+    """ Background task: render the variants of a profile's current picture """
+    profile = Profile.objects.filter(pk=profile_id).only('profile_picture', 'picture_variants').first()
+    if profile is None or not profile.profile_picture:
+        return
+    if profile.picture_variants.get('source') == profile.profile_picture.name:
+        return
+    try:
+        variants = generate_variants(profile.profile_picture.name)
+    except FileNotFoundError:
+        logger.warning("Picture %s of profile %s is missing; no variants generated.",
+                       profile.profile_picture.name, profile_id)
+        return
+    store_profile_picture_variants(profile_id, variants)
+
+
+def store_profile_picture_variants(profile_id, variants):
+    """
+    Save ``variants`` if the profile still has the picture they were made
+    from. Returns the number of rows updated.
+    """
+    profiles = Profile.objects.filter(pk=profile_id)
+    updated = profiles.filter(profile_picture=variants['source']).update(
+        picture_variants=variants, updated_at=timezone.now())
+    if updated:
+        # The authentication cache holds users together with their profile
+        user_cache.invalidate(profiles.values_list('user_id', flat=True).first())
+    return updated
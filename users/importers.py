@@ -0,0 +1,77 @@
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .cache import user_cache
+from .models import Profile, User
+
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name', 'is_farmer', 'is_buyer')
+PROFILE_FIELDS = ('phone_number', 'address')
+TRUE_VALUES = {'true', '1', 't', 'y', 'yes'}
+
+
+def bulk_create_users(rows, batch_size=500):
+    """
+    Create users and their profiles from an iterable of dicts in batches.
+
+    Each batch is one INSERT for users and one for profiles instead of an
+    INSERT, a SELECT and an UPDATE per user through the post_save signals
+    (bulk_create does not send them, so profiles are built here). Rows whose
+    username or email already exists, in the database or earlier in the
+    input, are skipped.
+
+    Returns ``(created, skipped)`` where ``skipped`` lists
+    ``(row_number, reason)`` tuples.
+    """
+    created, skipped = 0, []
+    seen_usernames, seen_emails = set(), set()
+    batch = []
+    for row_number, row in enumerate(rows, start=1):
+        batch.append((row_number, row))
+        if len(batch) >= batch_size:
+            created += _create_batch(batch, seen_usernames, seen_emails, skipped)
+            batch = []
+    if batch:
+        created += _create_batch(batch, seen_usernames, seen_emails, skipped)
+    return created, skipped
+
+
+def _create_batch(batch, seen_usernames, seen_emails, skipped):
+    usernames = {row.get('username') for _, row in batch}
+    emails = {row.get('email') for _, row in batch}
+    existing_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    existing_emails = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+
+    users, profile_data = [], []
+    for row_number, row in batch:
+        username, email = row.get('username'), row.get('email')
+        if not username or not email:
+            skipped.append((row_number, "username and email are required"))
+            continue
+        if username in existing_usernames or username in seen_usernames:
+            skipped.append((row_number, f"username '{username}' already exists"))
+            continue
+        if email in existing_emails or email in seen_emails:
+            skipped.append((row_number, f"email '{email}' already exists"))
+            continue
+        seen_usernames.add(username)
+        seen_emails.add(email)
+
+        values = {field: row.get(field) for field in USER_FIELDS if row.get(field) not in (None, '')}
+        for flag in ('is_farmer', 'is_buyer'):
+            if flag in values:
+                values[flag] = str(values[flag]).lower() in TRUE_VALUES
+        # Same default as registration: a buyer unless flagged as a farmer
+        values.setdefault('is_buyer', not values.get('is_farmer', False))
+        # make_password(None) stores an unusable password
+        users.append(User(password=make_password(row.get('password') or None), **values))
+        profile_data.append({field: row[field] for field in PROFILE_FIELDS if row.get(field)})
+
+    if not users:
+        return 0
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        Profile.objects.bulk_create(
+            [Profile(user=user, **data) for user, data in zip(users, profile_data)])
+    for user in users:
+        user_cache.invalidate(user.pk)
+    return len(users)
@@ -0,0 +1,25 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from users.importers import bulk_create_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-create users and profiles from a CSV file with a header row "
+        "(username, email, first_name, last_name, is_farmer, is_buyer, "
+        "password, phone_number, address)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with open(options['path'], newline='', encoding='utf-8') as csv_file:
+            created, skipped = bulk_create_users(
+                csv.DictReader(csv_file), batch_size=options['batch_size'])
+        for row_number, reason in skipped:
+            self.stderr.write(f"Row {row_number}: {reason}")
+        self.stdout.write(self.style.SUCCESS(f"Created {created} users, skipped {len(skipped)}."))
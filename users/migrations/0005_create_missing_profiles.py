@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def create_missing_profiles(apps, schema_editor):
+    # Profiles are no longer created lazily on every user save, so make sure
+    # every existing user has one.
+    User = apps.get_model('users', 'User')
+    Profile = apps.get_model('users', 'Profile')
+    missing = User.objects.filter(profile__isnull=True).values_list('id', flat=True)
+    Profile.objects.bulk_create(
+        [Profile(user_id=user_id) for user_id in list(missing)], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_alter_profile_user_user_user_joined_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_profiles, migrations.RunPython.noop),
+    ]
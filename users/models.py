@@ -1,9 +1,11 @@
 # agro_ecommerce/users/models.py
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings  # Import settings
+from agro_ecommerce.background import run_in_background
+from .cache import user_cache
 
 # Function to define upload path (optional but good practice)
 
@@ -42,6 +44,11 @@ class User(AbstractUser):
         related_query_name="user",
     )
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['date_joined', 'id'], name='user_joined_idx'),
+        ]
+
     # Automatically set is_buyer to True if is_farmer is False during save
     # def save(self, *args, **kwargs):
     #     if not self.is_farmer:
@@ -62,10 +69,43 @@ class Profile(models.Model):
         blank=True,
         default='profile_pics/default/default_avatar.png'  # Add a default avatar path
     )
+    # Resized copies of `profile_picture`, written by users.images in the background
+    picture_variants = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Profile for {self.user.username}"
 
+    # --- Change tracking, so unchanged profiles are never rewritten ---
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_values = instance._tracked_values()
+        return instance
+
+    def _tracked_values(self):
+        return {
+            field.attname: field.value_to_string(self)
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+        }
+
+    def get_changed_fields(self):
+        """ Names of fields that differ from what was last loaded or saved """
+        saved = getattr(self, '_saved_values', None)
+        current = self._tracked_values()
+        if self._state.adding or saved is None:
+            return list(current)
+        return [name for name, value in current.items() if saved.get(name) != value]
+
+    def save(self, *args, **kwargs):
+        # Partial saves still advance updated_at, which the profile ETag uses
+        update_fields = kwargs.get('update_fields')
+        if update_fields:
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+        super().save(*args, **kwargs)
+        self._saved_values = self._tracked_values()
+
     # Optional: Method to get picture URL easily
     @property
     def profile_picture_url(self):
@@ -83,18 +123,64 @@ class Profile(models.Model):
 
 
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
     if created:
         Profile.objects.create(user=instance)
+        return
+
+    # Saving a user (e.g. last_login or role updates) leaves the profile alone,
+    # unless the profile was loaded through user.profile and edited in memory;
+    # then only the edited columns are written. A user that somehow lacks a
+    # profile gets one on demand in ProfileViewSet.me.
+    if User.profile.related.is_cached(instance):
+        profile = User.profile.related.get_cached_value(instance)
+        if profile is not None:
+            changed_fields = profile.get_changed_fields()
+            if changed_fields and not profile._state.adding:
+                profile.save(update_fields=changed_fields)
+
+
+# --- Keep the authentication cache (users.cache) in step ---
+
+
+def _invalidate_cached_user(user_id):
+    # Now, so this request doesn't read its own stale entry, and again after
+    # commit: until then concurrent requests still read the old row and may
+    # cache it again.
+    user_cache.invalidate(user_id)
+    transaction.on_commit(lambda: user_cache.invalidate(user_id))
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    # Check if profile exists before trying to save
-    # This might not be strictly necessary if create_user_profile always runs first
-    # but adds robustness.
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
-    else:
-        # If profile doesn't exist for some reason (e.g., existing user before signal)
-        Profile.objects.get_or_create(user=instance)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    _invalidate_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_cached_profile_user(sender, instance, **kwargs):
+    _invalidate_cached_user(instance.user_id)
+
+
+# --- Resized profile pictures (users.images) ---
+
+
+@receiver(post_save, sender=Profile)
+def schedule_picture_variants(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .images import generate_profile_picture_variants
+
+    if instance.profile_picture:
+        # The shared default avatar is not rendered per registration;
+        # generate_image_variants can backfill it once for every profile.
+        name = instance.profile_picture.name
+        if name != Profile._meta.get_field('profile_picture').default and \
+                instance.picture_variants.get('source') != name:
+            run_in_background(generate_profile_picture_variants, instance.pk)
+    elif instance.picture_variants:
+        Profile.objects.filter(pk=instance.pk).update(picture_variants={})
+        instance.picture_variants = {}
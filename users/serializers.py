@@ -1,4 +1,8 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
 from rest_framework import serializers
+from agro_ecommerce.background import run_in_background
+from agro_ecommerce.images import delete_stored_files, variant_file_names, variant_srcset
 from .models import User, Profile  # Import the custom User model
 
 
@@ -37,6 +41,7 @@ class ProfileSerializer(serializers.ModelSerializer):
         source='user.is_farmer', read_only=True)
     is_buyer = serializers.BooleanField(source='user.is_buyer', read_only=True)
     profile_picture_url = serializers.SerializerMethodField()
+    profile_picture_variants = serializers.SerializerMethodField()
     profile_picture = serializers.ImageField(
         required=False, write_only=True, allow_null=True)
 
@@ -46,10 +51,12 @@ class ProfileSerializer(serializers.ModelSerializer):
             'id', 'user', 'phone_number', 'address',
             'is_farmer', 'is_buyer',  # Still read-only representation
             'profile_picture',
-            'profile_picture_url'
+            'profile_picture_url',
+            'profile_picture_variants',
         ]
         read_only_fields = ['id', 'user', 'is_farmer',
-                            'is_buyer', 'profile_picture_url']
+                            'is_buyer', 'profile_picture_url',
+                            'profile_picture_variants']
 
     def get_profile_picture_url(self, obj):
         # ... (same as before) ...
@@ -59,6 +66,29 @@ class ProfileSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(picture_url)
         return picture_url
 
+    def get_profile_picture_variants(self, obj):
+        # Resized WebP/JPEG copies with srcset strings; null until generated
+        if not obj.profile_picture or obj.picture_variants.get('source') != obj.profile_picture.name:
+            return None
+        request = self.context.get('request')
+
+        def build_url(name):
+            url = default_storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+        return variant_srcset(obj.picture_variants, build_url)
+
+    @staticmethod
+    def _discard_picture_files(profile):
+        """ Queue deletion of the profile's current picture and its variants """
+        picture = profile.profile_picture
+        if not picture or picture.name == Profile._meta.get_field('profile_picture').default:
+            return
+        names = [picture.name]
+        if profile.picture_variants.get('source') == picture.name:
+            names += variant_file_names(profile.picture_variants)
+        run_in_background(delete_stored_files, names)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         # Handle profile picture update
         picture_file = validated_data.pop('profile_picture', Ellipsis)
@@ -67,22 +97,13 @@ class ProfileSerializer(serializers.ModelSerializer):
         instance.address = validated_data.get('address', instance.address)
 
         if picture_file is not Ellipsis:
-            if picture_file is None:
-                # Clear picture logic...
-                if instance.profile_picture and instance.profile_picture.name != Profile._meta.get_field('profile_picture').default:
-                    instance.profile_picture.delete(save=False)
-                instance.profile_picture = None
-            else:
-                # Update picture logic...
-                if instance.profile_picture and hasattr(instance.profile_picture, 'path') and \
-                   instance.profile_picture.name != Profile._meta.get_field('profile_picture').default:
-                    try:
-                        instance.profile_picture.delete(save=False)
-                    except Exception as e:
-                        print(
-                            f"Warning: Could not delete old profile picture {instance.profile_picture.name}: {e}")
-                instance.profile_picture = picture_file
-        instance.save()  # Save profile fields first
+            # The old files go once the update commits, off the request thread
+            self._discard_picture_files(instance)
+            instance.profile_picture = picture_file
+        # Save profile fields first, writing only the columns that changed
+        changed_fields = instance.get_changed_fields()
+        if changed_fields:
+            instance.save(update_fields=changed_fields)
 
         # --- Manually Handle Role Updates from Request Data ---
         # Access the original request data from the context
@@ -1,3 +1,225 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from agro_ecommerce.testing import ImageVariantTestMixin
+from jobs.models import Job
+
+from .authentication import CachedJWTAuthentication
+from .cache import user_cache
+from .importers import bulk_create_users
+from .images import generate_profile_picture_variants, store_profile_picture_variants
+from .models import Profile, User
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='secret', is_buyer=True)
+        self.token = str(AccessToken.for_user(self.user))
+
+    def authenticate(self):
+        request = APIRequestFactory().get('/api/users/profile/me/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        user, _ = CachedJWTAuthentication().authenticate(request)
+        return user
+
+    def test_repeat_requests_are_served_from_the_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().pk, self.user.pk)
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            # The profile comes with the cached user
+            self.assertEqual(user.profile.user_id, self.user.pk)
+
+    def test_callers_get_their_own_copy(self):
+        self.authenticate().first_name = 'Changed'
+        self.assertEqual(self.authenticate().first_name, self.user.first_name)
+
+    def test_deactivated_user_is_rejected_straight_away(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_profile_save_invalidates_the_cached_user(self):
+        self.assertEqual(self.authenticate().profile.address, None)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = Profile.objects.get(user=self.user)
+            profile.address = 'Farm road'
+            profile.save()
+        self.assertEqual(self.authenticate().profile.address, 'Farm road')
+
+    def test_entry_cached_before_commit_is_dropped_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+            # A concurrent request still reads the old row and caches it
+            stale = User.objects.select_related('profile').get(pk=self.user.pk)
+            stale.is_active = True
+            user_cache.set(self.user.pk, stale)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deleted_user_is_rejected(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+class ProfileConditionalRequestTests(TestCase):
+    url = '/api/users/profile/me/'
+
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='secret', is_buyer=True)
+        # Authenticate with a real token so the cached user is what the ETag sees
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_unchanged_profile_answers_304(self):
+        etag = self.etag()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_patch_issues_a_new_validator(self):
+        etag = self.etag()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.url, {'address': 'Farm road'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['address'], 'Farm road')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_picture_variants_issue_a_new_validator(self):
+        etag = self.etag()
+        source = self.user.profile.profile_picture.name
+        with self.captureOnCommitCallbacks(execute=True):
+            stored = store_profile_picture_variants(self.user.profile.pk, {'source': source, 'sizes': {
+                'thumb': {'width': 160, 'height': 160, 'webp': 'thumb.webp', 'jpeg': 'thumb.jpeg'}}})
+        self.assertEqual(stored, 1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class BulkCreateUsersTests(TestCase):
+    def test_users_are_created_with_their_profiles(self):
+        created, skipped = bulk_create_users([
+            {'username': 'ann', 'email': 'ann@example.com', 'password': 'secret', 'is_farmer': 'true',
+             'phone_number': '555-0101', 'address': 'Farm road'},
+            {'username': 'bob', 'email': 'bob@example.com'},
+        ])
+        self.assertEqual((created, skipped), (2, []))
+        ann = User.objects.select_related('profile').get(username='ann')
+        self.assertTrue(ann.is_farmer)
+        self.assertFalse(ann.is_buyer)
+        self.assertTrue(ann.check_password('secret'))
+        self.assertEqual((ann.profile.phone_number, ann.profile.address), ('555-0101', 'Farm road'))
+        bob = User.objects.select_related('profile').get(username='bob')
+        self.assertTrue(bob.is_buyer)
+        self.assertFalse(bob.has_usable_password())
+        self.assertEqual(bob.profile.phone_number, 'N/A')
+
+    def test_duplicates_and_incomplete_rows_are_reported(self):
+        User.objects.create(username='ann', email='ann@example.com')
+        created, skipped = bulk_create_users([
+            {'username': 'ann', 'email': 'other@example.com'},
+            {'username': 'bob', 'email': 'ann@example.com'},
+            {'username': 'cat', 'email': 'cat@example.com'},
+            {'username': 'cat', 'email': 'cat2@example.com'},
+            {'username': 'dan'},
+        ], batch_size=2)
+        self.assertEqual(created, 1)
+        self.assertEqual(skipped, [
+            (1, "username 'ann' already exists"),
+            (2, "email 'ann@example.com' already exists"),
+            (4, "username 'cat' already exists"),
+            (5, "username and email are required"),
+        ])
+        self.assertEqual(Profile.objects.filter(user__username='cat').count(), 1)
+
+    def test_queries_per_batch_do_not_grow_with_rows(self):
+        def rows(prefix, count):
+            return [{'username': f'{prefix}{i}', 'email': f'{prefix}{i}@example.com'} for i in range(count)]
+        with CaptureQueriesContext(connection) as few:
+            bulk_create_users(rows('a', 2))
+        with CaptureQueriesContext(connection) as many:
+            bulk_create_users(rows('b', 50))
+        self.assertEqual(len(few), len(many))
+
+
+class ProfileSaveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='ann', email='ann@example.com')
+
+    def test_saving_a_user_leaves_an_unloaded_profile_alone(self):
+        user = User.objects.get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertFalse(any('users_profile' in query['sql'] for query in queries))
+
+    def test_saving_a_user_leaves_an_unchanged_profile_alone(self):
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertFalse(any('UPDATE "users_profile"' in query['sql'] for query in queries))
+
+    def test_only_edited_profile_columns_are_written(self):
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        user.profile.address = 'Farm road'
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "users_profile"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"address"', updates[0])
+        self.assertNotIn('"phone_number"', updates[0])
+        self.assertEqual(Profile.objects.get(user=self.user).address, 'Farm road')
+
+
+class ProfilePictureVariantTests(ImageVariantTestMixin, TestCase):
+    job_name = 'users.images.generate_profile_picture_variants'
+
+    def setUp(self):
+        super().setUp()
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create(username='buyer', email='buyer@example.com')
+        self.profile = self.user.profile
+
+    def test_default_avatar_queues_no_job(self):
+        self.assertEqual(self.profile.profile_picture.name, 'profile_pics/default/default_avatar.png')
+        self.assertFalse(Job.objects.filter(name=self.job_name).exists())
+        self.profile.phone_number = '0700000000'
+        self.profile.save()
+        self.assertFalse(Job.objects.filter(name=self.job_name).exists())
+
+    def test_upload_queues_a_job_that_stores_variants(self):
+        self.profile.profile_picture = self.upload('me.jpg')
+        self.profile.save()
+        job = Job.objects.get(name=self.job_name)
+        self.assertEqual(job.args, [self.profile.pk])
+
+        user_cache.set(self.user.pk, self.user)
+        generate_profile_picture_variants(self.profile.pk)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.picture_variants['source'], self.profile.profile_picture.name)
+        # The cached user carries the profile, so it must be reloaded
+        self.assertIsNone(user_cache.get(self.user.pk))
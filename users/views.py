@@ -5,6 +5,9 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 # Add necessary parsers
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+import hashlib
 from .models import User, Profile
 from .serializers import UserSerializer, ProfileSerializer
 import traceback  # For detailed error logging
@@ -14,7 +17,7 @@ class UserViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited (Admins primarily).
     """
-    queryset = User.objects.all().order_by('-date_joined').select_related('profile')
+    queryset = User.objects.all().order_by('-date_joined', '-id').select_related('profile')
     serializer_class = UserSerializer
     # Restrict general user access
     permission_classes = [permissions.IsAdminUser]
@@ -49,6 +52,23 @@ class RegisterView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def profile_etag(request, *args, **kwargs):
+    """
+    ETag for GET /profile/me/, built from data already loaded with the
+    authenticated user: the profile's updated_at plus the user fields shown.
+    """
+    if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+        return None
+    try:
+        profile = request.user.profile
+    except Profile.DoesNotExist:
+        return None
+    user = request.user
+    raw = (f"{profile.pk}:{profile.updated_at.isoformat()}:{user.username}:{user.email}:"
+           f"{user.first_name}:{user.last_name}:{user.is_farmer}:{user.is_buyer}")
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
 # Use GenericViewSet as we only define custom actions
 class ProfileViewSet(viewsets.GenericViewSet):
     """
@@ -64,6 +84,7 @@ class ProfileViewSet(viewsets.GenericViewSet):
     # queryset = Profile.objects.all() # Keep if needed for other actions
 
     @action(detail=False, methods=['get', 'put', 'patch'], url_path='me')
+    @method_decorator(condition(etag_func=profile_etag))
     def me(self, request, *args, **kwargs):
         """
         Retrieve or update the profile for the currently authenticated user.
@@ -71,11 +92,16 @@ class ProfileViewSet(viewsets.GenericViewSet):
         """
         try:
             # Use related name 'profile' from User model or get_or_create
-            # Using get_or_create is safer as it handles users who might lack a profile
-            profile, created = Profile.objects.get_or_create(user=request.user)
-            if created:
-                print(
-                    f"Profile created on demand for user {request.user.username} (ID: {request.user.id})")
+            # The authentication cache loads the profile along with the user,
+            # so this usually costs no query
+            try:
+                profile = request.user.profile
+            except Profile.DoesNotExist:
+                # Handles users who might lack a profile
+                profile, created = Profile.objects.get_or_create(user=request.user)
+                if created:
+                    print(
+                        f"Profile created on demand for user {request.user.username} (ID: {request.user.id})")
 
         except Profile.DoesNotExist:  # Should not happen with get_or_create, but good practice
             print(